@@ -0,0 +1,167 @@
+import datetime
+import hashlib
+import os
+import sqlite3
+import threading
+import uuid
+from typing import List, Optional
+
+from loguru import logger
+
+
+# what place() does with a target whose content is already archived
+LINK = "link"          # hardlink to the archived copy; a plain copy if the share can not link
+POINTER = "pointer"    # no copy at all, a <target>.ref text file holding the archived copy's path
+MODES = (LINK, POINTER)
+
+POINTER_SUFFIX = ".ref"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    digest TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    stored_at TEXT NOT NULL,
+    PRIMARY KEY (digest, path)
+);
+CREATE INDEX IF NOT EXISTS blobs_size ON blobs (size);
+"""
+
+
+def new_hasher():
+    return hashlib.sha256()
+
+
+def file_digest(path: str, buffer_size: int = 1024 * 1024) -> str:
+    hasher = new_hasher()
+    with open(path, "rb") as file:
+        while True:
+            chunk = file.read(buffer_size)
+            if not chunk:
+                break
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class ArchiveStore:
+    """Local SQLite index of archived files by content (SHA-256 and size).
+
+    Archive destinations get the same bytes over and over: re-dropped files,
+    or one file archived under several dated folders. The index remembers
+    where each content was archived, so the next copy of it can become a
+    hardlink or a pointer instead of a full write. Sizes are indexed on their
+    own so a file whose size was never archived is not hashed up front.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+
+    def has_size(self, size: int) -> bool:
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM blobs WHERE size=? LIMIT 1", (size,)).fetchone() is not None
+
+    def paths(self, digest: str, size: int) -> List[str]:
+        with self._lock:
+            rows = self._db.execute("SELECT path FROM blobs WHERE digest=? AND size=? ORDER BY stored_at",
+                                    (digest, size)).fetchall()
+        return [row[0] for row in rows]
+
+    def add(self, digest: str, size: int, path: str):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO blobs (digest, size, path, stored_at) VALUES (?, ?, ?, ?)",
+                             (digest, size, path, datetime.datetime.now().isoformat(timespec="seconds")))
+
+    def remove(self, digest: str, path: str):
+        with self._lock:
+            self._db.execute("DELETE FROM blobs WHERE digest=? AND path=?", (digest, path))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+_store: Optional[ArchiveStore] = None
+_settings = {"mode": LINK}
+
+
+def configure(path: Optional[str] = None, mode: str = LINK):
+    """Open the archive index at path; without a path archive copies are never deduplicated."""
+    global _store
+    if mode not in MODES:
+        raise ValueError(f"archive_store mode must be one of {MODES}, not {mode!r}")
+    if _store is not None:
+        _store.close()
+    _store = ArchiveStore(path) if path else None
+    _settings["mode"] = mode
+    if _store is not None:
+        logger.debug(f"Archive store at {path} ({mode})")
+
+
+def enabled() -> bool:
+    return _store is not None
+
+
+def has_size(size: int) -> bool:
+    return _store is not None and _store.has_size(size)
+
+
+def find(digest: str, size: int) -> Optional[str]:
+    """An archived file with this content that is still in place, if any."""
+    if _store is None:
+        return None
+    for path in _store.paths(digest, size):
+        try:
+            if os.stat(path).st_size == size:
+                return path
+        except OSError:
+            pass
+        # deleted or replaced since it was archived
+        _store.remove(digest, path)
+    return None
+
+
+def register(digest: str, size: int, path: str):
+    if _store is not None:
+        _store.add(digest, size, path)
+
+
+def _link(existing: str, target: str) -> bool:
+    if os.path.exists(target) and os.path.samefile(existing, target):
+        return True
+    # link under a temporary name, then replace, so a target that is already there is overwritten like a copy would be
+    tmp = f"{target}.{uuid.uuid4().hex}.tmp"
+    try:
+        os.link(existing, tmp)
+    except (OSError, NotImplementedError):
+        # another volume, or a share that does not support hardlinks
+        return False
+    try:
+        os.replace(tmp, target)
+    except OSError:
+        os.remove(tmp)
+        return False
+    return True
+
+
+def place(existing: str, target: str) -> Optional[str]:
+    """Put the content of existing at target without copying it.
+
+    Returns what was written (target, or the pointer file next to it), or
+    None when the target still has to be copied.
+    """
+    if os.path.abspath(existing) == os.path.abspath(target):
+        return target
+    if _settings["mode"] == LINK:
+        return target if _link(existing, target) else None
+    pointer = target + POINTER_SUFFIX
+    with open(pointer, "w") as file:
+        file.write(existing + "\n")
+    return pointer
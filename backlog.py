@@ -0,0 +1,182 @@
+import datetime
+import heapq
+import json
+import os
+from typing import Dict, List, Optional, Tuple
+
+from loguru import logger
+
+import leases
+import metrics
+from config import Rules
+from file_index import FileIndex, PatternMatcher, iter_files
+from functions import distribute
+from pipeline import Budget
+from planner import file_date, plan as plan_transfers
+
+
+# what to do with files dated today while a backlog is drained
+TODAY_FIRST = "first"
+TODAY_LAST = "last"
+IN_ORDER = "in_order"
+POLICIES = (TODAY_FIRST, TODAY_LAST, IN_ORDER)
+
+DEFAULT_CHUNK_FILES = 200
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+DEFAULT_MAX_WORKBOOKS = 2
+
+# run metrics stage for the time chunks waited on the memory budget
+BACKLOG_WAIT = "backlog_wait"
+
+_settings = {
+    "chunk_files": DEFAULT_CHUNK_FILES,
+    "max_bytes": DEFAULT_MAX_BYTES,
+    "max_workbooks": DEFAULT_MAX_WORKBOOKS,
+    "today": TODAY_LAST,
+    "checkpoint_path": None,
+}
+
+
+def configure(chunk_files: int = None, max_bytes: int = None, max_workbooks: int = None, today: str = None,
+              checkpoint_path: Optional[str] = None):
+    """Set the catch-up chunk size, memory budget, today policy and checkpoint file."""
+    if chunk_files is not None:
+        _settings["chunk_files"] = max(1, chunk_files)
+    if max_bytes is not None:
+        _settings["max_bytes"] = max(1, max_bytes)
+    if max_workbooks is not None:
+        _settings["max_workbooks"] = max(1, max_workbooks)
+    if today is not None:
+        if today not in POLICIES:
+            raise ValueError(f"catch_up.today must be one of {', '.join(POLICIES)}, not {today!r}")
+        _settings["today"] = today
+    if checkpoint_path is not None:
+        _settings["checkpoint_path"] = checkpoint_path
+
+
+def _read_checkpoint(path: Optional[str], source_dir: str) -> Dict[str, int]:
+    """name -> size of the files an unfinished catch-up of source_dir already attempted."""
+    if not path:
+        return {}
+    try:
+        with open(path) as file:
+            checkpoint = json.load(file)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable catch-up checkpoint {path}: {e}")
+        return {}
+    if checkpoint.get("source_dir") != source_dir or checkpoint.get("finished"):
+        return {}
+    return checkpoint.get("attempted", {})
+
+
+def _write_checkpoint(path: Optional[str], checkpoint: dict):
+    if not path:
+        return
+    folder = os.path.dirname(path)
+    try:
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(checkpoint, file, indent=2)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning(f"Failed to write catch-up checkpoint {path}: {e}")
+
+
+class Backlog:
+    """The files waiting in the inputs folder, oldest date first, handed out in chunks.
+
+    Only (priority, date, name, size) is kept per file; the listing is
+    streamed, nothing else about a file is loaded until its chunk runs.
+    Files without a date in their name count as today's. Files an
+    interrupted catch-up already attempted (same name and size) go last, so a
+    file that keeps failing does not hold up the rest again.
+    """
+
+    def __init__(self, today: str = TODAY_LAST, attempted: Optional[Dict[str, int]] = None,
+                 now: Optional[datetime.datetime] = None):
+        self.today = today
+        self.attempted = attempted or {}
+        self._today = (now or datetime.datetime.now()).date()
+        self._heap: List[Tuple[int, datetime.date, str, int]] = []
+
+    def _priority(self, name: str, size: int, date: datetime.date) -> int:
+        if self.attempted.get(name) == size:
+            return 3
+        if self.today == IN_ORDER or date < self._today:
+            return 1
+        return 0 if self.today == TODAY_FIRST else 2
+
+    def add(self, name: str, size: int, date: Optional[datetime.datetime]):
+        day = date.date() if date is not None else self._today
+        heapq.heappush(self._heap, (self._priority(name, size, day), day, name, size))
+
+    def take(self, count: int) -> List[Tuple[str, int]]:
+        """The next count (name, size) pairs in priority and date order."""
+        taken = []
+        while self._heap and len(taken) < count:
+            _, _, name, size = heapq.heappop(self._heap)
+            taken.append((name, size))
+        return taken
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+
+def scan(source_dir: str, matcher: PatternMatcher, rules: Rules, backlog: Backlog) -> int:
+    """Stream source_dir into backlog; files that match no use case are skipped. Returns the files added."""
+    added = 0
+    for name, size in iter_files(source_dir):
+        routes = matcher.match(name)
+        if routes:
+            backlog.add(name, size, file_date(name, routes, rules))
+            added += 1
+    return added
+
+
+def catch_up(source_dir: str, rules: Rules, matcher: PatternMatcher,
+             deferred: Optional[Dict[str, dict]] = None) -> bool:
+    """Drain a backlog in source_dir chunk by chunk, oldest files first, within the memory budget.
+
+    Every chunk of catch_up.chunk_files files goes through the same pipeline
+    as a regular run. At most catch_up.max_bytes of file data and
+    catch_up.max_workbooks Outbound workbooks are in flight at once. After
+    every chunk the progress is saved to catch_up.checkpoint_path. Returns
+    False when there was nothing to do.
+    """
+    checkpoint_path = _settings["checkpoint_path"]
+    attempted = _read_checkpoint(checkpoint_path, source_dir)
+    if attempted:
+        logger.info(f"Resuming catch-up of {source_dir}; {len(attempted)} files attempted before go last")
+    backlog = Backlog(_settings["today"], attempted)
+    total = scan(source_dir, matcher, rules, backlog)
+    if total == 0:
+        return False
+    logger.info(f"Catching up on {total} files in {source_dir}, {_settings['chunk_files']} at a time")
+
+    budget = Budget(_settings["max_bytes"], _settings["max_workbooks"])
+    checkpoint = {"source_dir": source_dir, "started_at": datetime.datetime.now().isoformat(timespec="seconds"),
+                  "chunks": 0, "files_done": 0, "bytes_done": 0, "attempted": attempted, "finished": False}
+    while len(backlog):
+        chunk = backlog.take(_settings["chunk_files"])
+        sizes = dict(chunk)
+        with leases.claimed(FileIndex(source_dir, sizes, matcher, sizes), matcher) as index:
+            distribute(index, rules, source_dir, deferred, plan_transfers(index, rules, source_dir, deferred), budget)
+
+        checkpoint["chunks"] += 1
+        checkpoint["files_done"] += len(chunk)
+        checkpoint["bytes_done"] += sum(sizes.values())
+        checkpoint["attempted"].update(sizes)
+        checkpoint["remaining"] = len(backlog)
+        checkpoint["finished"] = not len(backlog)
+        checkpoint["updated_at"] = datetime.datetime.now().isoformat(timespec="seconds")
+        _write_checkpoint(checkpoint_path, checkpoint)
+        logger.info(f"Catch-up chunk {checkpoint['chunks']}: {checkpoint['files_done']} of {total} files done, "
+                    f"{len(backlog)} left")
+
+    metrics.add_time(BACKLOG_WAIT, None, budget.waited_seconds)
+    logger.info(f"Caught up on {total} files; at most {budget.peak_bytes} bytes were in flight at once")
+    return True
@@ -0,0 +1,72 @@
+"""Compare the Excel read/write engines on a synthetic combined Outbound workbook.
+
+Run from the repository root:
+
+    python benchmarks/bench_excel.py --rows 100000
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from excel_io import READ_ENGINES, WRITE_ENGINES, engine_available, read_workbook, write_workbook  # noqa: E402
+
+
+def synthetic_outbound(rows: int, seed: int = 0, mapping: str = "outbound_shs.json") -> pd.DataFrame:
+    """A combined Outbound sheet with BotNames taken from a json_data mapping."""
+    with open(os.path.join("json_data", mapping)) as file:
+        bot_names = [use_case["BotName"] for use_case in json.load(file).values()]
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "BotName": rng.choice(bot_names + ["Unmapped Bot"], size=rows),
+        "InvoiceNumber": rng.integers(10_000_000, 99_999_999, size=rows),
+        "MRN": [f"MRN{n:09d}" for n in rng.integers(0, 10**9, size=rows)],
+        "ServiceDate": pd.Timestamp("2025-01-01") + pd.to_timedelta(rng.integers(0, 365, size=rows), unit="D"),
+        "Balance": rng.random(rows).round(2) * 1000,
+        "Status": rng.choice(["Complete", "Exception", "Pending"], size=rows),
+    })
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    args = parser.parse_args(argv)
+
+    df = synthetic_outbound(args.rows)
+    print(f"{args.rows} rows x {df.shape[1]} columns")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "Outbound_01152025.xlsx")
+        for engine in WRITE_ENGINES:
+            if not engine_available(engine):
+                print(f"write {engine:<11} not installed")
+                continue
+            path = os.path.join(tmp, f"write_{engine}.xlsx")
+            _, seconds = timed(write_workbook, df, path, engine=engine)
+            print(f"write {engine:<11} {seconds:8.2f}s  {os.path.getsize(path) / 1e6:6.1f} MB")
+            if not os.path.exists(source):
+                os.replace(path, source)
+
+        for engine in READ_ENGINES:
+            if not engine_available(engine):
+                print(f"read  {engine:<11} not installed")
+                continue
+            result, seconds = timed(read_workbook, source, engine=engine)
+            print(f"read  {engine:<11} {seconds:8.2f}s  {len(result)} rows")
+
+
+if __name__ == "__main__":
+    main()
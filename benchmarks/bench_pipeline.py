@@ -0,0 +1,258 @@
+"""Time every pipeline stage on a generated inputs folder behind a simulated slow share.
+
+Run from the repository root:
+
+    python benchmarks/bench_pipeline.py --inputs 2000 --days 3 --zip-mb 64 --rows 100000 --latency 0.005
+    python benchmarks/bench_pipeline.py --save-baseline     # record the current numbers
+    python benchmarks/bench_pipeline.py                     # compare against the recorded numbers
+    python benchmarks/bench_pipeline.py --pipeline          # all stages overlapped, as main.py runs them
+
+File names are generated from the patterns in json_data/*.json, and every
+destination is relocated under the same temporary share, so the real
+functions run unchanged. Exits with status 1 when a stage is slower than the
+baseline by more than --tolerance.
+"""
+import argparse
+import datetime
+import fnmatch
+import itertools
+import json
+import os
+import sys
+import tempfile
+import time
+import zipfile
+
+from loguru import logger
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import functions  # noqa: E402
+import dir_cache  # noqa: E402
+import config  # noqa: E402
+import transfers  # noqa: E402
+import excel_io  # noqa: E402
+from file_index import FileIndex, PatternMatcher, build_rules, INPUTS, OUTPUTS, OUTBOUND, EPIC_OUTBOUND  # noqa: E402
+from main import load_configs  # noqa: E402
+from bench_excel import synthetic_outbound  # noqa: E402
+from simulated_share import SimulatedShare  # noqa: E402
+
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines", "pipeline.json")
+CHUNK = 1024 * 1024
+
+
+def relocate(destination, share_root: str):
+    """Map a UNC destination ("\\\\HOST\\SHARE\\a\\") to the same path under share_root."""
+    if isinstance(destination, list):
+        return [relocate(d, share_root) for d in destination]
+    parts = destination.lstrip("\\").split("\\")
+    # a trailing "" keeps the trailing separator, the outputs stage appends the date folder to it
+    return os.path.join(share_root, *parts)
+
+
+def relocate_configs(configs: dict, share_root: str) -> dict:
+    # the compiled rules carry the original destinations, they are rebuilt from the relocated JSON
+    configs = json.loads(json.dumps({key: value for key, value in configs.items() if key != "rules"}))
+    for use_case_data in configs["inputs"].values():
+        use_case_data["inputs"]["destination"] = relocate(use_case_data["inputs"]["destination"], share_root)
+    for key in ("outputs", "shs", "epic_shs"):
+        for use_case_data in configs[key].values():
+            use_case_data["destination"] = relocate(use_case_data["destination"], share_root)
+    configs["rules"] = config.compile_rules(configs)
+    return configs
+
+
+def name_from_pattern(pattern: str, fill: str, star: str) -> str:
+    """Replace the ?s in a glob with the digits of fill and the first * with star."""
+    digits = iter(c for c in fill if c.isdigit())
+    name = []
+    for c in pattern:
+        if c == "?":
+            name.append(next(digits, "0"))
+        elif c == "*":
+            name.append(star)
+            star = ""
+        else:
+            name.append(c)
+    return "".join(name)
+
+
+def generate_inputs(configs: dict, inputs_dir: str, count: int, date: datetime.date) -> int:
+    use_cases = list(configs["inputs"].items())
+    made = 0
+    for n, (use_case, use_case_data) in zip(range(count), itertools.cycle(use_cases)):
+        inputs = use_case_data["inputs"]
+        date_text = date.strftime(inputs.get("date_formatting_dt", "%m%d%Y"))
+        pattern = inputs["name"]
+        if "?" in pattern:
+            name = name_from_pattern(pattern, f"{n:012d}"[-pattern.count('?'):], f"B{n}")
+        else:
+            name = name_from_pattern(pattern, "", f"{date_text}_{n:05d}")
+        if not fnmatch.fnmatchcase(name, pattern):
+            logger.warning(f"Could not build a file name for {use_case} from {pattern}")
+            continue
+        with open(os.path.join(inputs_dir, name), "wb") as file:
+            file.write(os.urandom(4096))
+        made += 1
+    return made
+
+
+def _write_zip(path: str, members: int, size: int):
+    member_size = max(size // members, 1)
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_STORED) as zf:
+        for i in range(members):
+            with zf.open(f"batch_{i // 10:03d}/record_{i:05d}.pdf", "w") as member:
+                remaining = member_size
+                while remaining > 0:
+                    member.write(os.urandom(min(CHUNK, remaining)))
+                    remaining -= CHUNK
+
+
+def generate_outputs(configs: dict, inputs_dir: str, days: int, members: int, zip_mb: float,
+                     start: datetime.date) -> int:
+    made = 0
+    for day in range(days):
+        date = start + datetime.timedelta(days=day)
+        for use_case, use_case_data in configs["outputs"].items():
+            date_text = date.strftime(use_case_data["date_formatting_dt"])
+            pattern = use_case_data["zip_name"]
+            name = name_from_pattern(pattern, date_text, "" if "?" in pattern else date_text)
+            if not fnmatch.fnmatchcase(name, pattern):
+                logger.warning(f"Could not build a zip name for {use_case} from {pattern}")
+                continue
+            _write_zip(os.path.join(inputs_dir, name), members, int(zip_mb * CHUNK))
+            made += 1
+    return made
+
+
+def generate_outbound(inputs_dir: str, rows: int, date: datetime.date):
+    date_text = date.strftime("%m%d%Y")
+    synthetic_outbound(rows).to_excel(os.path.join(inputs_dir, f"Outbound_{date_text}.xlsx"), index=False)
+    synthetic_outbound(max(rows // 10, 1), mapping="epic_outbound_shs.json").to_excel(
+        os.path.join(inputs_dir, f"EPIC_Outbound_{date_text}.xlsx"), index=False)
+
+
+def _stage_files(index: FileIndex, stage: str, data: dict) -> list:
+    if stage in (INPUTS, OUTPUTS):
+        return [f for use_case in data for f in index.files(stage, use_case)]
+    return index.files(stage)
+
+
+def run_stages(configs: dict, inputs_dir: str, share: SimulatedShare, pipelined: bool = False) -> dict:
+    """Time the scan and each stage function in turn, or (pipelined) the whole overlapped pipeline."""
+    matcher = PatternMatcher(build_rules(configs["inputs"], configs["outputs"], configs["shs"], configs["epic_shs"]))
+    stages = [
+        ("move_inputs", INPUTS, configs["rules"].inputs, functions.move_inputs),
+        ("parse_output_files", OUTBOUND, configs["rules"].shs, functions.parse_output_files),
+        ("parse_epic_output_files", EPIC_OUTBOUND, configs["rules"].epic_shs, functions.parse_epic_output_files),
+        ("move_outputs", OUTPUTS, configs["rules"].outputs, functions.move_outputs),
+    ]
+    results = {}
+    dir_cache.reset()
+    with share:
+        ops = share.total_ops
+        start = time.perf_counter()
+        index = FileIndex.scan(inputs_dir, matcher)
+        results["scan"] = {"seconds": time.perf_counter() - start, "files": len(index), "bytes": 0,
+                           "ops": share.total_ops - ops}
+        if pipelined:
+            files = index.file_names
+            size = sum(os.path.getsize(os.path.join(inputs_dir, f)) for f in files)
+            ops = share.total_ops
+            start = time.perf_counter()
+            functions.distribute(index, configs["rules"], inputs_dir)
+            results["pipeline"] = {"seconds": time.perf_counter() - start, "files": len(files), "bytes": size,
+                                   "ops": share.total_ops - ops}
+            stages = []
+        for name, stage, data, fn in stages:
+            files = _stage_files(index, stage, data)
+            size = sum(os.path.getsize(f) for f in files)
+            ops = share.total_ops
+            start = time.perf_counter()
+            fn(data, inputs_dir, index)
+            results[name] = {"seconds": time.perf_counter() - start, "files": len(files), "bytes": size,
+                             "ops": share.total_ops - ops}
+    for result in results.values():
+        seconds = max(result["seconds"], 1e-9)
+        result["files_per_sec"] = result["files"] / seconds
+        result["mb_per_sec"] = result["bytes"] / CHUNK / seconds
+    return results
+
+
+def report(results: dict, baseline: dict = None, tolerance: float = 0.2) -> bool:
+    """Print the results table; returns False if any stage regressed past tolerance."""
+    ok = True
+    print(f"{'stage':<25} {'seconds':>9} {'files':>7} {'files/s':>9} {'MB/s':>8} {'fs ops':>8}  baseline")
+    for name, result in results.items():
+        line = (f"{name:<25} {result['seconds']:9.2f} {result['files']:7d} {result['files_per_sec']:9.1f}"
+                f" {result['mb_per_sec']:8.1f} {result['ops']:8d}")
+        previous = (baseline or {}).get(name)
+        if previous:
+            change = result["seconds"] / max(previous["seconds"], 1e-9) - 1
+            regressed = change > tolerance and result["seconds"] - previous["seconds"] > 0.05
+            ok = ok and not regressed
+            line += f"  {previous['seconds']:.2f}s ({change:+.0%}){'  REGRESSION' if regressed else ''}"
+        print(line)
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--inputs", type=int, default=2000, help="number of input files to generate")
+    parser.add_argument("--days", type=int, default=1, help="output zips generated per use case")
+    parser.add_argument("--zip-mb", type=float, default=8, help="size of each output zip")
+    parser.add_argument("--zip-members", type=int, default=50, help="files inside each output zip")
+    parser.add_argument("--rows", type=int, default=100_000, help="rows in the combined Outbound workbook")
+    parser.add_argument("--latency", type=float, default=0.005, help="seconds added to every share operation")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown per stage before failing")
+    parser.add_argument("--per-host", type=int, default=transfers.DEFAULT_PER_HOST,
+                        help="concurrent operations per host; every simulated path is on the one local host")
+    parser.add_argument("--excel-processes", type=int, default=1,
+                        help="worker processes for reading and writing workbooks, 0 to use threads of this process")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="run every stage at once through functions.distribute instead of one after another")
+    parser.add_argument("--log-level", default="ERROR")
+    args = parser.parse_args(argv)
+
+    logger.remove()
+    logger.add(sys.stderr, level=args.log_level)
+
+    transfers.configure(per_host=args.per_host)
+    excel_io.configure(processes=args.excel_processes)
+    date = datetime.date(2025, 1, 15)
+    with tempfile.TemporaryDirectory() as tmp:
+        share_root = os.path.join(tmp, "share")
+        inputs_dir = os.path.join(share_root, "inputs")
+        os.makedirs(inputs_dir)
+        configs = relocate_configs(load_configs(), share_root)
+        functions.COMBINED_OUTPUTS_DIR = os.path.join(share_root, "Combined Outputs")
+        os.makedirs(functions.COMBINED_OUTPUTS_DIR)
+
+        start = time.perf_counter()
+        inputs = generate_inputs(configs, inputs_dir, args.inputs, date)
+        zips = generate_outputs(configs, inputs_dir, args.days, args.zip_members, args.zip_mb, date)
+        generate_outbound(inputs_dir, args.rows, date)
+        print(f"generated {inputs} inputs, {zips} zips and 2 outbound workbooks in {time.perf_counter() - start:.1f}s"
+              f" (latency {args.latency * 1000:.1f} ms per operation)")
+
+        results = run_stages(configs, inputs_dir, SimulatedShare(share_root, args.latency), args.pipeline)
+
+    baseline = None
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+    ok = report(results, baseline, args.tolerance)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as file:
+            json.dump(results, file, indent=4)
+        print(f"baseline saved to {args.baseline}")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
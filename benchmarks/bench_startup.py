@@ -0,0 +1,75 @@
+"""Time a run that has nothing to do, in a fresh interpreter, against a budget.
+
+Run from the repository root:
+
+    python benchmarks/bench_startup.py --repeat 5 --budget 1.0
+
+Each repetition starts a new Python process that imports main, loads the
+configs (from the compiled cache after the first time) and runs the pipeline
+once on an empty inputs folder. The median time of each phase is reported;
+the exit status is 1 when the total is over --budget seconds or when pandas
+was imported along the way.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# heavy modules a no-op run must not import
+HEAVY_MODULES = ("pandas", "numpy", "openpyxl")
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import main
+from file_index import PatternMatcher, build_rules
+imported = time.perf_counter()
+configs = main.load_configs()
+matcher = PatternMatcher(build_rules(configs["inputs"], configs["outputs"], configs["shs"], configs["epic_shs"]))
+loaded = time.perf_counter()
+did_work = main.run(sys.argv[1], configs, matcher)
+ran = time.perf_counter()
+print(json.dumps({
+    "import": imported - start,
+    "load_configs": loaded - imported,
+    "run": ran - loaded,
+    "total": ran - start,
+    "did_work": did_work,
+    "heavy_modules": [name for name in %r if name in sys.modules],
+}))
+""" % (HEAVY_MODULES,)
+
+
+def measure(inputs_dir: str) -> dict:
+    result = subprocess.run([sys.executable, "-c", _PROBE, inputs_dir], cwd=REPO, capture_output=True, text=True,
+                            check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=1.0, help="seconds allowed for a no-op run")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as inputs_dir:
+        runs = [measure(inputs_dir) for _ in range(args.repeat)]
+
+    for phase in ("import", "load_configs", "run", "total"):
+        print(f"{phase:<14} {statistics.median(r[phase] for r in runs):8.3f}s")
+    heavy = sorted({name for r in runs for name in r["heavy_modules"]})
+    total = statistics.median(r["total"] for r in runs)
+    if heavy:
+        print(f"imported on a no-op run: {', '.join(heavy)}")
+    ok = total <= args.budget and not heavy
+    print(f"budget {args.budget:.3f}s: {'ok' if ok else 'EXCEEDED'}")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,75 @@
+"""A local folder that behaves like a slow SMB share.
+
+Inside a `with SimulatedShare(root, latency=...)` block every filesystem call
+on a path under `root` sleeps for `latency` seconds first, the way each stat,
+open, mkdir or rename on the NAS costs one network round trip. Calls on other
+paths are untouched, so the benchmark's own temp files stay fast.
+"""
+import builtins
+import os
+import threading
+import time
+from collections import Counter
+
+
+# (module, attribute) pairs that turn into a round trip on a network share;
+# the os.path helpers and shutil are built on these and are counted through them
+_PATCHED = [
+    (os, "stat"),
+    (os, "lstat"),
+    (os, "scandir"),
+    (os, "listdir"),
+    (os, "mkdir"),
+    (os, "rename"),
+    (os, "replace"),
+    (os, "remove"),
+    (os, "unlink"),
+    (os, "rmdir"),
+    (builtins, "open"),
+]
+
+
+class SimulatedShare:
+    def __init__(self, root: str, latency: float = 0.005):
+        self.root = os.path.abspath(root)
+        self.latency = latency
+        self.ops = Counter()
+        self._lock = threading.Lock()
+        self._originals = []
+
+    def _on_share(self, path) -> bool:
+        if isinstance(path, int):
+            return False
+        try:
+            path = os.fsdecode(os.fspath(path))
+        except TypeError:
+            return False
+        return os.path.abspath(path).startswith(self.root)
+
+    def _wrap(self, name: str, fn):
+        def delayed(path, *args, **kwargs):
+            if self._on_share(path):
+                with self._lock:
+                    self.ops[name] += 1
+                if self.latency:
+                    time.sleep(self.latency)
+            return fn(path, *args, **kwargs)
+
+        return delayed
+
+    @property
+    def total_ops(self) -> int:
+        return sum(self.ops.values())
+
+    def __enter__(self):
+        for module, name in _PATCHED:
+            original = getattr(module, name)
+            self._originals.append((module, name, original))
+            setattr(module, name, self._wrap(name, original))
+        return self
+
+    def __exit__(self, *exc):
+        for module, name, original in reversed(self._originals):
+            setattr(module, name, original)
+        self._originals = []
+        return False
@@ -0,0 +1,328 @@
+import json
+import os
+import pickle
+import re
+from typing import Dict, List, Optional, Tuple, Union
+
+from loguru import logger
+
+import date_tokens
+from date_tokens import DateFormat, date_format, template
+from file_index import PatternMatcher, build_rules
+
+
+CONFIG_DIR = "./json_data"
+# config key -> file in CONFIG_DIR
+FILES = {
+    "inputs": "inputs.json",
+    "outputs": "outputs.json",
+    "shs": "outbound_shs.json",
+    "epic_shs": "epic_outbound_shs.json",
+}
+# bump when the rule classes change, so an old cache is never unpickled into new code
+CACHE_VERSION = 3
+
+Destination = Union[str, List[str]]
+
+# a filename date format is made of these tokens and separators only ("MM_DD_YYYY", "YYYYMMDD", "MM DD YYYY")
+_DATE_FORMAT = re.compile(r"(?:YYYY|YY|MM|DD|[ _-])+")
+
+
+class ConfigError(ValueError):
+    """One or more use cases in the JSON configs are invalid."""
+
+
+def _destination(value, where: str, problems: List[str]) -> Destination:
+    destinations = value if isinstance(value, list) else [value]
+    if not destinations or not all(isinstance(d, str) and d for d in destinations):
+        problems.append(f"{where}: destination must be a path or a non-empty list of paths")
+    return value
+
+
+def _check_keys(data, required: Tuple[str, ...], optional: Tuple[str, ...], where: str, problems: List[str]) -> bool:
+    if not isinstance(data, dict):
+        problems.append(f"{where}: expected an object, got {type(data).__name__}")
+        return False
+    for key in required:
+        if key not in data:
+            problems.append(f"{where}: missing '{key}'")
+    for key in data:
+        if key not in required and key not in optional:
+            problems.append(f"{where}: unknown key '{key}'")
+    return all(key in data for key in required)
+
+
+def _check_date_format(date_formatting: str, date_formatting_dt: str, where: str, problems: List[str]):
+    if not isinstance(date_formatting, str) or not isinstance(date_formatting_dt, str):
+        problems.append(f"{where}: date formats must be strings")
+    elif not _DATE_FORMAT.fullmatch(date_formatting) or date_format(date_formatting, date_formatting_dt).regex is None:
+        problems.append(f"{where}: unsupported date format '{date_formatting}'")
+    elif "%" not in date_formatting_dt:
+        problems.append(f"{where}: '{date_formatting_dt}' is not a strftime format")
+
+
+class InputRule:
+    """An inputs.json use case: files named like `name` are moved to `destination`."""
+
+    __slots__ = ("use_case", "name", "destination", "date_formatting", "date_formatting_dt", "destination_transforms")
+
+    def __init__(self, use_case: str, name: str, destination: Destination, date_formatting: Optional[str] = None,
+                 date_formatting_dt: Optional[str] = None, destination_transforms: Optional[List[dict]] = None):
+        self.use_case = use_case
+        self.name = name
+        self.destination = destination
+        self.date_formatting = date_formatting
+        self.date_formatting_dt = date_formatting_dt
+        self.destination_transforms = destination_transforms
+
+    @property
+    def date_format(self) -> Optional[DateFormat]:
+        if not self.date_formatting:
+            return None
+        return date_format(self.date_formatting, self.date_formatting_dt)
+
+    @classmethod
+    def parse(cls, use_case: str, data: dict, problems: List[str]) -> Optional["InputRule"]:
+        where = f"inputs.json {use_case}"
+        if not _check_keys(data, ("inputs",), (), where, problems):
+            return None
+        data = data["inputs"]
+        if not _check_keys(data, ("name", "destination"),
+                           ("date_formatting", "date_formatting_dt", "destination_transforms"), where, problems):
+            return None
+        destination = _destination(data["destination"], where, problems)
+        if bool(data.get("date_formatting")) != bool(data.get("date_formatting_dt")):
+            problems.append(f"{where}: date_formatting and date_formatting_dt go together")
+        elif data.get("date_formatting"):
+            _check_date_format(data["date_formatting"], data["date_formatting_dt"], where, problems)
+        transforms = data.get("destination_transforms")
+        if transforms is not None:
+            count = len(destination) if isinstance(destination, list) else 1
+            if not isinstance(transforms, list) or len(transforms) > count:
+                problems.append(f"{where}: destination_transforms needs at most one entry per destination")
+            else:
+                for i, transform in enumerate(transforms):
+                    if transform is None:
+                        continue
+                    if _check_keys(transform, (), ("date_offset_days", "date_format", "date_format_dt"),
+                                   f"{where} destination_transforms[{i}]", problems):
+                        _check_date_format(transform.get("date_format", "YYYYMMDD"),
+                                           transform.get("date_format_dt", "%Y%m%d"),
+                                           f"{where} destination_transforms[{i}]", problems)
+        return cls(use_case, data["name"], destination, data.get("date_formatting"), data.get("date_formatting_dt"),
+                   transforms)
+
+    @classmethod
+    def of(cls, use_case: str, data: Union["InputRule", dict]) -> "InputRule":
+        """The rule itself, or the rule for a raw inputs.json entry (its "inputs" object or the whole entry)."""
+        if isinstance(data, cls):
+            return data
+        return _parse_one(cls, use_case, data if "inputs" in data else {"inputs": data})
+
+
+class MergedArchive:
+    """An archive of one date (`path` is a date template) whose members matching `members` are extracted."""
+
+    __slots__ = ("path", "members")
+
+    def __init__(self, path: str, members: str):
+        self.path = path
+        self.members = members
+
+    def path_for(self, date) -> str:
+        return template(self.path).render(date)
+
+    @classmethod
+    def parse(cls, data: dict, where: str, problems: List[str]) -> Optional["MergedArchive"]:
+        if not _check_keys(data, ("path", "members"), (), where, problems):
+            return None
+        if not isinstance(data["path"], str) or not template(data["path"]).has_tokens:
+            problems.append(f"{where}: path must be a path with a date in it (YYYY, YY, MM, DD)")
+        if not isinstance(data["members"], str) or not data["members"]:
+            problems.append(f"{where}: members must be a file name pattern")
+        return cls(data["path"], data["members"])
+
+
+class OutputRule:
+    """An outputs.json use case: zips named like `zip_name` are extracted into a dated `destination` folder.
+
+    With `merged_archive`, the members matching its `members` pattern are also
+    extracted from the archive at its dated `path` (Lab Appeals).
+    """
+
+    __slots__ = ("use_case", "zip_name", "date_formatting", "date_formatting_dt", "destination", "merged_archive")
+
+    def __init__(self, use_case: str, zip_name: str, date_formatting: str, date_formatting_dt: str,
+                 destination: Destination, merged_archive: Optional["MergedArchive"] = None):
+        self.use_case = use_case
+        self.zip_name = zip_name
+        self.date_formatting = date_formatting
+        self.date_formatting_dt = date_formatting_dt
+        self.destination = destination
+        self.merged_archive = merged_archive
+
+    @property
+    def date_format(self) -> DateFormat:
+        return date_format(self.date_formatting, self.date_formatting_dt)
+
+    @classmethod
+    def parse(cls, use_case: str, data: dict, problems: List[str]) -> Optional["OutputRule"]:
+        where = f"outputs.json {use_case}"
+        if not _check_keys(data, ("zip_name", "date_formatting", "date_formatting_dt", "destination"),
+                           ("merged_archive",), where, problems):
+            return None
+        _check_date_format(data["date_formatting"], data["date_formatting_dt"], where, problems)
+        merged_archive = data.get("merged_archive")
+        if merged_archive is not None:
+            merged_archive = MergedArchive.parse(merged_archive, f"{where} merged_archive", problems)
+        return cls(use_case, data["zip_name"], data["date_formatting"], data["date_formatting_dt"],
+                   _destination(data["destination"], where, problems), merged_archive)
+
+    @classmethod
+    def of(cls, use_case: str, data: Union["OutputRule", dict]) -> "OutputRule":
+        return data if isinstance(data, cls) else _parse_one(cls, use_case, data)
+
+
+class SplitRule:
+    """An outbound_shs.json / epic_outbound_shs.json use case: the rows of one BotName go to `destination`."""
+
+    __slots__ = ("use_case", "bot_name", "destination", "file_name", "date_format")
+
+    def __init__(self, use_case: str, bot_name: str, destination: Destination, file_name: str, date_format: str):
+        self.use_case = use_case
+        self.bot_name = bot_name
+        self.destination = destination
+        self.file_name = file_name
+        self.date_format = date_format
+
+    def output_name(self, date) -> str:
+        return self.file_name.replace(self.date_format, template(self.date_format).render(date))
+
+    @classmethod
+    def parse(cls, use_case: str, data: dict, problems: List[str], file_name: str = FILES["shs"]) -> Optional["SplitRule"]:
+        where = f"{file_name} {use_case}"
+        if not _check_keys(data, ("BotName", "destination", "file_name", "date_format"), (), where, problems):
+            return None
+        if data["date_format"] not in data["file_name"]:
+            problems.append(f"{where}: file_name does not contain its date_format '{data['date_format']}'")
+        return cls(use_case, data["BotName"], _destination(data["destination"], where, problems), data["file_name"],
+                   data["date_format"])
+
+    @classmethod
+    def of(cls, use_case: str, data: Union["SplitRule", dict]) -> "SplitRule":
+        return data if isinstance(data, cls) else _parse_one(cls, use_case, data)
+
+
+def _parse_one(rule_class, use_case: str, data: dict):
+    problems: List[str] = []
+    rule = rule_class.parse(use_case, data, problems)
+    if problems:
+        raise ConfigError("\n".join(problems))
+    return rule
+
+
+def rules_of(rule_class, data: dict) -> dict:
+    """use case -> rule for a config mapping, whether it is compiled already or raw JSON."""
+    return {use_case: rule_class.of(use_case, use_case_data) for use_case, use_case_data in data.items()}
+
+
+class Rules:
+    """Every use case of the four JSON configs, validated and compiled."""
+
+    __slots__ = ("inputs", "outputs", "shs", "epic_shs")
+
+    def __init__(self, inputs: Dict[str, InputRule], outputs: Dict[str, OutputRule], shs: Dict[str, SplitRule],
+                 epic_shs: Dict[str, SplitRule]):
+        self.inputs = inputs
+        self.outputs = outputs
+        self.shs = shs
+        self.epic_shs = epic_shs
+
+
+def compile_rules(configs: dict) -> Rules:
+    """Validate the raw configs and build their rules; every problem is reported at once as a ConfigError."""
+    problems: List[str] = []
+    parsed = {}
+    for key, rule_class in (("inputs", InputRule), ("outputs", OutputRule)):
+        parsed[key] = {use_case: rule_class.parse(use_case, data, problems)
+                       for use_case, data in configs.get(key, {}).items()}
+    for key in ("shs", "epic_shs"):
+        parsed[key] = {use_case: SplitRule.parse(use_case, data, problems, FILES[key])
+                       for use_case, data in configs.get(key, {}).items()}
+    bot_names = {}
+    for key in ("shs", "epic_shs"):
+        for use_case, rule in parsed[key].items():
+            if rule is not None and rule.bot_name in bot_names.get(key, {}):
+                problems.append(f"{FILES[key]} {use_case}: BotName '{rule.bot_name}' is also used by "
+                                f"{bot_names[key][rule.bot_name]}")
+            elif rule is not None:
+                bot_names.setdefault(key, {})[rule.bot_name] = use_case
+    if problems:
+        raise ConfigError(f"{len(problems)} problem(s) in the configs:\n" + "\n".join(problems))
+    return Rules(**parsed)
+
+
+def _cache_key(config_dir: str) -> tuple:
+    # a saved config gets a new mtime (or size), that is enough to tell a stale cache apart
+    key = [CACHE_VERSION]
+    for file_name in FILES.values():
+        stat = os.stat(os.path.join(config_dir, file_name))
+        key.append((file_name, stat.st_size, stat.st_mtime_ns))
+    return tuple(key)
+
+
+def _read_cache(cache_path: str, key: tuple) -> Optional[dict]:
+    try:
+        with open(cache_path, "rb") as file:
+            cached = pickle.load(file)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable config cache {cache_path}: {e}")
+        return None
+    return cached if cached.get("key") == key else None
+
+
+def _write_cache(cache_path: str, cached: dict):
+    folder = os.path.dirname(cache_path)
+    try:
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        tmp_path = f"{cache_path}.tmp"
+        with open(tmp_path, "wb") as file:
+            pickle.dump(cached, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        logger.warning(f"Failed to write config cache {cache_path}: {e}")
+
+
+def load(config_dir: str = CONFIG_DIR, cache_path: Optional[str] = None) -> dict:
+    """Load the four JSON configs, their compiled rules and file name matcher.
+
+    Returns the raw configs by key ("inputs", "outputs", "shs", "epic_shs")
+    plus "rules" and "matcher" (the PatternMatcher of every use case), and
+    compiles every date format and destination template (see
+    date_tokens.compile_configs). With a cache_path all of it is pickled there
+    and reused for as long as none of the JSON files changes, so an unchanged
+    config is neither parsed, validated nor compiled again; the regexes are
+    rebuilt from their pickled source by re. Raises ConfigError for invalid
+    configs.
+    """
+    key = _cache_key(config_dir)
+    if cache_path:
+        cached = _read_cache(cache_path, key)
+        if cached is not None:
+            date_tokens.preload(cached["date_tokens"])
+            logger.debug(f"Loaded compiled configs from {cache_path}")
+            return cached["configs"]
+
+    configs = {}
+    for config_key, file_name in FILES.items():
+        with open(os.path.join(config_dir, file_name)) as file:
+            configs[config_key] = json.load(file)
+    rules = configs["rules"] = compile_rules(configs)
+    configs["matcher"] = PatternMatcher(build_rules(rules.inputs, rules.outputs, rules.shs, rules.epic_shs))
+    date_tokens.compile_configs(configs)
+    if cache_path:
+        _write_cache(cache_path, {"key": key, "configs": configs, "date_tokens": date_tokens.compiled()})
+    return configs
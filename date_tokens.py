@@ -0,0 +1,180 @@
+import datetime
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from loguru import logger
+
+
+# destination tokens, longest first so "YYYY" is never read as two "YY"
+_TOKEN = re.compile(r"(YYYY|YY|MM|DD)")
+
+# how many filename -> date lookups each DateFormat remembers
+PARSE_CACHE_SIZE = 4096
+
+
+def _date_regex(date_formatting: str) -> Optional[str]:
+    if " " in date_formatting:  # MM DD YYYY
+        return r"(\d{2}(\s)\d{2}(\s)\d{4})"
+    if "_" not in date_formatting:  # MMDDYYYY, YYYYMMDD, YYMMDD
+        return r"(\d{" + str(len(date_formatting)) + "})"
+    if len(date_formatting) == 8:  # MM_DD_YY
+        return r"(\d{2}(_)\d{2}(_)\d{2})"
+    if len(date_formatting) == 10:  # MM_DD_YYYY
+        return r"(\d{2}(_)\d{2}(_)\d{4})"
+    return None
+
+
+class InvalidDate(ValueError):
+    """A file name has a date in the expected place that is not a real date (13_45_25)."""
+
+
+class DateFormat:
+    """A filename date format ("MM_DD_YY" + "%m_%d_%y") compiled to a regex.
+
+    Lookups are memoized per filename, so the outbound parsers asking for the
+    same file's date once per use case only search and strptime it once.
+    """
+
+    def __init__(self, date_formatting: str, date_formatting_dt: str):
+        self.date_formatting = date_formatting
+        self.date_formatting_dt = date_formatting_dt
+        regex = _date_regex(date_formatting)
+        self.regex = re.compile(regex) if regex is not None else None
+        self.find = lru_cache(maxsize=PARSE_CACHE_SIZE)(self._find)
+
+    def __getstate__(self):
+        # pickled with the compiled configs; the memoized lookups are per process
+        return {"date_formatting": self.date_formatting, "date_formatting_dt": self.date_formatting_dt,
+                "regex": self.regex}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.find = lru_cache(maxsize=PARSE_CACHE_SIZE)(self._find)
+
+    def _find(self, file_name: str) -> Optional[Tuple[str, datetime.datetime]]:
+        """Return the date text found in file_name and the parsed date, or None.
+
+        Raises InvalidDate when the text has the shape of the format but does
+        not parse: the file must be left where it is, not sent to a folder
+        with its date tokens unrendered.
+        """
+        if self.regex is None:
+            logger.warning(f"Unsupported date format {self.date_formatting}")
+            return None
+        match = self.regex.search(file_name)
+        if not match:
+            return None
+        try:
+            return match.group(0), datetime.datetime.strptime(match.group(0), self.date_formatting_dt)
+        except ValueError as e:
+            raise InvalidDate(f"Could not parse date {match.group(0)} in {file_name} as "
+                              f"{self.date_formatting_dt}: {e}") from None
+
+    def parse(self, file_name: str) -> Optional[datetime.datetime]:
+        found = self.find(file_name)
+        return found[1] if found else None
+
+
+class DestinationTemplate:
+    """A destination path split once into literal text and date tokens."""
+
+    def __init__(self, template: str):
+        self.template = template
+        # split() with a capture group alternates literal, token, literal, ...
+        self._parts = _TOKEN.split(template)
+
+    @property
+    def has_tokens(self) -> bool:
+        return len(self._parts) > 1
+
+    def render(self, date: datetime.datetime) -> str:
+        if not self.has_tokens:
+            return self.template
+        values = {
+            "YYYY": str(date.year),
+            "YY": str(date.year)[2:],
+            "MM": str(date.month).zfill(2),
+            "DD": str(date.day).zfill(2),
+        }
+        parts = list(self._parts)
+        parts[1::2] = [values[token] for token in parts[1::2]]
+        return "".join(parts)
+
+
+# every format and template compiled in this process, shared by all callers
+_formats: Dict[Tuple[str, str], DateFormat] = {}
+_templates: Dict[str, DestinationTemplate] = {}
+
+
+def date_format(date_formatting: str, date_formatting_dt: str) -> DateFormat:
+    key = (date_formatting, date_formatting_dt)
+    fmt = _formats.get(key)
+    if fmt is None:
+        fmt = _formats.setdefault(key, DateFormat(date_formatting, date_formatting_dt))
+    return fmt
+
+
+def template(destination: str) -> DestinationTemplate:
+    compiled = _templates.get(destination)
+    if compiled is None:
+        compiled = _templates.setdefault(destination, DestinationTemplate(destination))
+    return compiled
+
+
+def compiled() -> dict:
+    """Every format and template compiled so far, to be pickled with the config cache."""
+    return {"formats": dict(_formats), "templates": dict(_templates)}
+
+
+def preload(compiled_tokens: dict):
+    """Reuse formats and templates compiled by an earlier run (see compiled())."""
+    for key, fmt in compiled_tokens.get("formats", {}).items():
+        _formats.setdefault(key, fmt)
+    for destination, compiled_template in compiled_tokens.get("templates", {}).items():
+        _templates.setdefault(destination, compiled_template)
+
+
+def render_destinations(destinations: Iterable[str], date: datetime.datetime) -> List[str]:
+    return [template(destination).render(date) for destination in destinations]
+
+
+def _destinations(destination: Union[str, List[str], None]) -> List[str]:
+    if destination is None:
+        return []
+    return destination if isinstance(destination, list) else [destination]
+
+
+def compile_configs(configs: dict) -> int:
+    """Compile every date format and destination template in the loaded configs.
+
+    Called once at startup so a bad format shows up in the log before any file
+    is moved. Returns the number of formats and templates compiled.
+    """
+    formats = []
+    templates = []
+    for use_case_data in configs.get("inputs", {}).values():
+        inputs = use_case_data["inputs"]
+        templates += _destinations(inputs.get("destination"))
+        if inputs.get("date_formatting"):
+            formats.append((inputs["date_formatting"], inputs["date_formatting_dt"]))
+        for transform in inputs.get("destination_transforms") or []:
+            if transform and transform.get("date_offset_days"):
+                formats.append((transform.get("date_format", "YYYYMMDD"), transform.get("date_format_dt", "%Y%m%d")))
+    for use_case_data in configs.get("outputs", {}).values():
+        templates += _destinations(use_case_data.get("destination"))
+        formats.append((use_case_data["date_formatting"], use_case_data["date_formatting_dt"]))
+        if use_case_data.get("merged_archive"):
+            templates.append(use_case_data["merged_archive"]["path"])
+    for mapping in (configs.get("shs", {}), configs.get("epic_shs", {})):
+        for use_case_data in mapping.values():
+            templates += _destinations(use_case_data.get("destination"))
+            templates.append(use_case_data["date_format"])
+
+    for date_formatting, date_formatting_dt in formats:
+        if date_format(date_formatting, date_formatting_dt).regex is None:
+            logger.warning(f"Unsupported date format {date_formatting} in config")
+    for destination in templates:
+        template(destination)
+    logger.debug(f"Compiled {len(set(formats))} date formats and {len(set(templates))} destination templates")
+    return len(set(formats)) + len(set(templates))
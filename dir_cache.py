@@ -0,0 +1,110 @@
+import os
+import threading
+from typing import Dict, Set
+
+from loguru import logger
+
+from profiling import span, MAKEDIRS, STAT
+
+
+def _key(path: str) -> str:
+    # "X\\2025\\" and "x\\2025" are the same folder on a Windows share
+    return os.path.normcase(str(path)).rstrip("\\/") or str(path)
+
+
+class DirectoryCache:
+    """Remembers, for one run, which destination folders are known to exist.
+
+    Only positive results are kept: a folder that was created or seen is not
+    asked about again, a folder that is missing is re-checked every time since
+    another process may create it. A transfer that fails against a folder
+    should call invalidate() so the next file re-checks it. Hits are the SMB
+    round trips that were saved.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._known: Set[str] = set()
+        self.hits = 0
+        self.misses = 0
+
+    def _lookup(self, key: str) -> bool:
+        with self._lock:
+            if key in self._known:
+                self.hits += 1
+                return True
+            self.misses += 1
+            return False
+
+    def _remember(self, key: str):
+        with self._lock:
+            self._known.add(key)
+
+    def ensure(self, path: str) -> bool:
+        """os.makedirs(path, exist_ok=True) once per run; False if it could not be created."""
+        key = _key(path)
+        if self._lookup(key):
+            return True
+        try:
+            with span(MAKEDIRS, path):
+                os.makedirs(path, exist_ok=True)
+        except Exception:
+            # best-effort; network paths may not allow mkdir
+            return False
+        self._remember(key)
+        return True
+
+    def exists(self, path: str) -> bool:
+        """os.path.isdir(path), answered from the cache once the folder has been seen."""
+        key = _key(path)
+        if self._lookup(key):
+            return True
+        with span(STAT, path):
+            found = os.path.isdir(path)
+        if found:
+            self._remember(key)
+            return True
+        return False
+
+    def invalidate(self, path: str):
+        with self._lock:
+            self._known.discard(_key(path))
+
+    def reset(self):
+        with self._lock:
+            self._known.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "cached": len(self._known)}
+
+
+_cache = DirectoryCache()
+
+
+def ensure_dir(path: str) -> bool:
+    return _cache.ensure(path)
+
+
+def dir_exists(path: str) -> bool:
+    return _cache.exists(path)
+
+
+def invalidate(path: str):
+    _cache.invalidate(path)
+
+
+def reset():
+    """Start a new run: forget every folder seen so far and zero the counters."""
+    _cache.reset()
+
+
+def stats() -> Dict[str, int]:
+    return _cache.stats()
+
+
+def log_stats():
+    counts = stats()
+    logger.debug(f"Directory cache: {counts['hits']} hits, {counts['misses']} misses, {counts['cached']} folders cached")
@@ -0,0 +1,160 @@
+import datetime
+import importlib.util
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import TYPE_CHECKING
+
+from loguru import logger
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# pandas (and numpy with it) is imported by the functions that need it: a run
+# without an Outbound workbook never loads it, which is most of a no-op run's time
+
+
+AUTO = "auto"
+READ_ENGINES = ("calamine", "openpyxl")
+WRITE_ENGINES = ("xlsxwriter", "openpyxl")
+
+# engine -> module that has to be importable for it
+_ENGINE_MODULES = {
+    "calamine": "python_calamine",
+    "openpyxl": "openpyxl",
+    "xlsxwriter": "xlsxwriter",
+}
+
+_settings = {"read_engine": AUTO, "write_engine": AUTO, "processes": 0}
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def engine_available(engine: str) -> bool:
+    return importlib.util.find_spec(_ENGINE_MODULES[engine]) is not None
+
+
+def _resolve(engine: str, choices: tuple) -> str:
+    if engine == AUTO:
+        for candidate in choices:
+            if engine_available(candidate):
+                return candidate
+        raise ImportError(f"None of the Excel engines {choices} is installed")
+    if engine not in choices:
+        raise ValueError(f"Unknown Excel engine {engine!r}, expected one of {choices} or {AUTO!r}")
+    if not engine_available(engine):
+        logger.warning(f"Excel engine {engine} is not installed; falling back to {AUTO}")
+        return _resolve(AUTO, choices)
+    return engine
+
+
+def configure(read_engine: str = None, write_engine: str = None, processes: int = None):
+    """Select the engines used by read_workbook/write_workbook ("auto" picks the fastest installed).
+
+    With processes > 0 workbooks are read and written in that many worker
+    processes, so the CPU-bound parsing and cell writing does not hold this
+    process's GIL while network copies and extractions run on its threads.
+    """
+    if read_engine is not None:
+        _resolve(read_engine, READ_ENGINES)
+        _settings["read_engine"] = read_engine
+    if write_engine is not None:
+        _resolve(write_engine, WRITE_ENGINES)
+        _settings["write_engine"] = write_engine
+    if processes is not None:
+        shutdown()
+        _settings["processes"] = max(0, processes)
+
+
+def shutdown():
+    """Stop the worker processes, if any were started."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True)
+            _pool = None
+
+
+def _call(fn, *args):
+    global _pool
+    if not _settings["processes"]:
+        return fn(*args)
+    with _pool_lock:
+        if _pool is None:
+            # spawn, not fork: forking a process that has transfer threads running can deadlock the child
+            _pool = ProcessPoolExecutor(max_workers=_settings["processes"],
+                                        mp_context=multiprocessing.get_context("spawn"))
+        pool = _pool
+    return pool.submit(fn, *args).result()
+
+
+def read_workbook(path: str, engine: str = None) -> "pd.DataFrame":
+    """Read the first sheet of a workbook.
+
+    calamine (Rust) is several times faster than openpyxl on large sheets; the
+    openpyxl reader is opened by pandas in read_only mode.
+    """
+    engine = _resolve(engine or _settings["read_engine"], READ_ENGINES)
+    return _call(_read, path, engine)
+
+
+def _read(path: str, engine: str) -> "pd.DataFrame":
+    import pandas as pd
+
+    return pd.read_excel(path, sheet_name=0, engine=engine)
+
+
+def _cell_value(value, np_generic, isna):
+    # numpy scalars become plain Python values, NaN/NaT become blank cells
+    if isinstance(value, np_generic):
+        value = value.item()
+    if value is None or (not isinstance(value, str) and isna(value)):
+        return None
+    return value
+
+
+def _write_xlsxwriter(df: "pd.DataFrame", path: str, sheet_name: str):
+    import numpy as np
+    import pandas as pd
+    import xlsxwriter
+
+    # constant_memory flushes every row as soon as the next one starts, so the
+    # rows have to be written in order; pandas' own xlsxwriter path writes
+    # column by column and can not be used in this mode
+    workbook = xlsxwriter.Workbook(path, {"constant_memory": True})
+    try:
+        worksheet = workbook.add_worksheet(sheet_name)
+        header_format = workbook.add_format({"bold": True, "border": 1, "align": "center"})
+        datetime_format = workbook.add_format({"num_format": "yyyy-mm-dd hh:mm:ss"})
+        date_format = workbook.add_format({"num_format": "yyyy-mm-dd"})
+
+        for col, name in enumerate(df.columns):
+            worksheet.write(0, col, str(name), header_format)
+        for row, values in enumerate(df.itertuples(index=False, name=None), start=1):
+            for col, value in enumerate(values):
+                value = _cell_value(value, np.generic, pd.isna)
+                if value is None:
+                    continue
+                if isinstance(value, datetime.datetime):
+                    worksheet.write_datetime(row, col, value.replace(tzinfo=None), datetime_format)
+                elif isinstance(value, datetime.date):
+                    worksheet.write_datetime(row, col, value, date_format)
+                elif isinstance(value, str):
+                    worksheet.write_string(row, col, value)
+                else:
+                    worksheet.write(row, col, value)
+    finally:
+        workbook.close()
+
+
+def write_workbook(df: "pd.DataFrame", path: str, sheet_name: str = "export", engine: str = None):
+    """Write a DataFrame to a single-sheet workbook without the index column."""
+    engine = _resolve(engine or _settings["write_engine"], WRITE_ENGINES)
+    _call(_write, df, path, sheet_name, engine)
+
+
+def _write(df: "pd.DataFrame", path: str, sheet_name: str, engine: str):
+    if engine == "xlsxwriter":
+        _write_xlsxwriter(df, path, sheet_name)
+    else:
+        df.to_excel(path, index=False, sheet_name=sheet_name, engine=engine)
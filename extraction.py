@@ -0,0 +1,210 @@
+import os
+import threading
+import time
+import zlib
+from typing import Dict, List, Optional, Tuple
+from zipfile import ZipFile, ZipInfo
+
+from loguru import logger
+
+import ledger
+import profiling
+from dir_cache import ensure_dir
+from transfers import host_slot, run_concurrently
+
+
+# bytes per read/write when streaming a member to the share; SMB does much
+# better with a few large writes than with zipfile's default 8 KiB ones
+BUFFER_SIZE = 1024 * 1024
+# log progress every time this share of the members has been extracted
+PROGRESS_STEP = 0.1
+# debug progress: one line per this many members, or this many seconds, whichever comes first
+DEBUG_EVERY_MEMBERS = 200
+DEBUG_EVERY_SECONDS = 5.0
+
+_INVALID_WINDOWS_CHARS = str.maketrans({c: "_" for c in ':<>|"?*'})
+
+# target path -> (bytes written, CRC-32 of the bytes written)
+Written = Dict[str, Tuple[int, int]]
+
+
+class ZipPlan:
+    """A zip's manifest (member paths, sizes and CRCs), read from its central directory once."""
+
+    def __init__(self, infolist: List[ZipInfo]):
+        self.members: List[ZipInfo] = []
+        self.folder_count = 0
+        for info in infolist:
+            if info.filename.endswith("/"):
+                self.folder_count += 1
+            else:
+                self.members.append(info)
+        self.total_bytes = sum(info.file_size for info in self.members)
+
+    @property
+    def file_count(self) -> int:
+        return len(self.members)
+
+    @classmethod
+    def read(cls, zip_path: str) -> "ZipPlan":
+        with ZipFile(zip_path) as zf:
+            return cls(zf.infolist())
+
+
+def member_target(destination: str, member_name: str) -> str:
+    """Where ZipFile.extract would write a member: no absolute paths, drives or '..'."""
+    parts = []
+    for part in member_name.replace("\\", "/").split("/"):
+        if part in ("", ".", ".."):
+            continue
+        if not parts:
+            part = os.path.splitdrive(part)[1] or part.rstrip(":")
+        if os.name == "nt":
+            part = part.translate(_INVALID_WINDOWS_CHARS).rstrip(".")
+        if part:
+            parts.append(part)
+    return os.path.join(destination, *parts)
+
+
+class _Progress:
+    def __init__(self, zip_path: str, total_members: int, total_bytes: int):
+        self.zip_name = os.path.basename(zip_path)
+        self.total_members = total_members
+        self.total_bytes = total_bytes
+        self.members = 0
+        self.bytes = 0
+        self.start = time.perf_counter()
+        self._next_report = PROGRESS_STEP
+        self._next_debug_members = DEBUG_EVERY_MEMBERS
+        self._next_debug_at = self.start + DEBUG_EVERY_SECONDS
+        self._lock = threading.Lock()
+
+    def throughput(self) -> float:
+        return self.bytes / 1e6 / max(time.perf_counter() - self.start, 1e-9)
+
+    def done(self, info: ZipInfo):
+        with self._lock:
+            self.members += 1
+            self.bytes += info.file_size
+            now = time.perf_counter()
+            if self.members >= self._next_debug_members or now >= self._next_debug_at:
+                self._next_debug_members = self.members + DEBUG_EVERY_MEMBERS
+                self._next_debug_at = now + DEBUG_EVERY_SECONDS
+                logger.debug(f"Extracted {self.members} members from {self.zip_name}, the last {info.filename}")
+            if self.total_members and self.members / self.total_members >= self._next_report:
+                self._next_report += PROGRESS_STEP
+                logger.info(f"{self.zip_name}: {self.members}/{self.total_members} members, "
+                            f"{self.bytes / 1e6:.1f}/{self.total_bytes / 1e6:.1f} MB at {self.throughput():.1f} MB/s")
+
+
+def extract_zip(zip_path: str, plan: ZipPlan, destination: str, stamp: Optional[ledger.Stamp] = None,
+                read_from: Optional[str] = None) -> Written:
+    """Extract every member in plan into destination, several members at a time.
+
+    The folder tree is created up front, then the members are streamed by a
+    worker pool; every worker opens its own handle on the zip because a
+    ZipFile can not be read from several threads at once. Members the ledger
+    already has as extracted (an interrupted earlier run) are skipped.
+    read_from is a local copy of zip_path to read the members from; the
+    ledger still records them against zip_path.
+
+    Returns the size and CRC of everything written, for verify_extraction.
+    """
+    stamp = ledger.fingerprint(zip_path) if stamp is None else stamp
+    pending = []
+    folders = set()
+    for info in plan.members:
+        target = member_target(destination, info.filename)
+        if ledger.is_done(ledger.EXTRACT, zip_path, target, stamp):
+            continue
+        pending.append((info, target))
+        folders.add(os.path.dirname(target))
+    for folder in sorted(folders):
+        ensure_dir(folder)
+
+    progress = _Progress(zip_path, len(pending), sum(info.file_size for info, _ in pending))
+    local = threading.local()
+    handles = []
+    handles_lock = threading.Lock()
+    written: Written = {}
+
+    def extract_one(item):
+        info, target = item
+        zf = getattr(local, "zf", None)
+        if zf is None:
+            zf = local.zf = ZipFile(read_from or zip_path)
+            with handles_lock:
+                handles.append(zf)
+        with ledger.operation(ledger.EXTRACT, zip_path, target, stamp), host_slot(destination):
+            size = crc = 0
+            with profiling.span(profiling.EXTRACT, target), \
+                    zf.open(info) as src, open(target, "wb", buffering=BUFFER_SIZE) as dst:
+                while True:
+                    chunk = src.read(BUFFER_SIZE)
+                    if not chunk:
+                        break
+                    dst.write(chunk)
+                    size += len(chunk)
+                    crc = zlib.crc32(chunk, crc)
+        written[target] = (size, crc)
+        progress.done(info)
+
+    try:
+        run_concurrently(extract_one, pending)
+    finally:
+        for zf in handles:
+            zf.close()
+    if pending:
+        logger.info(f"Extracted {progress.members} members ({progress.bytes / 1e6:.1f} MB) of "
+                    f"{progress.zip_name} in {time.perf_counter() - progress.start:.1f}s "
+                    f"at {progress.throughput():.1f} MB/s")
+    return written
+
+
+class Verification:
+    """Members of a zip that are missing or differ at the destination."""
+
+    def __init__(self, checked: int, missing: List[str], corrupt: List[str]):
+        self.checked = checked
+        self.missing = missing
+        self.corrupt = corrupt
+
+    @property
+    def ok(self) -> bool:
+        return not self.missing and not self.corrupt
+
+
+def verify_extraction(plan: ZipPlan, destination: str, written: Optional[Written] = None) -> Verification:
+    """Check the destination against the zip's manifest (path, size, CRC).
+
+    Members written in this run are checked against the size and CRC computed
+    while they were streamed, so they cost no network call at all. The others
+    (extracted by an earlier run) are stat'ed in parallel and compared by
+    size. Nothing is listed on the share.
+    """
+    written = written or {}
+    missing = []
+    corrupt = []
+    to_stat = []
+    for info in plan.members:
+        target = member_target(destination, info.filename)
+        if target in written:
+            if written[target] != (info.file_size, info.CRC):
+                corrupt.append(info.filename)
+        else:
+            to_stat.append(info)
+
+    def stat_one(info):
+        try:
+            target = member_target(destination, info.filename)
+            with host_slot(destination), profiling.span(profiling.STAT, target):
+                return os.stat(target).st_size
+        except FileNotFoundError:
+            return None
+
+    for info, size in zip(to_stat, run_concurrently(stat_one, to_stat)):
+        if size is None:
+            missing.append(info.filename)
+        elif size != info.file_size:
+            corrupt.append(info.filename)
+    return Verification(len(plan.members), missing, corrupt)
@@ -0,0 +1,150 @@
+import fnmatch
+import os
+import re
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from loguru import logger
+
+
+# stage names used to route files to the function that handles them
+INPUTS = "inputs"
+OUTPUTS = "outputs"
+OUTBOUND = "outbound"
+EPIC_OUTBOUND = "epic_outbound"
+LAB_OUTPUTS = "lab_outputs"
+
+# fixed patterns that are not part of the JSON configs
+OUTBOUND_PATTERN = "Outbound*.xlsx"
+EPIC_OUTBOUND_PATTERN = "EPIC_Outbound*.xlsx"
+LAB_OUTPUTS_PATTERN = "Labappeals Output*.xlsx"
+
+Route = Tuple[str, str]
+
+
+def _translate(pattern: str) -> str:
+    # glob matching is case-insensitive on Windows, mirror that here
+    if os.name == "nt":
+        return "(?i:" + fnmatch.translate(pattern) + ")"
+    return fnmatch.translate(pattern)
+
+
+class PatternMatcher:
+    """Routes filenames to (stage, use_case) pairs with one compiled regex.
+
+    All patterns are joined into a single alternation so that files which match
+    nothing are rejected in one regex call. Within a stage a filename goes to the
+    first use case whose pattern matches, in config order: the use cases used to
+    be globbed one after another, and the first one moved the file away before
+    the next glob ran.
+    """
+
+    def __init__(self, rules: Iterable[Tuple[str, str, str]]):
+        self.rules: List[Tuple[str, str, str]] = list(rules)
+        self._patterns = [re.compile(_translate(pattern)) for _, _, pattern in self.rules]
+        if self.rules:
+            self._combined = re.compile(
+                "|".join(f"(?P<r{i}>{_translate(pattern)})" for i, (_, _, pattern) in enumerate(self.rules))
+            )
+        else:
+            self._combined = None
+
+    def match(self, file_name: str) -> List[Route]:
+        if self._combined is None:
+            return []
+        found = self._combined.match(file_name)
+        if not found:
+            return []
+        first = int(found.lastgroup[1:])
+        routes = [self.rules[first][:2]]
+        stages = {self.rules[first][0]}
+        for i in range(first + 1, len(self.rules)):
+            stage = self.rules[i][0]
+            if stage not in stages and self._patterns[i].match(file_name):
+                routes.append(self.rules[i][:2])
+                stages.add(stage)
+        return routes
+
+
+def build_rules(inputs: Optional[dict] = None, outputs: Optional[dict] = None,
+                shs: Optional[dict] = None, epic_shs: Optional[dict] = None) -> List[Tuple[str, str, str]]:
+    """Collect (stage, use_case, pattern) triples from the JSON configs (raw, or compiled by config)."""
+    rules = []
+    for use_case, use_case_data in (inputs or {}).items():
+        name = use_case_data['inputs']['name'] if isinstance(use_case_data, dict) else use_case_data.name
+        rules.append((INPUTS, use_case, name))
+    for use_case, use_case_data in (outputs or {}).items():
+        zip_name = use_case_data['zip_name'] if isinstance(use_case_data, dict) else use_case_data.zip_name
+        rules.append((OUTPUTS, use_case, zip_name))
+    if shs is not None:
+        rules.append((LAB_OUTPUTS, LAB_OUTPUTS, LAB_OUTPUTS_PATTERN))
+        rules.append((OUTBOUND, OUTBOUND, OUTBOUND_PATTERN))
+    if epic_shs is not None:
+        rules.append((EPIC_OUTBOUND, EPIC_OUTBOUND, EPIC_OUTBOUND_PATTERN))
+    return rules
+
+
+def iter_files(source_dir: str) -> Iterator[Tuple[str, int]]:
+    """(name, size) of every file in source_dir, yielded as os.scandir lists them.
+
+    Temp/lock files ("~$book.xlsx") and hidden files are never distributed and are left out.
+    """
+    with os.scandir(source_dir) as entries:
+        for entry in entries:
+            if "~" in entry.name or entry.name.startswith("."):
+                continue
+            try:
+                if entry.is_file():
+                    # on Windows the size comes with the listing, no extra round trip
+                    yield entry.name, entry.stat().st_size
+            except OSError:
+                continue
+
+
+class FileIndex:
+    """In-memory index of a source directory, built from a single listing."""
+
+    def __init__(self, source_dir: str, file_names: Iterable[str], matcher: PatternMatcher,
+                 sizes: Optional[Dict[str, int]] = None):
+        self.source_dir = source_dir
+        self.file_names: List[str] = list(file_names)
+        # name -> size in bytes, when the listing provided it
+        self.sizes: Dict[str, int] = sizes or {}
+        self._routes: Dict[Route, List[str]] = {}
+        self._routes_by_name: Dict[str, List[Route]] = {}
+        for file_name in self.file_names:
+            routes = matcher.match(file_name)
+            self._routes_by_name[file_name] = routes
+            for route in routes:
+                self._routes.setdefault(route, []).append(file_name)
+
+    @classmethod
+    def scan(cls, source_dir: str, matcher: PatternMatcher) -> "FileIndex":
+        """List source_dir once with os.scandir and classify every file."""
+        file_names = []
+        sizes = {}
+        for name, size in iter_files(source_dir):
+            file_names.append(name)
+            sizes[name] = size
+        logger.debug(f"Indexed {len(file_names)} files in {source_dir}")
+        return cls(source_dir, file_names, matcher, sizes)
+
+    def files(self, stage: str, use_case: Optional[str] = None) -> List[str]:
+        """Full paths of the files routed to a stage (and use case)."""
+        key = (stage, use_case if use_case is not None else stage)
+        return [os.path.join(self.source_dir, name) for name in self._routes.get(key, [])]
+
+    def routes(self, file_name: str) -> List[Route]:
+        """The (stage, use_case) pairs a file name was routed to; empty if it matched nothing."""
+        return self._routes_by_name.get(file_name, [])
+
+    def size(self, path: str) -> int:
+        """Size of an indexed file from the listing, 0 when it is not known."""
+        return self.sizes.get(os.path.basename(path), 0)
+
+    def __len__(self) -> int:
+        return len(self.file_names)
+
+
+def build_file_index(source_dir: str, inputs: Optional[dict] = None, outputs: Optional[dict] = None,
+                     shs: Optional[dict] = None, epic_shs: Optional[dict] = None) -> FileIndex:
+    return FileIndex.scan(source_dir, PatternMatcher(build_rules(inputs, outputs, shs, epic_shs)))
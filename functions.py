@@ -1,13 +1,42 @@
-from glob import glob
 import shutil
 import os
 from loguru import logger
 import datetime
-import re
-import pandas as pd
-from zipfile import ZipFile
-from typing import List, Union
-
+import tempfile
+import time
+from contextlib import nullcontext
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from file_index import FileIndex, build_file_index, INPUTS, OUTPUTS, OUTBOUND, EPIC_OUTBOUND, LAB_OUTPUTS
+from transfers import TransferExecutor, host_slot, host_slots, max_workers, tee_copy
+from excel_io import read_workbook, write_workbook
+from dir_cache import dir_exists, ensure_dir, invalidate
+import ledger
+import merged_index
+import moved_archive
+import metrics
+import archive_store
+import profiling
+from extraction import ZipPlan, extract_zip, verify_extraction
+from config import InputRule, OutputRule, SplitRule, Rules, rules_of
+from pipeline import Budget, Pipeline, make_stage
+from planner import (Batch, Plan, PlannedFile, COMBINED_OUTPUTS_DIR, apply_filename_transform, destination_targets,
+                     lab_output_target, moved_root, moved_target, outbound_date, output_folder, resolve_destinations,
+                     split_targets)
+from planner import plan as plan_transfers
+
+# moved to planner with the rest of the destination resolution; kept under its old name
+_apply_filename_transform = apply_filename_transform
+
+
+# run metrics for the sub-steps of a stage, next to the file_index stage names
+EXTRACT = "extract"
+VERIFY = "verify"
+EXCEL_READ = "excel_read"
+EXCEL_WRITE = "excel_write"
+DEDUP = "dedup"
+# files dropped again after they were processed and archived
+REDROPPED = "redropped"
 
 def _ensure_list_destination(destination: Union[str, List[str]]) -> List[str]:
     if isinstance(destination, list):
@@ -15,79 +44,149 @@ def _ensure_list_destination(destination: Union[str, List[str]]) -> List[str]:
     return [destination]
 
 
-def _apply_filename_transform(original_filename: str, transform: dict) -> str:
-    """Apply transformations to a filename (e.g., date offsets).
+def _tee(src: str, targets: List[Tuple[Optional[str], str]], stamp: ledger.Stamp) -> Dict[str, Exception]:
+    """Write src to every target path while reading src only once.
 
     Args:
-        original_filename: The original filename (without path).
-        transform: A dict with transformation rules, e.g.:
-            {"date_offset_days": 1, "date_format": "YYYYMMDD", "date_format_dt": "%Y%m%d"}
+        src: Source file path.
+        targets: (ledger kind, target path) pairs; a kind of None is not recorded in the ledger.
+        stamp: The source's ledger fingerprint.
 
     Returns:
-        The transformed filename.
+        The targets that could not be written, with their error.
     """
-    if not transform:
-        return original_filename
-
-    date_offset = transform.get("date_offset_days", 0)
-    if date_offset == 0:
-        return original_filename
-
-    date_format = transform.get("date_format", "YYYYMMDD")
-    date_format_dt = transform.get("date_format_dt", "%Y%m%d")
-
-    # Build regex to extract date from filename
-    if " " in date_format:
-        regex_search = r"(\d{2}(\s)\d{2}(\s)\d{4})"
-    elif "_" not in date_format:
-        regex_search = r"(\d{" + str(len(date_format)) + "})"
-    elif len(date_format) == 8:
-        regex_search = r"(\d{2}(_)\d{2}(_)\d{2})"
-    elif len(date_format) == 10:
-        regex_search = r"(\d{2}(_)\d{2}(_)\d{4})"
-    else:
-        return original_filename
-
-    match = re.search(regex_search, original_filename)
-    if not match:
-        logger.warning(f"Could not extract date from filename {original_filename} using format {date_format}")
-        return original_filename
-
-    date_str = match.group(0)
+    fname = os.path.basename(src)
+    pending = []
+    for kind, target in targets:
+        if kind is not None and ledger.is_done(kind, src, target, stamp):
+            logger.info(f"{fname} was already copied to {target}")
+            continue
+        ensure_dir(os.path.dirname(target))
+        if kind is not None:
+            ledger.record(kind, src, target, stamp, ledger.PLANNED)
+        pending.append((kind, target))
+    digest = hasher = None
+    seen_size = False
+    if archive_store.enabled() and any(kind == ledger.COPY for kind, _ in pending):
+        size = os.path.getsize(src)
+        seen_size = archive_store.has_size(size)
+        if seen_size and all(kind == ledger.COPY for kind, _ in pending):
+            # only archive copies, and content of this size was archived before: hash first, they may not be needed
+            digest = archive_store.file_digest(src)
+            pending = _place_archived(src, pending, stamp, digest, size)
+            seen_size = False
+        else:
+            # hash the bytes on their way to the destinations, src is read once
+            hasher = archive_store.new_hasher()
+    if not pending:
+        return {}
+
+    paths = [target for _, target in pending]
     try:
-        date_obj = datetime.datetime.strptime(date_str, date_format_dt)
-        new_date = date_obj + datetime.timedelta(days=date_offset)
-        new_date_str = new_date.strftime(date_format_dt)
-        new_filename = original_filename.replace(date_str, new_date_str)
-        logger.debug(f"Transformed filename: {original_filename} -> {new_filename} (offset: {date_offset} days)")
-        return new_filename
-    except Exception as e:
-        logger.warning(f"Failed to apply date offset to {original_filename}: {e}")
-        return original_filename
+        with host_slots([src] + paths):
+            _, failures = tee_copy(src, paths, hasher)
+    except OSError as e:
+        failures = {target: e for target in paths}
+    if hasher is not None and len(failures) < len(paths):
+        digest = hasher.hexdigest()
+    deduplicated = set()
+    if seen_size and digest is not None:
+        deduplicated = _dedupe_copied(src, [target for kind, target in pending
+                                            if kind == ledger.COPY and target not in failures], digest, size)
+
+    for kind, target in pending:
+        error = failures.get(target)
+        if kind is not None:
+            ledger.record(kind, src, target, stamp, ledger.FAILED if error else ledger.DONE)
+        if error:
+            invalidate(os.path.dirname(target))
+            logger.warning(f"Failed to copy {fname} to {target}: {error}")
+        else:
+            if kind == ledger.COPY and digest is not None and target not in deduplicated:
+                archive_store.register(digest, size, target)
+            logger.info(f"Copied {fname} to {target}")
+    return failures
+
+
+def _place_archived(src: str, pending: List[Tuple[Optional[str], str]], stamp: ledger.Stamp, digest: str,
+                    size: int) -> List[Tuple[Optional[str], str]]:
+    """Link (or point) archive targets to a copy of the same content that is already archived.
+
+    Returns the targets that still have to be copied.
+    """
+    existing = archive_store.find(digest, size)
+    if existing is None:
+        return pending
+    fname = os.path.basename(src)
+    remaining = []
+    for kind, target in pending:
+        placed = None
+        if kind == ledger.COPY:
+            try:
+                with host_slot(target):
+                    placed = archive_store.place(existing, target)
+            except OSError as e:
+                logger.warning(f"Could not reuse {existing} for {target}, copying instead: {e}")
+        if placed is None:
+            remaining.append((kind, target))
+            continue
+        ledger.record(kind, src, target, stamp, ledger.DONE)
+        metrics.count(DEDUP, files=1, bytes=size)
+        logger.info(f"{fname} is already archived as {existing}, wrote {placed} instead of a copy")
+    return remaining
+
+
+def _dedupe_copied(src: str, targets: List[str], digest: str, size: int) -> set:
+    """Swap archive copies just written for links (or pointers) to a copy of the same content archived before.
+
+    Used when the hash came from the transfer itself: the archive targets were
+    written along with the primary one, and are replaced afterwards. Returns
+    the targets that were replaced.
+    """
+    existing = archive_store.find(digest, size)
+    if existing is None:
+        return set()
+    fname = os.path.basename(src)
+    replaced = set()
+    for target in targets:
+        try:
+            with host_slot(target):
+                placed = archive_store.place(existing, target)
+                if placed is not None and placed != target:
+                    # a pointer was written next to the copy, the copy itself is not needed
+                    os.remove(target)
+        except OSError as e:
+            logger.warning(f"Could not reuse {existing} for {target}, keeping the copy: {e}")
+            continue
+        if placed is None:
+            continue
+        replaced.add(target)
+        metrics.count(DEDUP, files=1, bytes=size)
+        logger.info(f"{fname} is already archived as {existing}, replaced the copy at {target} with {placed}")
+    return replaced
 
 
 def _copy_to_destinations(src: str, dests: List[str], transforms: Union[List[dict], None] = None) -> None:
     """Copy a file to multiple destination directories with optional filename transformations.
 
     Each destination is treated as a folder; the source filename is preserved or transformed.
+    The source is read once and its bytes are written to every destination.
 
     Args:
         src: Source file path.
         dests: List of destination directories.
         transforms: Optional list of transformation dicts (one per destination).
     """
-    fname = os.path.basename(src)
-    for i, dest in enumerate(dests):
-        try:
-            os.makedirs(dest, exist_ok=True)
-            # Apply transformation if provided
-            target_name = fname
-            if transforms and i < len(transforms) and transforms[i]:
-                target_name = _apply_filename_transform(fname, transforms[i])
-            shutil.copy2(src, os.path.join(dest, target_name))
-            logger.info(f"Copied {fname} to {dest} as {target_name}")
-        except Exception as e:
-            logger.warning(f"Failed to copy {fname} to {dest}: {e}")
+    targets = destination_targets(os.path.basename(src), dests, transforms)
+    _tee(src, [(ledger.COPY, target) for target in targets], ledger.fingerprint(src))
+
+
+def _same_filesystem(path: str, folder: str) -> bool:
+    try:
+        with profiling.span(profiling.STAT, folder):
+            return os.stat(path).st_dev == os.stat(folder).st_dev
+    except OSError:
+        return True
 
 
 def move_single_file(source: str, destination: Union[str, List[str]], destination_transforms: Union[List[dict], None] = None):
@@ -101,6 +200,9 @@ def move_single_file(source: str, destination: Union[str, List[str]], destinatio
                 - "date_offset_days": int (number of days to add/subtract from date in filename)
                 - "date_format": str (e.g., "YYYYMMDD")
                 - "date_format_dt": str (e.g., "%Y%m%d")
+
+    Returns:
+        True if the file reached its primary destination.
     """
     source = str(source)
     source_dir = os.path.dirname(source)
@@ -109,378 +211,534 @@ def move_single_file(source: str, destination: Union[str, List[str]], destinatio
     dest_list = _ensure_list_destination(destination)
     primary = dest_list[0]
     secondary = dest_list[1:]
+    primary_target_name = file_name_indiv
 
-    # Ensure primary dir exists
-    try:
-        os.makedirs(primary, exist_ok=True)
-    except Exception:
-        # best-effort; network paths may not allow mkdir
-        pass
+    # Ensure primary dir exists (best-effort; network paths may not allow mkdir)
+    ensure_dir(primary)
 
     try:
+        # Move the original to the primary destination (with optional transformation)
+        primary_target_name = file_name_indiv
+        if destination_transforms and len(destination_transforms) > 0 and destination_transforms[0]:
+            primary_target_name = apply_filename_transform(file_name_indiv, destination_transforms[0])
+        target = os.path.join(primary, primary_target_name)
+        stamp = ledger.fingerprint(source)
+
         # If there are secondary destinations, copy the file there first
         if secondary:
             # Extract transforms for secondary destinations (skip primary transform at index 0)
             secondary_transforms = None
             if destination_transforms and len(destination_transforms) > 1:
                 secondary_transforms = destination_transforms[1:]
-            _copy_to_destinations(source, secondary, secondary_transforms)
-
-        # Move the original to the primary destination (with optional transformation)
-        primary_target_name = file_name_indiv
-        if destination_transforms and len(destination_transforms) > 0 and destination_transforms[0]:
-            primary_target_name = _apply_filename_transform(file_name_indiv, destination_transforms[0])
-
-        shutil.move(source, os.path.join(primary, primary_target_name))
+            copies = [(ledger.COPY, t) for t in destination_targets(file_name_indiv, secondary, secondary_transforms)]
+            if not _same_filesystem(source, primary):
+                # moving to another filesystem is a copy too, so the one read feeds the primary as well
+                failures = _tee(source, [(ledger.MOVE, target)] + copies, stamp)
+                if target in failures:
+                    raise failures[target]
+                os.remove(source)
+                logger.success(f"Moved {file_name_indiv} to {primary} as {primary_target_name}")
+                return True
+            _tee(source, copies, stamp)
+
+        with ledger.operation(ledger.MOVE, source, target, stamp), host_slot(primary), \
+                profiling.span(profiling.MOVE, target):
+            shutil.move(source, target)
         logger.success(f"Moved {file_name_indiv} to {primary} as {primary_target_name}")
+        return True
     except FileExistsError:
         logger.critical(f"File {primary_target_name} already exists in {primary}")
     except FileNotFoundError:
+        invalidate(primary)
         logger.critical(f"File {file_name_indiv} not found in {source_dir}")
     except Exception as e:
+        invalidate(primary)
         logger.critical(f"Error: {e} with {file_name_indiv} in {source_dir}")
+    return False
 
 
 def extract_date_from_file_and_replace_date_in_destination(file_name: str, destination: Union[str, List[str]], date_formatting: str, date_formatting_dt: str, create_folder = True):
-    # check if "_" exists in date_formatting:
-    if " " in date_formatting: # checks for dates in MM DD YYYY format
-        regex_search = r"(\d{2}(\s)\d{2}(\s)\d{4})"
-    elif "_" not in date_formatting: # checks for dates in MMDDYYYY format
-        regex_search = r"(\d{"+str(len(date_formatting))+"})"
-    elif len(date_formatting) == 8: # checks for dates in MM_DD_YY format
-        regex_search = r"(\d{2}(_)\d{2}(_)\d{2})"
-    elif len(date_formatting) == 10: # checks for dates in MM_DD_YYYY format
-        regex_search = r"(\d{2}(_)\d{2}(_)\d{4})"
-            
-    match = re.search(regex_search, file_name)
-    if match:
-        date = match.group(0)
-        # convert date into date_formatting_dt
-        date = datetime.datetime.strptime(date, date_formatting_dt)
-        year = date.year
-        month = date.month
-        day = date.day
-
-        # destination may be a list; process each
-        dests = _ensure_list_destination(destination)
-        replaced = []
-        for dest in dests:
-            d = dest.replace("YYYY", str(year))
-            d = d.replace("YY", str(year)[2:])
-            d = d.replace("MM", str(month).zfill(2))
-            d = d.replace("DD", str(day).zfill(2))
-            if create_folder:
-                try:
-                    os.makedirs(d, exist_ok=True)
-                except Exception:
-                    # network paths might not allow mkdir; continue best-effort
-                    pass
-            replaced.append(d)
-        # if single dest return string for backward compatibility
-        if len(replaced) == 1:
-            return replaced[0], date
-        return replaced, date
-    return destination, None
-
-
-def move_inputs(data: dict, source_dir: str):
-    # setup the logging
-    for use_case, use_case_data in data.items():
-        file_name = use_case_data['inputs']['name']
-        destination = use_case_data['inputs']['destination']
-        destination_transforms = use_case_data['inputs'].get('destination_transforms')
-        has_date_formatting = True if use_case_data['inputs'].get(
-            'date_formatting') else False
-        files = glob(f"{source_dir}/{file_name}")
-        
-        if len(files) > 0:
-            logger.info(f'---------{use_case} inputs---------')
-            logger.info(f"Found {len(files)} files for {use_case}")
-            try:
+    # the format and destination templates are compiled once and the date is memoized per file
+    replaced, date = resolve_destinations(file_name, destination, date_formatting, date_formatting_dt)
+    if date is None:
+        return destination, None
+
+    if create_folder:
+        for d in replaced:
+            # network paths might not allow mkdir; continue best-effort
+            ensure_dir(d)
+    # if single dest return string for backward compatibility
+    if len(replaced) == 1:
+        return replaced[0], date
+    return replaced, date
+
+
+def _move_input_file(file: str, use_case: str, rule: Union[InputRule, dict], source_dir: str):
+    start = time.perf_counter()
+    try:
+        rule = InputRule.of(use_case, rule)
+        destination = rule.destination
+        if rule.date_formatting:
+            # resolve the date tokens per file, every file can carry its own date
+            destination, date = extract_date_from_file_and_replace_date_in_destination(
+                file, destination, rule.date_formatting, rule.date_formatting_dt)
+            if date is None:
+                logger.warning(f"Could not parse date from filename {file}; using unmodified destination")
+        # move_single_file now supports list destinations and transforms
+        if not move_single_file(file, destination, rule.destination_transforms):
+            metrics.count(INPUTS, use_case, errors=1)
+    except Exception as e:
+        metrics.count(INPUTS, use_case, errors=1)
+        logger.critical(f"Error: {e} with {file} in {source_dir}")
+    finally:
+        metrics.add_time(INPUTS, use_case, time.perf_counter() - start)
+
+
+def move_inputs(data: dict, source_dir: str, index: Optional[FileIndex] = None):
+    if index is None:
+        index = build_file_index(source_dir, inputs=data)
+    rules = rules_of(InputRule, data)
+    # files of every use case are moved side by side; host_slot keeps each share's load bounded
+    with TransferExecutor() as executor:
+        for use_case, rule in rules.items():
+            files = index.files(INPUTS, use_case)
+
+            if len(files) > 0:
+                logger.info(f'---------{use_case} inputs---------')
+                logger.info(f"Found {len(files)} files for {use_case}")
+                metrics.count(INPUTS, use_case, files=len(files), bytes=sum(index.size(f) for f in files))
                 for file in files:
-                    # check if use_case_data['inputs']['date_formatting'] exists
-                    if has_date_formatting:
-                        date_formatting = use_case_data['inputs']['date_formatting']
-                        date_formatting_dt = use_case_data['inputs']['date_formatting_dt']
-                        destination, date = extract_date_from_file_and_replace_date_in_destination(
-                            file, destination, date_formatting, date_formatting_dt)
-                        if date is None:
-                            logger.warning(f"Could not parse date from filename {file}; using unmodified destination")
-                    # move_single_file now supports list destinations and transforms
-                    move_single_file(file, destination, destination_transforms)
-            except Exception as e:
-                logger.critical(f"Error: {e} with {file} in {source_dir}")
-                continue
+                    executor.submit(_move_input_file, file, use_case, rule, source_dir)
 
 
-def lab_appeals_merged(data:dict, destination:str, date:datetime.datetime):
-    logger.info(f'----------lab appeals merged files---------')
-    # date may be a datetime; ensure it's valid
+def extract_merged(rule: OutputRule, destination: str, date: datetime.datetime):
+    """Extract the members of the use case's merged archive of date (outputs.json merged_archive) into destination."""
+    logger.info(f'----------{rule.use_case} merged files---------')
     if date is None:
-        logger.warning('No date provided to lab_appeals_merged; skipping')
+        logger.warning(f'No date for the {rule.use_case} merged archive; skipping')
         return
-    date_formatting_dt = data.get('date_formatting_dt', '%m_%d_%y')
+    merged = rule.merged_archive
+    if merged_index.extract_matching(merged.path_for(date), merged.members, destination) is None:
+        logger.critical(f'{rule.use_case} merged file not found for {date.strftime(rule.date_formatting_dt)}')
+
+
+def _drop_redropped(file: str, stage: str, use_case: Optional[str]) -> bool:
+    """Remove file when it is an exact copy of one already processed and archived; True when it was."""
+    archived = moved_archive.duplicate_of(file)
+    if archived is None:
+        return False
+    where = moved_archive.location(archived)
+    logger.warning(f'{os.path.basename(file)} was already processed on {archived["archived_at"]} and is archived '
+                   f'as {where}; removing the identical copy instead of processing it again')
+    size = archived["size"]
+    with ledger.operation(ledger.ARCHIVE, file, where):
+        os.remove(file)
+    metrics.count(REDROPPED, use_case or stage, files=1, bytes=size)
+    return True
 
-    merged_date = date.strftime('%m_%d_%y')
-    merged_date_full_year = date.strftime('%m_%d_%Y')
-    merged_path = f'\\\\NT2KWB972SRV03\\SHAREDATA\\CPP-Data\\Sutherland RPA\\Northwell Process Automation ETM Files\\GOA\\Lab Appeals\\{merged_date}\\Labappeals_{merged_date_full_year}.zip'
-    try:
-        zf = ZipFile(merged_path)
-        folders = [m for m in zf.namelist() if not m.endswith("/") and "_Merged" in m]
-        for folder in folders:
-            zf.extract(folder, destination)
-    except FileNotFoundError:
-        logger.critical(f'Lab Appeals Merged file not found for {date.strftime(date_formatting_dt)}')
 
 def archive_folder(file, source_dir, date):
      # move the folder to the moved folder
-    file_name = file.split('\\')[-1]
+    file_name = os.path.basename(file)
     pre_moved_folder_path = f'{source_dir}/{file_name}'
-    moved_folder_date = date.strftime('%Y %m')
-    moved_folder_dir = f'{source_dir}/moved/{moved_folder_date}/'
+    moved_folder_dir, moved_path = moved_target(file, source_dir, date)
     # make folder if not exists
-    os.makedirs(moved_folder_dir, exist_ok=True)
-    moved_folder_dir = f'{moved_folder_dir}/{file_name}'
+    ensure_dir(moved_folder_dir)
+    moved_folder_dir = moved_path
     logger.debug(f'Moving folder from {pre_moved_folder_path} to {moved_folder_dir}')
 
     try:
-        os.rename(pre_moved_folder_path, moved_folder_dir)
+        with ledger.operation(ledger.ARCHIVE, file, moved_folder_dir), profiling.span(profiling.MOVE, moved_folder_dir):
+            os.rename(pre_moved_folder_path, moved_folder_dir)
+        moved_archive.record(moved_folder_dir, moved_root(source_dir), date)
     except FileExistsError:
         logger.warning(f'{moved_folder_dir} already exists')
     except PermissionError:
         logger.critical(f'Permission denied to move {pre_moved_folder_path}')
 
-def move_outputs(data: dict, source_dir: str):
-    for use_case, use_case_data in data.items():
-        files = glob(os.path.join(source_dir, use_case_data['zip_name']))
-        
-        if len(files) == 0:
-            continue
+class ExtractedZip:
+    """An output zip that is extracted (now or by an earlier run) and still has to be verified and archived."""
+
+    __slots__ = ("file", "use_case", "source_dir", "primary_dest", "date", "plan", "written")
+
+    def __init__(self, file: str, use_case: str, source_dir: str, primary_dest: str, date: datetime.datetime,
+                 plan: ZipPlan, written: dict):
+        self.file = file
+        self.use_case = use_case
+        self.source_dir = source_dir
+        self.primary_dest = primary_dest
+        self.date = date
+        self.plan = plan
+        self.written = written
+
+    def __repr__(self):
+        return f"ExtractedZip({self.file!r} -> {self.primary_dest!r})"
+
+
+def _extract_output_file(file: str, use_case: str, rule: Union[OutputRule, dict],
+                         source_dir: str) -> Optional[ExtractedZip]:
+    """Copy an output zip to its archive destinations and extract it into its dated primary folder.
+
+    Returns None when there is nothing left to verify (no date in the name,
+    a folder that is not ours, or an error, which is logged).
+    """
+    start = time.perf_counter()
+    spool_dir = None
+    try:
+        rule = OutputRule.of(use_case, rule)
+        if _drop_redropped(file, OUTPUTS, use_case):
+            return
+        # get the date from the file name so it can be used for the destination folder
+        date_formatting = rule.date_formatting
+        date_formatting_dt = rule.date_formatting_dt
+        destination = rule.destination
+        destination, date = extract_date_from_file_and_replace_date_in_destination(
+            file, destination, date_formatting, date_formatting_dt)
+
+        # normalize destinations
+        dest_list = _ensure_list_destination(destination)
+        primary_dest = dest_list[0]
+        secondary_dests = dest_list[1:]
+
+        if date is None:
+            logger.warning(f"Could not parse date from filename {file}; skipping")
+            return
+
+        primary_dest = output_folder(use_case, rule, primary_dest, date)
+
+        # the ledger tells a finished or interrupted extraction apart from a folder made by someone else
+        stamp = ledger.fingerprint(file)
+        extract_status = ledger.status(ledger.EXTRACT, file, primary_dest, stamp)
+        if extract_status == ledger.PLANNED:
+            logger.warning(f'Resuming interrupted extraction of {file} into {primary_dest}')
+        elif extract_status != ledger.DONE and dir_exists(primary_dest):
+            logger.warning(f'{primary_dest} already exists')
+
+            # delete the file
+            # os.remove(file)
+            return
+
+        # If there are secondary destinations, copy the original zip there for archival.
+        # When it still has to be extracted, the same single read of the zip also fills a
+        # local spool copy, and the extraction reads that instead of the inputs share.
+        zip_source = file
+        if secondary_dests:
+            archives = [(ledger.COPY, target) for target in destination_targets(os.path.basename(file), secondary_dests)]
+            if extract_status == ledger.DONE:
+                _tee(file, archives, stamp)
+            else:
+                spool_dir = tempfile.mkdtemp(prefix='goa_spool_')
+                spool = os.path.join(spool_dir, os.path.basename(file))
+                if spool not in _tee(file, [(None, spool)] + archives, stamp):
+                    zip_source = spool
+
+        # read the central directory once, then unzip the files into the primary destination
+        plan = ZipPlan.read(zip_source)
+        logger.info(f'Found {plan.folder_count} folders and {plan.file_count} files in the zip file')
+        written = {}
+        if extract_status == ledger.DONE:
+            logger.info(f'{file} was already extracted into {primary_dest}')
         else:
-            logger.info(f'---------{use_case} outputs---------')
-            logger.info(f"Found {len(files)} output files for {use_case}")
-        
-            try:
-                for file in files:
-                    # get the date from the file name so it can be used for the destination folder
-                    date_formatting = use_case_data['date_formatting']
-                    date_formatting_dt = use_case_data['date_formatting_dt']
-                    destination = use_case_data['destination']
-                    destination, date = extract_date_from_file_and_replace_date_in_destination(
-                        file, destination, date_formatting, date_formatting_dt)
-
-                    # normalize destinations
-                    dest_list = _ensure_list_destination(destination)
-                    primary_dest = dest_list[0]
-                    secondary_dests = dest_list[1:]
-
-                    if date is None:
-                        logger.warning(f"Could not parse date from filename {file}; skipping")
-                        continue
-
-                    if use_case == 'chargecorrection':
-                        fldr_frmt = '%m%d%Y'
-                        primary_dest = f'{primary_dest}{date.strftime(fldr_frmt)}/'
-                    primary_dest = f'{primary_dest}{date.strftime(date_formatting_dt)}'
-
-                    # check if destination folder exists
-                    if os.path.exists(primary_dest):
-                        logger.warning(f'{primary_dest} already exists')
-                                               
-                        # delete the file
-                        # os.remove(file)
-                        continue
-
-                    # unzip the files and move them to the primary destination
-                    with open(file, 'rb') as src:
-                        zf = ZipFile(src)
-                        folder_count = [m for m in zf.infolist() if m.filename.endswith("/")].__len__()
-                        file_count = [m for m in zf.infolist() if not m.filename.endswith("/")].__len__()
-                        logger.info(f'Found {folder_count} folders and {file_count} files in the zip file')
-                        single_files = [m for m in zf.infolist() if not m.filename.endswith("/")]
-                        file_names = [m.filename.split('/')[-1] for m in single_files]
-                        folder_names = [m.filename.split('/')[0] for m in zf.infolist()]
-                        for single_file in single_files:
-                            zf.extract(single_file, primary_dest)
-                        zf.close()
-
-                    # If there are secondary destinations, copy the original zip there for archival
-                    if secondary_dests:
-                        _copy_to_destinations(file, secondary_dests)
-
-                    if use_case == 'lab_appeals':
-                        # pass the primary destination and date
-                        lab_appeals_merged(use_case_data, primary_dest, date)
-
-                    # confirm the destination folder has all the correct files and folders
-                    new_file_names = []
-                    new_subdir_names = []
-                    for _, subdirs, files in os.walk(primary_dest):
-                        new_file_names += files
-                        new_subdir_names += subdirs
-                    
-                    logger.info(f'Found {len(new_subdir_names)} folders and {len(new_file_names)} files in the zip file')
-                    logger.debug(f'Missing files: {set(file_names) - set(new_file_names) if set(file_names) - set(new_file_names) else "None"}')
-                    logger.debug(f'Missing folders: {set(folder_names) - set(new_subdir_names) if set(folder_names) - set(new_subdir_names) else "None"}')
-
-                    if len(new_file_names) >= file_count and len(new_subdir_names) >= folder_count:
-                        if len(new_file_names) == file_count and len(new_subdir_names) == folder_count:
-                            logger.success(f'Moved {folder_count} folders and {file_count} files into the destination')
-                            logger.info(f'New folder contains {len(new_subdir_names)} folders and {len(new_file_names)} files into the destination')
-                        else:
-                            logger.warning(f'Moved {folder_count} folders and {file_count} files into the destination')
-                            logger.info(f'New folder contains {len(new_subdir_names)} folders and {len(new_file_names)} files into the destination')
-                        archive_folder(file, source_dir, date)
-                       
-                    elif len(new_file_names) < file_count:
-                        logger.critical(f"Failed to move all files to {primary_dest}")
-                        logger.critical(f"Expected {file_count} files but only found {len(new_file_names)}")
-                    elif len(new_subdir_names) < folder_count:
-                        if len(new_file_names) == file_count:
-                            logger.info(f'Empty folder not transferred')
-                            # move the folder to the moved folder
-                            archive_folder(file, source_dir, date)
-                        else:
-                            logger.critical(f"Failed to move all subdirectories to {primary_dest}")
-            except Exception as e:
-                logger.critical(f"Error: {e} with {file} in {source_dir}")
-                continue
+            ledger.record(ledger.EXTRACT, file, primary_dest, stamp, ledger.PLANNED)
+            with metrics.timer(EXTRACT, use_case):
+                written = extract_zip(file, plan, primary_dest, stamp, read_from=zip_source)
+            metrics.count(EXTRACT, use_case, files=plan.file_count, bytes=plan.total_bytes)
+            ledger.record(ledger.EXTRACT, file, primary_dest, stamp, ledger.DONE)
+
+        if rule.merged_archive is not None:
+            extract_merged(rule, primary_dest, date)
+        return ExtractedZip(file, use_case, source_dir, primary_dest, date, plan, written)
+    except Exception as e:
+        metrics.count(OUTPUTS, use_case, errors=1)
+        logger.critical(f"Error: {e} with {file} in {source_dir}")
+        return None
+    finally:
+        if spool_dir is not None:
+            shutil.rmtree(spool_dir, ignore_errors=True)
+        metrics.add_time(OUTPUTS, use_case, time.perf_counter() - start)
 
-def parse_output_files(data:dict, source_dir:str):
-    
-    lab_outputs = glob(source_dir + "/Labappeals Output*.xlsx")
-    if len(lab_outputs) > 0:
-        logger.info(f'parsing lab appeals output file')
-        for output_file in lab_outputs:
-            destination, date = extract_date_from_file_and_replace_date_in_destination(
-                output_file,
-                '\\NASDATA201\\SHAREDATA\\NSHS-CENTRAL-LAB\\SHARED\\BILLING\\RPA Medical Records Denials\\Bot Output Files',
-                'MM DD YYYY',
-                '%m %d %Y',
-                create_folder=False,
-            )
-            if date is None:
-                logger.warning(f"Could not parse date from filename {output_file}; skipping lab appeals move")
-                continue
-            dest_list = _ensure_list_destination(destination)
-            primary_dest = dest_list[0]
-            file_name_base = os.path.basename(output_file).split(' - ')[0]
-            file_name = file_name_base + " - " + date.strftime('%m%d%Y') + ".xlsx"
-            shutil.move(output_file, f'{primary_dest}/{file_name}')
-    
-    output_files = glob(source_dir + "/Outbound*.xlsx")
-    for output_file in output_files:
-        try:
-            main = pd.read_excel(output_file, sheet_name=0)
-            output_file_dest = output_file.replace(source_dir, '\\\\NT2KWB972SRV03\\SHAREDATA\\CPP-Data\\Sutherland RPA\\Combined Outputs')
-            for use_case, use_case_data in data.items():
-                logger.info(f'parsing output file for {use_case}')
-                df = main[main['BotName'] == use_case_data['BotName']]
 
-                date_formatting = 'MMDDYYYY'
-                date_formatting_dt = '%m%d%Y'
+def _verify_output_file(extracted: ExtractedZip) -> bool:
+    """Confirm every file in the zip's manifest reached the destination intact.
+
+    Empty folders in the zip are not recreated and are not checked.
+    """
+    plan, primary_dest, use_case = extracted.plan, extracted.primary_dest, extracted.use_case
+    try:
+        with metrics.timer(VERIFY, use_case):
+            verification = verify_extraction(plan, primary_dest, extracted.written)
+    except Exception as e:
+        metrics.count(OUTPUTS, use_case, errors=1)
+        logger.critical(f"Error: {e} verifying {extracted.file} in {primary_dest}")
+        return False
+
+    if verification.ok:
+        logger.success(f'Moved {plan.file_count} files into {primary_dest}')
+        return True
+    metrics.count(OUTPUTS, use_case, errors=1)
+    logger.critical(f"Failed to move all files to {primary_dest}")
+    if verification.missing:
+        logger.critical(f"Missing {len(verification.missing)} of {verification.checked} files: {verification.missing}")
+    if verification.corrupt:
+        logger.critical(f"Corrupt {len(verification.corrupt)} of {verification.checked} files: {verification.corrupt}")
+    return False
+
+
+def _archive_output_file(extracted: ExtractedZip):
+    try:
+        archive_folder(extracted.file, extracted.source_dir, extracted.date)
+    except Exception as e:
+        metrics.count(OUTPUTS, extracted.use_case, errors=1)
+        logger.critical(f"Error: {e} with {extracted.file} in {extracted.source_dir}")
+
 
-                destination, date = extract_date_from_file_and_replace_date_in_destination(
-                    output_file, use_case_data['destination'], date_formatting, date_formatting_dt
-                )
+def _move_output_file(file: str, use_case: str, rule: Union[OutputRule, dict], source_dir: str):
+    extracted = _extract_output_file(file, use_case, rule, source_dir)
+    if extracted is not None and _verify_output_file(extracted):
+        _archive_output_file(extracted)
 
-                if date is None:
-                    logger.warning(f"Could not parse date from filename {output_file} for {use_case}; skipping")
-                    continue
 
-                dest_list = _ensure_list_destination(destination)
-                primary_dest = dest_list[0]
-                secondary = dest_list[1:]
-
-                date_format = use_case_data['date_format'].replace("YYYY", str(date.year)).replace("MM", str(date.month).zfill(2)).replace("DD", str(date.day).zfill(2))
-                file_name = use_case_data['file_name'].replace(use_case_data['date_format'], date_format)
-                folder = primary_dest
-                destination_path = os.path.join(primary_dest, file_name)
-                if os.path.exists(folder) and df.shape[0] > 0 and not os.path.exists(destination_path):
-                    df.to_excel(destination_path, index=False, sheet_name='export')
-                    # copy the saved file to any secondary destinations
-                    if secondary:
-                        _copy_to_destinations(destination_path, secondary)
-                elif not os.path.exists(folder):
-                    logger.error(f"Destination folder {folder} does not exist for {use_case}")
-                    continue
-                elif df.shape[0] == 0:
-                    logger.warning(f"No data found for {use_case} in {output_file}")
-                    continue
-        except Exception as e:
-            logger.critical(f"Error: {e} with {output_file} in {source_dir}")
-            continue
-        finally:
-            try:
-                shutil.move(output_file, output_file_dest)
-            except Exception as e:
-                logger.warning(f"Failed to move processed output file {output_file} to {output_file_dest}: {e}")
+def move_outputs(data: dict, source_dir: str, index: Optional[FileIndex] = None):
+    if index is None:
+        index = build_file_index(source_dir, outputs=data)
+    rules = rules_of(OutputRule, data)
+    with TransferExecutor() as executor:
+        for use_case, rule in rules.items():
+            files = index.files(OUTPUTS, use_case)
+
+            if len(files) == 0:
+                continue
+            else:
+                logger.info(f'---------{use_case} outputs---------')
+                logger.info(f"Found {len(files)} output files for {use_case}")
+                metrics.count(OUTPUTS, use_case, files=len(files), bytes=sum(index.size(f) for f in files))
+
+            for file in files:
+                executor.submit(_move_output_file, file, use_case, rule, source_dir)
+
+def _move_lab_output(output_file: str):
+    target = lab_output_target(output_file)
+    if target is None:
+        logger.warning(f"Could not parse date from filename {output_file}; skipping lab appeals move")
+        return
+    with ledger.operation(ledger.MOVE, output_file, target), profiling.span(profiling.MOVE, target):
+        shutil.move(output_file, target)
+
 
+def parse_output_files(data:dict, source_dir:str, index: Optional[FileIndex] = None, deferred: Iterable[str] = ()):
+    if index is None:
+        index = build_file_index(source_dir, shs=data)
 
+    lab_outputs = index.files(LAB_OUTPUTS)
+    if len(lab_outputs) > 0:
+        logger.info(f'parsing lab appeals output file')
+        metrics.count(LAB_OUTPUTS, files=len(lab_outputs), bytes=sum(index.size(f) for f in lab_outputs))
+        for output_file in lab_outputs:
+            _move_lab_output(output_file)
     
-def parse_epic_output_files(data: dict, source_dir: str):
+    for output_file in index.files(OUTBOUND):
+        metrics.count(OUTBOUND, files=1, bytes=index.size(output_file))
+        split_outbound_workbook(output_file, data, source_dir, deferred=deferred)
+
+
+def parse_epic_output_files(data: dict, source_dir: str, index: Optional[FileIndex] = None,
+                            deferred: Iterable[str] = ()):
     """Parse EPIC_Outbound*.xlsx and distribute sheets per mapping.
 
     This mirrors parse_output_files but targets files named EPIC_Outbound*.xlsx
     and uses the provided mapping (typically loaded from epic_outbound_shs.json).
     """
-    epic_output_files = glob(os.path.join(source_dir, "EPIC_Outbound*.xlsx"))
-    for output_file in epic_output_files:
-        try:
-            main = pd.read_excel(output_file, sheet_name=0)
-            output_file_dest = output_file.replace(
-                source_dir,
-                "\\\\NT2KWB972SRV03\\SHAREDATA\\CPP-Data\\Sutherland RPA\\Combined Outputs",
-            )
+    if index is None:
+        index = build_file_index(source_dir, epic_shs=data)
+    for output_file in index.files(EPIC_OUTBOUND):
+        metrics.count(EPIC_OUTBOUND, files=1, bytes=index.size(output_file))
+        split_outbound_workbook(output_file, data, source_dir, label='EPIC output', stage=EPIC_OUTBOUND,
+                                deferred=deferred)
 
-            for use_case, use_case_data in data.items():
-                logger.info(f'parsing EPIC output file for {use_case}')
-                df = main[main['BotName'] == use_case_data['BotName']]
 
-                # EPIC outbound files also use MMDDYYYY in filename
-                date_formatting = 'MMDDYYYY'
-                date_formatting_dt = '%m%d%Y'
+def _write_split(df, use_case: str, output_file: str, stamp: ledger.Stamp, destination_path: str, secondary: List[str]):
+    try:
+        with metrics.timer(EXCEL_WRITE, use_case), \
+                ledger.operation(ledger.SPLIT, output_file, destination_path, stamp), host_slot(destination_path), \
+                profiling.span(profiling.WRITE, destination_path):
+            write_workbook(df, destination_path, sheet_name='export')
+    except Exception:
+        metrics.count(EXCEL_WRITE, use_case, errors=1)
+        invalidate(os.path.dirname(destination_path))
+        raise
+    # copy the saved file to any secondary destinations
+    if secondary:
+        _copy_to_destinations(destination_path, secondary)
+
+
+def split_outbound_workbook(output_file: str, data: dict, source_dir: str, label: str = 'output',
+                            stage: str = OUTBOUND, deferred: Iterable[str] = ()):
+    """Split a combined Outbound workbook into one workbook per BotName mapping.
 
-                destination, date = extract_date_from_file_and_replace_date_in_destination(
-                    output_file, use_case_data['destination'], date_formatting, date_formatting_dt
-                )
+    The workbook is read once and grouped by BotName in a single pass. Every
+    mapped group is written to its use case's destination (writes run in
+    parallel), rows whose BotName has no mapping are reported, and the combined
+    file is then moved to the Combined Outputs folder.
+
+    Args:
+        output_file: Path of the combined workbook.
+        data: BotName mapping, loaded from outbound_shs.json or epic_outbound_shs.json.
+        source_dir: Inputs folder the workbook was found in.
+        label: Name used in log messages ("output" or "EPIC output").
+        stage: Stage the run metrics are recorded under.
+        deferred: Use cases whose share is down. They are not written, and the
+            combined file stays in the inputs folder so a later run can finish them.
+    """
+    deferred = set(deferred)
+    rules = rules_of(SplitRule, data)
+    output_file_dest = output_file.replace(source_dir, COMBINED_OUTPUTS_DIR)
+    try:
+        if _drop_redropped(output_file, stage, None):
+            return
+    except Exception as e:
+        metrics.count(stage, errors=1)
+        logger.critical(f"Error: {e} checking whether {output_file} was already processed")
+        return
+    try:
+        stamp = ledger.fingerprint(output_file)
+        with metrics.timer(EXCEL_READ, stage):
+            main = read_workbook(output_file)
+        groups = {bot_name: df for bot_name, df in main.groupby('BotName', sort=False, dropna=False)}
+
+        mapped_bot_names = {rule.bot_name for rule in rules.values()}
+        unmapped = {bot_name: len(df) for bot_name, df in groups.items() if bot_name not in mapped_bot_names}
+        if unmapped:
+            logger.warning(f"{sum(unmapped.values())} rows in {output_file} have no BotName mapping: {unmapped}")
+
+        with TransferExecutor() as executor:
+            for use_case, rule in rules.items():
+                if use_case in deferred:
+                    logger.warning(f"Deferring {use_case} from {output_file}, its destination share is down")
+                    continue
+                logger.info(f'parsing {label} file for {use_case}')
+                df = groups.get(rule.bot_name)
+                row_count = 0 if df is None else df.shape[0]
 
+                destination_path, secondary, date = split_targets(output_file, rule)
                 if date is None:
                     logger.warning(f"Could not parse date from filename {output_file} for {use_case}; skipping")
                     continue
+                folder = os.path.dirname(destination_path)
+                ensure_dir(folder)
 
-                dest_list = _ensure_list_destination(destination)
-                primary_dest = dest_list[0]
-                secondary = dest_list[1:]
-
-                date_format = (
-                    use_case_data['date_format']
-                    .replace("YYYY", str(date.year))
-                    .replace("MM", str(date.month).zfill(2))
-                    .replace("DD", str(date.day).zfill(2))
-                )
-                file_name = use_case_data['file_name'].replace(use_case_data['date_format'], date_format)
-                folder = primary_dest
-                destination_path = os.path.join(primary_dest, file_name)
-
-                if os.path.exists(folder) and df.shape[0] > 0 and not os.path.exists(destination_path):
-                    df.to_excel(destination_path, index=False, sheet_name='export')
-                    # copy the saved file to any secondary destinations
-                    if secondary:
-                        _copy_to_destinations(destination_path, secondary)
-                elif not os.path.exists(folder):
+                if ledger.is_done(ledger.SPLIT, output_file, destination_path, stamp):
+                    logger.info(f"{use_case} was already split from {output_file} into {destination_path}")
+                    continue
+
+                if dir_exists(folder) and row_count > 0 and not os.path.exists(destination_path):
+                    executor.submit(_write_split, df, use_case, output_file, stamp, destination_path, secondary)
+                elif not dir_exists(folder):
                     logger.error(f"Destination folder {folder} does not exist for {use_case}")
                     continue
-                elif df.shape[0] == 0:
+                elif row_count == 0:
                     logger.warning(f"No data found for {use_case} in {output_file}")
                     continue
-        except Exception as e:
-            logger.critical(f"Error: {e} with {output_file} in {source_dir}")
-            continue
-        finally:
+    except Exception as e:
+        metrics.count(stage, errors=1)
+        logger.critical(f"Error: {e} with {output_file} in {source_dir}")
+    finally:
+        if deferred & rules.keys():
+            # the finished splits are in the ledger, a later run only writes the deferred ones
+            logger.info(f"Leaving {output_file} in {source_dir} until the deferred use cases are written")
+        else:
             try:
-                shutil.move(output_file, output_file_dest)
+                with profiling.span(profiling.MOVE, output_file_dest):
+                    shutil.move(output_file, output_file_dest)
+                moved_archive.record(output_file_dest, COMBINED_OUTPUTS_DIR, outbound_date(output_file))
             except Exception as e:
-                logger.warning(f"Failed to move processed EPIC output file {output_file} to {output_file_dest}: {e}")
+                logger.warning(f"Failed to move processed {label} file {output_file} to {output_file_dest}: {e}")
+
+
+def distribute(index: FileIndex, rules: Rules, source_dir: str, deferred: Optional[Dict[str, dict]] = None,
+               plan: Optional[Plan] = None, budget: Optional[Budget] = None):
+    """Distribute every indexed file with all stages running at once.
+
+    discover -> classify -> transfer (input files, lab outputs)
+                         -> extract -> verify -> archive (output zips)
+                         -> split (Outbound workbooks)
 
+    Every stage has its own workers and a bounded queue in front of it, so the
+    CPU-bound Excel splits run while network copies and zip extractions are in
+    flight, and a stage that falls behind holds back the one feeding it.
 
+    The files are resolved to their destinations first (see planner.plan, or
+    pass the plan). Zips and workbooks are discovered largest first, so a long
+    extraction or split is not queued behind hundreds of small input moves;
+    the transfers follow in batches of one destination folder each.
+    deferred is share_health.deferred_use_cases(): use cases whose share is down.
+    With a budget, a file is only transferred, extracted or split while its
+    size (and the workbook it is read into) fits in it.
+    """
+    deferred = deferred or {}
+    if plan is None:
+        plan = plan_transfers(index, rules, source_dir, deferred)
+
+    def held(planned: PlannedFile, workbooks: int = 0):
+        return budget.hold(planned.size, workbooks) if budget is not None else nullcontext()
+
+    def classify(item, emit):
+        planned_files = item.files if isinstance(item, Batch) else [item]
+        for planned in planned_files:
+            stage = planned.stage
+            metrics.count(stage, None if stage in (OUTBOUND, EPIC_OUTBOUND, LAB_OUTPUTS) else planned.use_case,
+                          files=1, bytes=planned.size)
+        if isinstance(item, Batch):
+            emit("transfer", item)
+        elif item.stage == OUTPUTS:
+            emit("extract", item)
+        else:
+            emit("split", item)
+
+    def transfer(batch: Batch, emit):
+        # one worker takes a whole folder, the files follow each other on a warm connection
+        for planned in batch.files:
+            # the share log summarizes per-file messages by use case
+            with held(planned), logger.contextualize(use_case=planned.use_case):
+                if planned.stage == INPUTS:
+                    _move_input_file(planned.source, planned.use_case, rules.inputs[planned.use_case], source_dir)
+                    continue
+                try:
+                    _move_lab_output(planned.source)
+                except Exception as e:
+                    metrics.count(LAB_OUTPUTS, errors=1)
+                    logger.critical(f"Error: {e} with {planned.source} in {source_dir}")
+
+    def extract(planned: PlannedFile, emit):
+        with held(planned), logger.contextualize(use_case=planned.use_case):
+            extracted = _extract_output_file(planned.source, planned.use_case, rules.outputs[planned.use_case],
+                                             source_dir)
+        if extracted is not None:
+            emit("verify", extracted)
+
+    def verify(extracted, emit):
+        with logger.contextualize(use_case=extracted.use_case):
+            verified = _verify_output_file(extracted)
+        if verified:
+            emit("archive", extracted)
+
+    def archive(extracted, emit):
+        _archive_output_file(extracted)
+
+    def split(planned: PlannedFile, emit):
+        with held(planned, workbooks=1):
+            if planned.stage == OUTBOUND:
+                split_outbound_workbook(planned.source, rules.shs, source_dir, deferred=deferred.get("shs", ()))
+            else:
+                split_outbound_workbook(planned.source, rules.epic_shs, source_dir, label='EPIC output',
+                                        stage=EPIC_OUTBOUND, deferred=deferred.get("epic_shs", ()))
+
+    workers = max_workers()
+    Pipeline([
+        make_stage("classify", classify),
+        make_stage("transfer", transfer, workers),
+        make_stage("extract", extract, workers),
+        make_stage("verify", verify, 2),
+        make_stage("archive", archive),
+        # pandas holds the GIL for most of a split, more workers would only compete for it
+        make_stage("split", split),
+    ]).run(plan.heavy() + plan.batches(), "classify")
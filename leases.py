@@ -0,0 +1,232 @@
+import json
+import os
+import socket
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+from loguru import logger
+
+from file_index import FileIndex, PatternMatcher
+
+
+# folder in the inputs folder that holds the lease files; hidden, so it is never distributed
+LEASE_DIR = ".leases"
+LEASE_SUFFIX = ".lease"
+# with a single worker only this lease is taken, for the whole run instead of per file
+RUN_LEASE = ".run"
+
+DEFAULT_LEASE_SECONDS = 300.0
+
+SHARD_BY_HASH = "hash"
+SHARD_BY_USE_CASE = "use_case"
+
+_settings = {
+    "enabled": True,
+    "lease_seconds": DEFAULT_LEASE_SECONDS,
+    "workers": 1,
+    "worker_index": 0,
+    "shard_by": SHARD_BY_HASH,
+    "steal": True,
+}
+
+
+def configure(enabled: bool = None, lease_seconds: float = None, workers: int = None, worker_index: int = None,
+              shard_by: str = None, steal: bool = None):
+    """Set up this process as worker worker_index of workers draining the same inputs folder."""
+    if shard_by is not None and shard_by not in (SHARD_BY_HASH, SHARD_BY_USE_CASE):
+        raise ValueError(f"workers.shard_by must be {SHARD_BY_HASH} or {SHARD_BY_USE_CASE}, not {shard_by!r}")
+    for name, value in (("enabled", enabled), ("lease_seconds", lease_seconds), ("workers", workers),
+                        ("worker_index", worker_index), ("shard_by", shard_by), ("steal", steal)):
+        if value is not None:
+            _settings[name] = value
+    if not 0 <= _settings["worker_index"] < max(1, _settings["workers"]):
+        raise ValueError(f"worker_index {_settings['worker_index']} is not below workers {_settings['workers']}")
+
+
+def lease_seconds() -> float:
+    """How long a lease lasts without renewal, as configured."""
+    return _settings["lease_seconds"]
+
+
+def worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def shard_of(key: str, workers: int) -> int:
+    """The worker a key belongs to; the same on every host and Python version."""
+    return zlib.crc32(key.encode("utf-8")) % max(1, workers)
+
+
+class LeaseManager:
+    """Leases on files of an inputs folder, one lock file per claimed file.
+
+    A claim creates <lease_dir>/<name>.lease with O_CREAT | O_EXCL, which only
+    one process can do, on one host or over SMB. While held, leases are
+    renewed (their mtime touched) every third of lease_seconds by a
+    heartbeat thread. A lease not renewed for lease_seconds belongs to a
+    worker that died: it is reclaimed by renaming it to a name of our own
+    (only one worker's rename succeeds) and claiming the file again.
+    """
+
+    def __init__(self, lease_dir: str, lease_seconds: float = DEFAULT_LEASE_SECONDS, owner: Optional[str] = None):
+        self.lease_dir = lease_dir
+        self.lease_seconds = lease_seconds
+        self.owner = owner or worker_id()
+        self.held: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._heartbeat: Optional[threading.Thread] = None
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.lease_dir, name + LEASE_SUFFIX)
+
+    def _stale(self, path: str) -> bool:
+        try:
+            return time.time() - os.path.getmtime(path) > self.lease_seconds
+        except FileNotFoundError:
+            return False
+
+    def _owner_of(self, path: str) -> Optional[str]:
+        try:
+            with open(path) as file:
+                return json.load(file).get("owner")
+        except (OSError, ValueError):
+            return None
+
+    def claim(self, name: str) -> bool:
+        """Take the lease on name; False when another live worker holds it."""
+        path = self._path(name)
+        os.makedirs(self.lease_dir, exist_ok=True)
+        for _ in range(2):
+            try:
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                if not self._stale(path) or not self._reclaim(path):
+                    return False
+                continue
+            with os.fdopen(fd, "w") as file:
+                json.dump({"owner": self.owner, "claimed_at": time.time()}, file)
+            with self._lock:
+                self.held[name] = path
+            return True
+        return False
+
+    def _reclaim(self, path: str) -> bool:
+        # the rename is the arbiter: of all workers that saw the stale lease, one gets it
+        dead = f"{path}.{self.owner}.stale"
+        try:
+            os.rename(path, dead)
+        except OSError:
+            return False
+        if not self._stale(dead):
+            # renewed between the check and the rename: it was alive after all, give it back
+            try:
+                os.rename(dead, path)
+            except OSError:
+                pass
+            return False
+        logger.warning(f"Reclaimed the stale lease of {self._owner_of(dead)} on {os.path.basename(path)}")
+        try:
+            os.remove(dead)
+        except OSError:
+            pass
+        return True
+
+    def release(self, name: str):
+        with self._lock:
+            path = self.held.pop(name, None)
+        if path is None:
+            return
+        if self._owner_of(path) != self.owner:
+            logger.warning(f"The lease on {name} was taken over by another worker")
+            return
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def release_all(self):
+        for name in list(self.held):
+            self.release(name)
+
+    def renew(self):
+        """Touch every held lease so no other worker takes it as stale."""
+        with self._lock:
+            held = dict(self.held)
+        for name, path in held.items():
+            try:
+                os.utime(path)
+            except OSError as e:
+                logger.warning(f"Could not renew the lease on {name}: {e}")
+
+    def _beat(self):
+        while not self._stop.wait(self.lease_seconds / 3):
+            self.renew()
+
+    def __enter__(self) -> "LeaseManager":
+        self._stop.clear()
+        self._heartbeat = threading.Thread(target=self._beat, name="lease-heartbeat", daemon=True)
+        self._heartbeat.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join()
+        self.release_all()
+
+
+def shard_order(index: FileIndex, workers: int, worker_index: int, shard_by: str = SHARD_BY_HASH,
+                steal: bool = True) -> List[str]:
+    """The file names this worker tries to claim: its own shard, then (with steal) everyone else's.
+
+    Sharding by use case keeps a use case's files, and so their destination
+    folders, on one worker; by hash spreads single busy use cases as well.
+    """
+    own, others = [], []
+    for name in index.file_names:
+        routes = index.routes(name)
+        key = routes[0][1] if shard_by == SHARD_BY_USE_CASE and routes else name
+        (own if shard_of(key, workers) == worker_index else others).append(name)
+    return own + others if steal else own
+
+
+@contextmanager
+def claimed(index: FileIndex, matcher: PatternMatcher) -> Iterator[FileIndex]:
+    """The part of index this worker holds leases on, for the duration of the block.
+
+    Files already gone from the folder by the time they are claimed (another
+    worker finished them) are left out. With leases disabled the index is
+    returned unchanged. A single worker (workers is 1) takes no per-file
+    leases, only one lease on the whole run, so an overlapping scheduled run
+    gets nothing instead of costing three share round trips per file.
+    """
+    if not _settings["enabled"]:
+        yield index
+        return
+    manager = LeaseManager(os.path.join(index.source_dir, LEASE_DIR), _settings["lease_seconds"])
+    if _settings["workers"] <= 1:
+        with manager:
+            if manager.claim(RUN_LEASE):
+                yield index
+            else:
+                logger.info(f"Another run is draining {index.source_dir}")
+                yield FileIndex(index.source_dir, [], matcher, {})
+        return
+    with manager:
+        names = []
+        for name in shard_order(index, _settings["workers"], _settings["worker_index"], _settings["shard_by"],
+                                _settings["steal"]):
+            if not manager.claim(name):
+                continue
+            if os.path.exists(os.path.join(index.source_dir, name)):
+                names.append(name)
+            else:
+                manager.release(name)
+        skipped = len(index.file_names) - len(names)
+        if skipped:
+            logger.info(f"{skipped} files are claimed by other workers or already done")
+        yield FileIndex(index.source_dir, names, matcher, {name: index.sizes.get(name, 0) for name in names})
@@ -0,0 +1,162 @@
+import datetime
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+
+from loguru import logger
+
+import profiling
+
+
+# operation kinds
+MOVE = "move"
+COPY = "copy"
+EXTRACT = "extract"
+SPLIT = "split"
+ARCHIVE = "archive"
+
+# operation states
+PLANNED = "planned"
+DONE = "done"
+FAILED = "failed"
+
+# (size, mtime) of a source file when the operation was planned
+Stamp = Tuple[int, float]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS operations (
+    kind TEXT NOT NULL,
+    source TEXT NOT NULL,
+    target TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    file_name TEXT NOT NULL,
+    status TEXT NOT NULL,
+    planned_at TEXT NOT NULL,
+    finished_at TEXT,
+    PRIMARY KEY (kind, source, target, size, mtime)
+);
+CREATE INDEX IF NOT EXISTS operations_file_name ON operations (file_name);
+"""
+
+
+def fingerprint(path: str) -> Stamp:
+    """(size, mtime) of a file; a re-dropped file with new content gets a new stamp."""
+    if _ledger is None:
+        # nothing will be recorded, save the round trip
+        return 0, 0.0
+    try:
+        with profiling.span(profiling.STAT, path):
+            stat = os.stat(path)
+    except OSError:
+        return 0, 0.0
+    return stat.st_size, stat.st_mtime
+
+
+def _now() -> str:
+    return datetime.datetime.now().isoformat(timespec="seconds")
+
+
+class Ledger:
+    """Local SQLite record of every move, copy, extract, split and archive.
+
+    An operation is written as planned before it touches the network and as
+    done (or failed) afterwards, so after a crash the next run can tell finished
+    work from interrupted work without listing the destination shares. Rows are
+    keyed by the source file's path, size and mtime.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self._lock = threading.Lock()
+        # transfers run on a thread pool, every statement goes through the lock
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+
+    def status(self, kind: str, source: str, target: str, stamp: Stamp) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT status FROM operations WHERE kind=? AND source=? AND target=? AND size=? AND mtime=?",
+                (kind, source, target, *stamp),
+            ).fetchone()
+        return row[0] if row else None
+
+    def record(self, kind: str, source: str, target: str, stamp: Stamp, status: str):
+        finished_at = None if status == PLANNED else _now()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO operations (kind, source, target, size, mtime, file_name, status, planned_at, finished_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT (kind, source, target, size, mtime)"
+                " DO UPDATE SET status=excluded.status, finished_at=excluded.finished_at",
+                (kind, source, target, *stamp, os.path.basename(source), status, _now(), finished_at),
+            )
+
+    def history(self, file_name: str) -> List[dict]:
+        """Every operation recorded for a file name, oldest first."""
+        with self._lock:
+            cursor = self._db.execute(
+                "SELECT kind, source, target, size, mtime, status, planned_at, finished_at"
+                " FROM operations WHERE file_name=? ORDER BY planned_at",
+                (file_name,),
+            )
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+_ledger: Optional[Ledger] = None
+
+
+def configure(path: Optional[str] = None):
+    """Open the ledger at path; without a path the ledger is disabled."""
+    global _ledger
+    if _ledger is not None:
+        _ledger.close()
+    _ledger = Ledger(path) if path else None
+    if _ledger is not None:
+        logger.debug(f"Transfer ledger at {path}")
+
+
+def enabled() -> bool:
+    return _ledger is not None
+
+
+def status(kind: str, source: str, target: str, stamp: Stamp) -> Optional[str]:
+    return _ledger.status(kind, source, target, stamp) if _ledger is not None else None
+
+
+def is_done(kind: str, source: str, target: str, stamp: Stamp) -> bool:
+    return status(kind, source, target, stamp) == DONE
+
+
+def record(kind: str, source: str, target: str, stamp: Stamp, state: str):
+    if _ledger is not None:
+        _ledger.record(kind, source, target, stamp, state)
+
+
+@contextmanager
+def operation(kind: str, source: str, target: str, stamp: Optional[Stamp] = None):
+    """Record the wrapped block as planned, then done, or failed if it raises."""
+    stamp = fingerprint(source) if stamp is None else stamp
+    record(kind, source, target, stamp, PLANNED)
+    try:
+        yield
+    except BaseException:
+        record(kind, source, target, stamp, FAILED)
+        raise
+    record(kind, source, target, stamp, DONE)
+
+
+def history(file_name: str) -> List[dict]:
+    return _ledger.history(file_name) if _ledger is not None else []
@@ -0,0 +1,259 @@
+import atexit
+import datetime
+import glob
+import os
+import queue
+import threading
+import time
+import zipfile
+from typing import Dict, List, Tuple
+
+from loguru import logger
+
+import leases
+from leases import LEASE_DIR, LeaseManager
+
+
+DEFAULT_FLUSH_INTERVAL = 2.0
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_MAX_QUEUE = 10000
+DEFAULT_RETENTION_DAYS = 90
+# per call site and use case: messages let through per window, the rest are summarized
+DEFAULT_BURST = 20
+DEFAULT_WINDOW = 60.0
+
+FORMAT = "{time:YYYY-MM-DD HH:mm:ss.SSS} | {level: <8} | {name}:{function}:{line} - {message}"
+
+# warnings and errors are never summarized
+_SUMMARIZE_BELOW = logger.level("WARNING").no
+
+# put on the queue to stop the writer thread
+_STOP = object()
+
+_settings = {
+    "flush_interval": DEFAULT_FLUSH_INTERVAL,
+    "batch_size": DEFAULT_BATCH_SIZE,
+    "max_queue": DEFAULT_MAX_QUEUE,
+    "retention_days": DEFAULT_RETENTION_DAYS,
+    "burst": DEFAULT_BURST,
+    "window": DEFAULT_WINDOW,
+}
+
+
+def configure(flush_interval: float = None, batch_size: int = None, max_queue: int = None,
+              retention_days: int = None, burst: int = None, window: float = None):
+    """Tune the batched sinks; max_queue applies to sinks added later, the rest to the next batch."""
+    for name, value in (("flush_interval", flush_interval), ("batch_size", batch_size), ("max_queue", max_queue),
+                        ("retention_days", retention_days), ("burst", burst), ("window", window)):
+        if value is not None:
+            _settings[name] = value
+
+
+class _Burst:
+    __slots__ = ("started", "count", "suppressed", "sample", "where")
+
+    def __init__(self, started: float, where: str):
+        self.started = started
+        self.count = 0
+        self.suppressed = 0
+        self.sample = ""
+        self.where = where
+
+
+class BatchedFileSink:
+    """A loguru sink that never makes the logging thread wait on the file share.
+
+    Formatted messages go on a bounded queue; a background thread appends
+    them to path in batches of up to batch_size, at least every
+    flush_interval seconds, with one open and one write per batch. When the
+    share is slow the queue absorbs it, and when it is full messages are
+    dropped and counted rather than blocking a transfer.
+
+    Below WARNING, one call site logging for one use case (logger.contextualize
+    (use_case=...)) gets `burst` messages per `window` seconds; the rest are
+    summarized in one line with their count.
+
+    The file is rotated when the day changes: the old one is zipped next to it
+    as <name>.<date><ext>.zip and zips older than retention_days are removed.
+    Several workers can log to the same file; the one that takes the
+    rotation lease (in the log folder's .leases) rotates it, the others keep
+    appending.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.written = 0
+        self.batches = 0
+        self.dropped = 0
+        self.suppressed = 0
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max(1, _settings["max_queue"]))
+        # reentrant: a summary is queued (and maybe counted as dropped) while the bursts are locked
+        self._lock = threading.RLock()
+        self._bursts: Dict[Tuple, _Burst] = {}
+        # lines whose write failed, retried with the next batch
+        self._pending: List[str] = []
+        self._thread = threading.Thread(target=self._run, name="log-sink", daemon=True)
+        self._thread.start()
+
+    def __call__(self, message):
+        record = message.record
+        if record["level"].no < _SUMMARIZE_BELOW and not self._admit(record):
+            return
+        self._put(str(message))
+
+    def _put(self, line: str):
+        try:
+            self._queue.put_nowait(line)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    def _admit(self, record) -> bool:
+        use_case = record["extra"].get("use_case")
+        key = (record["name"], record["function"], record["line"], use_case)
+        now = time.monotonic()
+        with self._lock:
+            burst = self._bursts.get(key)
+            if burst is None or now - burst.started >= _settings["window"]:
+                if burst is not None and burst.suppressed:
+                    self._put(self._summary(burst))
+                where = f"{record['name']}:{record['function']}" + (f" ({use_case})" if use_case else "")
+                burst = self._bursts[key] = _Burst(now, where)
+            burst.count += 1
+            if burst.count <= _settings["burst"]:
+                return True
+            burst.suppressed += 1
+            burst.sample = record["message"]
+            self.suppressed += 1
+            return False
+
+    @staticmethod
+    def _summary(burst: _Burst) -> str:
+        now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+        return (f"{now} | {'INFO': <8} | {burst.where} - {burst.suppressed} more similar messages, "
+                f"the last one: {burst.sample}\n")
+
+    def _expired_summaries(self, everything: bool = False) -> List[str]:
+        now = time.monotonic()
+        lines = []
+        with self._lock:
+            for key, burst in list(self._bursts.items()):
+                if everything or now - burst.started >= _settings["window"]:
+                    if burst.suppressed:
+                        lines.append(self._summary(burst))
+                    del self._bursts[key]
+        return lines
+
+    def _next_batch(self) -> Tuple[List[str], bool]:
+        batch = []
+        deadline = time.monotonic() + _settings["flush_interval"]
+        while len(batch) < _settings["batch_size"]:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                line = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if line is _STOP:
+                return batch, True
+            batch.append(line)
+        return batch, False
+
+    def _run(self):
+        while True:
+            batch, stopping = self._next_batch()
+            batch += self._expired_summaries(everything=stopping)
+            if batch or self._pending:
+                self._write(batch)
+            if stopping:
+                return
+
+    def _write(self, batch: List[str]):
+        lines = self._pending + batch
+        try:
+            self._rotate()
+            with open(self.path, "a", encoding="utf-8") as file:
+                file.write("".join(lines))
+        except OSError:
+            # keep what could not be written for the next batch, within the queue's bound
+            overflow = len(lines) - _settings["max_queue"]
+            if overflow > 0:
+                with self._lock:
+                    self.dropped += overflow
+                lines = lines[overflow:]
+            self._pending = lines
+            return
+        self._pending = []
+        self.written += len(lines)
+        self.batches += 1
+
+    def _started(self):
+        try:
+            return datetime.date.fromtimestamp(os.path.getmtime(self.path))
+        except FileNotFoundError:
+            return None
+
+    def _rotate(self):
+        started = self._started()
+        if started is None or started >= datetime.date.today():
+            return
+        name = os.path.basename(self.path) + ".rotate"
+        with LeaseManager(os.path.join(os.path.dirname(self.path), LEASE_DIR), leases.lease_seconds()) as lease:
+            if not lease.claim(name):
+                # another process is rotating it
+                return
+            # it may have been rotated between the first look and the claim
+            started = self._started()
+            if started is not None and started < datetime.date.today():
+                self._rotate_from(started)
+
+    def _rotate_from(self, started: datetime.date):
+        root, ext = os.path.splitext(self.path)
+        rotated = f"{root}.{started.isoformat()}{ext}"
+        os.replace(self.path, rotated)
+        with zipfile.ZipFile(f"{rotated}.zip", "a", zipfile.ZIP_DEFLATED) as archive:
+            archive.write(rotated, os.path.basename(rotated))
+        os.remove(rotated)
+        cutoff = time.time() - _settings["retention_days"] * 86400
+        for old in glob.glob(f"{glob.escape(root)}.*{ext}.zip"):
+            if os.path.getmtime(old) < cutoff:
+                os.remove(old)
+
+    def stop(self, timeout: float = 10.0):
+        """Write everything queued so far (and the pending summaries), then stop the writer thread."""
+        if not self._thread.is_alive():
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+
+# loguru handler id -> sink
+_sinks: Dict[int, BatchedFileSink] = {}
+
+
+def add(path: str, level: str = "INFO") -> int:
+    """Log to path through a BatchedFileSink; returns the loguru handler id."""
+    sink = BatchedFileSink(path)
+    handler_id = logger.add(sink, level=level, format=FORMAT)
+    _sinks[handler_id] = sink
+    return handler_id
+
+
+def shutdown(timeout: float = 10.0):
+    """Detach every batched sink and flush what it still holds. Safe to call more than once."""
+    for handler_id, sink in list(_sinks.items()):
+        try:
+            logger.remove(handler_id)
+        except ValueError:
+            pass
+        sink.stop(timeout)
+        if sink.dropped:
+            logger.warning(f"{sink.dropped} log messages to {sink.path} were dropped, the share could not keep up")
+        del _sinks[handler_id]
+
+
+atexit.register(shutdown)
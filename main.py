@@ -1,70 +1,273 @@
-from glob import glob
+import argparse
 import json
 import os
+import time
+from contextlib import nullcontext
 from loguru import logger
 from datetime import datetime
 
-from functions import move_inputs, move_outputs, parse_output_files, parse_epic_output_files
+from functions import distribute
+from file_index import FileIndex, PatternMatcher
+from watcher import DirectoryWatcher, DEFAULT_RETRY_SECONDS
+import transfers
+import excel_io
+import dir_cache
+import ledger
+import metrics
+import archive_store
+import share_health
+import config
+import pipeline
+import planner
+import backlog
+import log_sink
+import leases
+import merged_index
+import moved_archive
+import profiling
+
+
+# run metrics stage for the wall time of the whole pipeline
+PIPELINE = "pipeline"
+
+# file names listed in full in the debug log; a backlog of thousands is summarized
+FILE_DUMP_LIMIT = 50
+
+LOG_SHARE_PATH = "\\\\NT2KWB972SRV03\\SHAREDATA\\CPP-Data\\Sutherland RPA\\Northwell Process Automation ETM Files\\GOA\\Inputs\\logs\\log.log"
+
+INPUTS_DIR = '\\\\NT2KWB972SRV03\\SHAREDATA\\CPP-Data\\Sutherland RPA\\Northwell Process Automation ETM Files\\GOA\\Inputs'
+
+DRIVES = {
+    "M": "\\\\NT2KWB972SRV03\\SHAREDATA",
+    "N": "\\\\NASDATA204\\SHAREDATA\\BOT CLAIMSTATUS DATA-PHI",
+    "S": "\\\\NASHCN01\\SHAREDATA",
+    "Y": "\\\\NASDATA201\\SHAREDATA\\MV-RCR01\\SHARED",
+    "T": "\\\\NASDATA201\\SHAREDATA\\NSHS-CENTRAL-LAB\\SHARED\\BILLING"
+}
+
+
+def load_configs() -> dict:
+    # settings.json says where the compiled configs are cached, so it is always read
+    with open('./json_data/settings.json') as file:
+        settings = json.load(file)
+    configs = config.load(config.CONFIG_DIR, settings.get("config_cache", {}).get("path"))
+    return {**configs, "settings": settings}
+
+
+def check_drives():
+    # probe all drives at once; a drive that does not answer in time is reported, not waited on
+    health = share_health.check(DRIVES.values())
+    for drive_letter, drive_path in DRIVES.items():
+        if not health.get(share_health.share_of(drive_path), True):
+            logger.info(f"Drive {drive_letter} is not connected")
+    if all(health.values()):
+        logger.success("All drives are connected")
+
+
+def _defer_unhealthy(configs: dict) -> dict:
+    """Use cases whose shares are down, by config key; their files stay in the inputs folder."""
+    deferred = share_health.deferred_use_cases(configs)
+    for key, use_cases in deferred.items():
+        for use_case, shares in use_cases.items():
+            logger.warning(f"Deferring {key} use case {use_case}: {', '.join(sorted(shares))} unavailable")
+    return deferred
+
+
+def run(inputs_dir: str, configs: dict, matcher: PatternMatcher, file_names=None, sizes=None,
+        dry_run: bool = False) -> bool:
+    """Distribute the files in inputs_dir once.
+
+    When file_names is given (watch mode) only those files are processed,
+    otherwise the directory is listed. With dry_run the plan is printed as
+    JSON and nothing is moved; no share but inputs_dir is touched.
+    Returns False when there was nothing to do.
+    """
+    metrics.reset()
+    if not dry_run and not share_health.check([inputs_dir]).get(share_health.share_of(inputs_dir), True):
+        logger.critical(f"The inputs folder {inputs_dir} is unavailable")
+        return False
+    if file_names is None:
+        index = FileIndex.scan(inputs_dir, matcher)
+    else:
+        index = FileIndex(inputs_dir, file_names, matcher, sizes)
+    files = index.file_names
+    if len(files) == 0:
+        return False
+
+    logger.debug(f"""file dump ({len(files)} files):
+                 {files[:FILE_DUMP_LIMIT]}{' ...' if len(files) > FILE_DUMP_LIMIT else ''}""")
+
+    if dry_run:
+        print(planner.plan(index, configs["rules"], inputs_dir).to_json())
+        return True
+
+    # other workers (or an overlapping scheduled run) may be draining the same folder: only take claimed files
+    with leases.claimed(index, matcher) as index:
+        if len(index) == 0:
+            logger.info("Every file is being handled by another worker")
+            return False
+        # the drives are only probed when there is something to distribute, a no-op run stays fast
+        check_drives()
+        # folders known to exist are only trusted for the length of one run
+        dir_cache.reset()
+        # one dead NAS must not stall the others: use cases on a share that is down wait for a later run
+        deferred = _defer_unhealthy(configs)
+        # every file is resolved to its destinations up front, then the transfers run grouped by host and folder
+        plan = planner.plan(index, configs["rules"], inputs_dir, deferred)
+        logger.info(f"Planned {len(plan.files)} files into {len(plan.groups())} destination folders")
+        # input moves, zip extractions and Outbound splits run side by side on the validated rules
+        with metrics.timer(PIPELINE):
+            distribute(index, configs["rules"], inputs_dir, deferred, plan)
+        # months past moved_archive.loose_months are packed into one container each
+        moved_archive.compact_due()
+        dir_cache.log_stats()
+        metrics.write()
+    return True
+
+
+def catch_up(inputs_dir: str, configs: dict, matcher: PatternMatcher) -> bool:
+    """Drain a large backlog in inputs_dir oldest first, in chunks, within the catch_up memory budget."""
+    metrics.reset()
+    if not share_health.check([inputs_dir]).get(share_health.share_of(inputs_dir), True):
+        logger.critical(f"The inputs folder {inputs_dir} is unavailable")
+        return False
+    check_drives()
+    dir_cache.reset()
+    deferred = _defer_unhealthy(configs)
+    with metrics.timer(PIPELINE):
+        did_work = backlog.catch_up(inputs_dir, configs["rules"], matcher, deferred)
+    if did_work:
+        moved_archive.compact_due()
+        dir_cache.log_stats()
+        metrics.write()
+    return did_work
+
+
+def watch(inputs_dir: str, configs: dict, matcher: PatternMatcher, poll_interval: float, settle_seconds: float,
+          retry_seconds: float = DEFAULT_RETRY_SECONDS):
+    """Stay resident and run the pipeline whenever files settle in inputs_dir.
+
+    Files a run leaves behind (deferred use cases, failed transfers, files
+    another worker held) are run again every retry_seconds until they are gone.
+    """
+    watcher = DirectoryWatcher(inputs_dir, settle_seconds=settle_seconds, retry_seconds=retry_seconds)
+    logger.info(f"Watching {inputs_dir} every {poll_interval}s (settle time {settle_seconds}s)")
+    while True:
+        try:
+            settled = watcher.poll()
+            if settled:
+                start_time = datetime.now()
+                run(inputs_dir, configs, matcher, settled, {name: watcher.size(name) for name in settled})
+                logger.debug(f'Batch of {len(settled)} files took {datetime.now() - start_time}')
+        except Exception as e:
+            # a share hiccup must not kill the resident process
+            logger.exception(e)
+        time.sleep(poll_interval)
+
+
+def print_history(file_name: str):
+    operations = ledger.history(file_name)
+    if not operations:
+        print(f"No operations recorded for {file_name}")
+    for op in operations:
+        print(f"{op['finished_at'] or op['planned_at']}  {op['kind']:<8} {op['status']:<8} {op['source']} -> {op['target']}")
+    for entry in moved_archive.find(file_name):
+        print(f"{entry['archived_at']}  archived {entry['size']} bytes, now at {moved_archive.location(entry)}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Distribute files from the GOA inputs folder")
+    parser.add_argument("--watch", action="store_true",
+                        help="stay resident and process files as they arrive instead of running once")
+    parser.add_argument("--poll-interval", type=float, default=5.0,
+                        help="seconds between directory snapshots in watch mode")
+    parser.add_argument("--settle-seconds", type=float, default=10.0,
+                        help="how long a file's size and mtime must be unchanged before it is processed")
+    parser.add_argument("--retry-seconds", type=float, default=DEFAULT_RETRY_SECONDS,
+                        help="in watch mode, how often files left in the inputs folder (deferred or failed) are retried")
+    parser.add_argument("--workers", type=int, default=transfers.DEFAULT_MAX_WORKERS,
+                        help="number of files transferred in parallel")
+    parser.add_argument("--per-host", type=int, default=transfers.DEFAULT_PER_HOST,
+                        help="maximum concurrent transfers against a single NAS host")
+    parser.add_argument("--catch-up", action="store_true",
+                        help="drain a large backlog oldest first, in chunks, with bounded memory (see catch_up in settings.json)")
+    parser.add_argument("--worker-index", type=int,
+                        help="this process's shard when several workers drain the inputs folder (see leases in settings.json)")
+    parser.add_argument("--worker-count", type=int,
+                        help="number of workers draining the inputs folder together")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="print where every file in the inputs folder would go, as JSON, and exit without moving anything")
+    parser.add_argument("--inputs-dir", default=INPUTS_DIR,
+                        help="folder to distribute from (point --dry-run at a local copy to check configs offline)")
+    parser.add_argument("--profile", action="store_true",
+                        help="profile the run: a cProfile .prof, flamegraph stacks and filesystem call spans in ./logs")
+    parser.add_argument("--where", metavar="FILE_NAME",
+                        help="print where and when a file was distributed, from the transfer ledger, and exit")
+    return parser.parse_args(argv)
 
 
 if __name__ == "__main__":
     try:
+        args = parse_args()
         os.chdir(os.path.dirname(os.path.abspath(__file__)))
-        
+
         # logger.add('.\\logs\\local_log.log', level="INFO")
-        logger.add("\\\\NT2KWB972SRV03\\SHAREDATA\\CPP-Data\\Sutherland RPA\\Northwell Process Automation ETM Files\\GOA\\Inputs\\logs\\log.log",
-                rotation="1 day", level="INFO", retention="90 days", compression="zip")
+        if not args.dry_run:
+            # queued and written in batches by a background thread, a slow share never holds up a transfer
+            log_sink.add(LOG_SHARE_PATH, level="INFO")
         logger.add("./logs/log.log",rotation="7 days", level="DEBUG", retention="7 days", compression="zip")
-        
+
         start_time = datetime.now()
-        
+
         logger.debug(f'========================================================')
         logger.debug(f'Starting Process at: {start_time}')
 
-        drives = {
-            "M": "\\\\NT2KWB972SRV03\\SHAREDATA",
-            "N": "\\\\NASDATA204\\SHAREDATA\\BOT CLAIMSTATUS DATA-PHI",
-            "S": "\\\\NASHCN01\\SHAREDATA",
-            "Y": "\\\\NASDATA201\\SHAREDATA\\MV-RCR01\\SHARED",
-            "T": "\\\\NASDATA201\\SHAREDATA\\NSHS-CENTRAL-LAB\\SHARED\\BILLING"
-        }
-
-        # check if all drives are connected
-        for drive_letter, drive_path in drives.items():
-            # logger.info(f"Checking if drive {drive_letter} is connected")
-            # logger.info(os.path.exists(drive_path))
-            if not os.path.exists(drive_path):
-                logger.info(f"Drive {drive_letter} is not connected")
-        if all([os.path.exists(drive_path) for drive_path in drives.values()]):
-            logger.success("All drives are connected")
-
-        inputs_dir = '\\\\NT2KWB972SRV03\\SHAREDATA\\CPP-Data\\Sutherland RPA\\Northwell Process Automation ETM Files\\GOA\\Inputs'
-        files = os.listdir(inputs_dir)
-        files = [file for file in files if os.path.isfile(os.path.join(inputs_dir, file)) and "~" not in file]
-        if len(files) > 0:
-            logger.debug(f"""file dump:
-                         {files}""")
-            # read the input file
-            with open('./json_data/inputs.json', 'r') as file:
-                inputs = json.load(file)
-            with open('./json_data/outputs.json', 'r') as file:
-                outputs = json.load(file)
-            with open('./json_data/outbound_shs.json') as file:
-                shs = json.load(file)
-            with open('./json_data/epic_outbound_shs.json') as file:
-                epic_shs = json.load(file)
-
-            # move the input files to their respective destinations
-            move_inputs(inputs, inputs_dir)
-            parse_output_files(shs, inputs_dir)
-            parse_epic_output_files(epic_shs, inputs_dir)
-            move_outputs(outputs, inputs_dir)
-            logger.success("All files have been moved successfully")
-            end_time = datetime.now()
-            logger.debug(f'========================================================')
-            logger.debug(f'Ending Process at: {end_time}')
-            logger.debug(f'Total Duration: {end_time - start_time}')
-        else:
-            logger.critical("No files found in the inputs directory")
+        transfers.configure(max_workers=args.workers, per_host=args.per_host)
+
+        configs = load_configs()
+        log_sink.configure(**configs["settings"].get("logging", {}))
+        share_health.configure(**configs["settings"].get("share_health", {}))
+        excel_io.configure(**configs["settings"].get("excel", {}))
+        ledger.configure(**configs["settings"].get("ledger", {}))
+        archive_store.configure(**configs["settings"].get("archive_store", {}))
+        moved_archive.configure(**configs["settings"].get("moved_archive", {}))
+        merged_index.configure(**configs["settings"].get("merged_archives", {}))
+        metrics.configure(**configs["settings"].get("metrics", {}))
+        pipeline.configure(**configs["settings"].get("pipeline", {}))
+        planner.configure(**configs["settings"].get("planner", {}))
+        backlog.configure(**configs["settings"].get("catch_up", {}))
+        leases.configure(**configs["settings"].get("leases", {}))
+        leases.configure(workers=args.worker_count, worker_index=args.worker_index)
+        matcher = configs["matcher"]
+
+        with profiling.profiled("./logs") if args.profile else nullcontext():
+            if args.where:
+                print_history(args.where)
+            elif args.dry_run:
+                if not run(args.inputs_dir, configs, matcher, dry_run=True):
+                    print(f"No files found in {args.inputs_dir}")
+            elif args.catch_up:
+                if catch_up(args.inputs_dir, configs, matcher):
+                    logger.success("Caught up on the inputs backlog")
+                else:
+                    logger.critical("No files found in the inputs directory")
+            elif args.watch:
+                watch(args.inputs_dir, configs, matcher, args.poll_interval, args.settle_seconds,
+                      args.retry_seconds)
+            elif run(args.inputs_dir, configs, matcher):
+                logger.success("All files have been moved successfully")
+                end_time = datetime.now()
+                logger.debug(f'========================================================')
+                logger.debug(f'Ending Process at: {end_time}')
+                logger.debug(f'Total Duration: {end_time - start_time}')
+            else:
+                logger.critical("No files found in the inputs directory")
+    except KeyboardInterrupt:
+        logger.info("Stopped")
+    except config.ConfigError as e:
+        logger.critical(f"Not running, the configs are invalid: {e}")
     except Exception as e:
-        logger.exception(e)
\ No newline at end of file
+        logger.exception(e)
+    finally:
+        # write out what the share log still has queued before the process exits
+        log_sink.shutdown()
@@ -0,0 +1,272 @@
+import fnmatch
+import json
+import os
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+from typing import List, Optional, Tuple
+from zipfile import ZIP_DEFLATED, ZIP_STORED, ZipFile
+
+from loguru import logger
+
+import ledger
+import profiling
+from dir_cache import ensure_dir
+from extraction import BUFFER_SIZE, Written, member_target
+from transfers import host_slot, run_concurrently
+
+
+# a missing archive is not looked for again for this long
+DEFAULT_MISSING_RETRY_AFTER = 6 * 3600.0
+# an archive not looked up for this many days is dropped from the index
+DEFAULT_RETENTION_DAYS = 45
+# the last use of an archive is written at most this often
+_TOUCH_AFTER = 3600.0
+
+# members is the JSON list of Member.to_list(), NULL for an archive that was not there at checked_at
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS archives (
+    path TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime REAL,
+    members TEXT,
+    checked_at REAL NOT NULL,
+    used_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS archives_used_at ON archives (used_at);
+"""
+
+# local file header: signature, version, flags, method, time, date, crc, sizes, name and extra lengths
+_LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+_LOCAL_HEADER_SIGNATURE = 0x04034B50
+_ENCRYPTED = 0x1
+
+
+class Member:
+    """Where a member's bytes are in its archive, from the central directory."""
+
+    __slots__ = ("name", "header_offset", "compress_size", "file_size", "compress_type", "crc", "flags")
+
+    def __init__(self, name: str, header_offset: int, compress_size: int, file_size: int, compress_type: int,
+                 crc: int, flags: int):
+        self.name = name
+        self.header_offset = header_offset
+        self.compress_size = compress_size
+        self.file_size = file_size
+        self.compress_type = compress_type
+        self.crc = crc
+        self.flags = flags
+
+    @property
+    def readable(self) -> bool:
+        """Whether read_member can stream it; anything else goes through ZipFile."""
+        return self.compress_type in (ZIP_STORED, ZIP_DEFLATED) and not self.flags & _ENCRYPTED
+
+    def to_list(self) -> list:
+        return [self.name, self.header_offset, self.compress_size, self.file_size, self.compress_type, self.crc,
+                self.flags]
+
+
+def read_central_directory(path: str) -> List[Member]:
+    with ZipFile(path) as zf:
+        return [Member(info.filename, info.header_offset, info.compress_size, info.file_size, info.compress_type,
+                       info.CRC, info.flag_bits)
+                for info in zf.infolist() if not info.filename.endswith("/")]
+
+
+def read_member(file, member: Member, dst) -> Tuple[int, int]:
+    """Copy one member from the open archive file into dst, reading only its own bytes.
+
+    Seeks to the member's local header, skips its name and extra field and
+    streams the compressed data. Returns the bytes written and their CRC-32.
+    """
+    file.seek(member.header_offset)
+    header = file.read(_LOCAL_HEADER.size)
+    fields = _LOCAL_HEADER.unpack(header) if len(header) == _LOCAL_HEADER.size else None
+    if fields is None or fields[0] != _LOCAL_HEADER_SIGNATURE:
+        raise ValueError(f"{member.name}: no local header at offset {member.header_offset}")
+    file.seek(fields[9] + fields[10], os.SEEK_CUR)
+
+    decompressor = zlib.decompressobj(-zlib.MAX_WBITS) if member.compress_type == ZIP_DEFLATED else None
+    remaining = member.compress_size
+    size = crc = 0
+    while remaining:
+        chunk = file.read(min(BUFFER_SIZE, remaining))
+        if not chunk:
+            raise ValueError(f"{member.name}: archive ends {remaining} bytes early")
+        remaining -= len(chunk)
+        if decompressor is not None:
+            chunk = decompressor.decompress(chunk)
+        dst.write(chunk)
+        size += len(chunk)
+        crc = zlib.crc32(chunk, crc)
+    if decompressor is not None:
+        chunk = decompressor.flush()
+        dst.write(chunk)
+        size += len(chunk)
+        crc = zlib.crc32(chunk, crc)
+    if (size, crc) != (member.file_size, member.crc):
+        raise ValueError(f"{member.name}: extracted {size} bytes with CRC {crc:08x}, "
+                         f"expected {member.file_size} with {member.crc:08x}")
+    return size, crc
+
+
+class MergedArchiveIndex:
+    """The central directories of merged archives on the shares, kept between runs.
+
+    Entries are keyed by the archive's path and only used while its size and
+    mtime are unchanged, so an archive is listed over the network once, not
+    for every output zip of its date. An archive that is not there is
+    recorded too, and not looked for again for missing_retry_after seconds.
+
+    The entries live in a local SQLite file, one row per archive, so indexing
+    an archive writes only its own row. Archives not looked up for
+    retention_days (the dated archives of past days) are dropped when the
+    index is opened, and an archive found missing loses its members.
+    """
+
+    def __init__(self, state_path: Optional[str] = None,
+                 missing_retry_after: float = DEFAULT_MISSING_RETRY_AFTER,
+                 retention_days: float = DEFAULT_RETENTION_DAYS):
+        self.state_path = state_path
+        self.missing_retry_after = missing_retry_after
+        self.retention_days = retention_days
+        if state_path:
+            folder = os.path.dirname(state_path)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+        self._lock = threading.Lock()
+        # without a state path the index only lives for the run
+        self._db = sqlite3.connect(state_path or ":memory:", check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        self.prune()
+
+    def prune(self) -> int:
+        """Drop the archives not looked up for retention_days; returns how many."""
+        cutoff = time.time() - self.retention_days * 86400
+        with self._lock:
+            removed = self._db.execute("DELETE FROM archives WHERE used_at<?", (cutoff,)).rowcount
+        if removed:
+            logger.debug(f"Dropped {removed} merged archives unused for {self.retention_days} days from the index")
+        return removed
+
+    def _row(self, path: str) -> Optional[tuple]:
+        with self._lock:
+            return self._db.execute("SELECT size, mtime, members, checked_at, used_at FROM archives WHERE path=?",
+                                    (path,)).fetchone()
+
+    def _store(self, path: str, size: Optional[int], mtime: Optional[float], members: Optional[List[Member]]):
+        now = time.time()
+        data = None if members is None else json.dumps([member.to_list() for member in members])
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO archives (path, size, mtime, members, checked_at, used_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)", (path, size, mtime, data, now, now))
+
+    def _missing(self, row: Optional[tuple]) -> bool:
+        return bool(row and row[2] is None and time.time() - row[3] < self.missing_retry_after)
+
+    def known_missing(self, path: str) -> bool:
+        return self._missing(self._row(path))
+
+    def members(self, path: str) -> Optional[Tuple[ledger.Stamp, List[Member]]]:
+        """The archive's (size, mtime) and members; None when it does not exist.
+
+        Costs one stat when the archive is indexed and unchanged, and a read of
+        its central directory otherwise.
+        """
+        row = self._row(path)
+        if self._missing(row):
+            return None
+        try:
+            with profiling.span(profiling.STAT, path):
+                stat = os.stat(path)
+        except FileNotFoundError:
+            self._store(path, None, None, None)
+            return None
+        stamp = (stat.st_size, stat.st_mtime)
+        if row and row[2] is not None and (row[0], row[1]) == stamp:
+            now = time.time()
+            if now - row[4] > _TOUCH_AFTER:
+                with self._lock:
+                    self._db.execute("UPDATE archives SET used_at=? WHERE path=?", (now, path))
+            return stamp, [Member(*values) for values in json.loads(row[2])]
+        members = read_central_directory(path)
+        self._store(path, *stamp, members)
+        return stamp, members
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+_index = MergedArchiveIndex()
+
+
+def configure(state_path: Optional[str] = None, missing_retry_after: float = DEFAULT_MISSING_RETRY_AFTER,
+              retention_days: float = DEFAULT_RETENTION_DAYS):
+    """Keep the merged archive index in state_path; without it the index only lives for the run."""
+    global _index
+    _index.close()
+    _index = MergedArchiveIndex(state_path, missing_retry_after, retention_days)
+
+
+def extract_matching(archive_path: str, pattern: str, destination: str) -> Optional[Written]:
+    """Extract the members of archive_path whose path matches pattern into destination, several at a time.
+
+    Every worker opens its own handle on the archive and reads only the
+    byte ranges of the members it extracts. Members the ledger already has
+    as extracted from this version of the archive are skipped. Returns the
+    size and CRC of everything written, None when the archive does not exist.
+    """
+    found = _index.members(archive_path)
+    if found is None:
+        return None
+    stamp, members = found
+    pending = []
+    for member in members:
+        if not fnmatch.fnmatchcase(member.name, pattern):
+            continue
+        target = member_target(destination, member.name)
+        if not ledger.is_done(ledger.EXTRACT, archive_path, target, stamp):
+            pending.append((member, target))
+    for folder in sorted({os.path.dirname(target) for _, target in pending}):
+        ensure_dir(folder)
+
+    local = threading.local()
+    handles = []
+    handles_lock = threading.Lock()
+    written: Written = {}
+
+    def extract_one(item):
+        member, target = item
+        with ledger.operation(ledger.EXTRACT, archive_path, target, stamp), host_slot(destination), \
+                profiling.span(profiling.EXTRACT, target), open(target, "wb", buffering=BUFFER_SIZE) as dst:
+            if member.readable:
+                file = getattr(local, "file", None)
+                if file is None:
+                    file = local.file = open(archive_path, "rb", buffering=0)
+                    with handles_lock:
+                        handles.append(file)
+                written[target] = read_member(file, member, dst)
+            else:
+                with ZipFile(archive_path) as zf, zf.open(member.name) as src:
+                    size = crc = 0
+                    for chunk in iter(lambda: src.read(BUFFER_SIZE), b""):
+                        dst.write(chunk)
+                        size += len(chunk)
+                        crc = zlib.crc32(chunk, crc)
+                written[target] = (size, crc)
+
+    try:
+        run_concurrently(extract_one, pending)
+    finally:
+        for file in handles:
+            file.close()
+    if pending:
+        logger.info(f"Extracted {len(pending)} members matching {pattern} from {os.path.basename(archive_path)}")
+    return written
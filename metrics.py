@@ -0,0 +1,150 @@
+import datetime
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+
+from loguru import logger
+
+
+# use case label for stage-wide totals
+ALL = "all"
+
+FIELDS = ("seconds", "calls", "files", "bytes", "errors")
+
+_HELP = {
+    "seconds": "Seconds spent in the stage during the last run (summed over parallel jobs for a use case)",
+    "calls": "Number of timed calls of the stage during the last run",
+    "files": "Files handled by the stage during the last run",
+    "bytes": "Bytes of the files handled by the stage during the last run",
+    "errors": "Errors logged by the stage during the last run",
+}
+
+
+class RunMetrics:
+    """Timers and counters for one run, keyed by (stage, use case).
+
+    Stage-wide timers use the use case "all" and measure wall time. Timers
+    for a single use case add up the time of every job of that use case, so
+    with parallel transfers their sum can exceed the stage's wall time.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = datetime.datetime.now()
+            self._started_monotonic = time.monotonic()
+            self._values: Dict[Tuple[str, str], Dict[str, float]] = {}
+
+    def _add(self, stage: str, use_case: Optional[str], **amounts):
+        key = (stage, use_case or ALL)
+        with self._lock:
+            values = self._values.setdefault(key, dict.fromkeys(FIELDS, 0))
+            for field, amount in amounts.items():
+                values[field] += amount
+
+    def count(self, stage: str, use_case: Optional[str] = None, files: int = 0, bytes: int = 0, errors: int = 0):
+        self._add(stage, use_case, files=files, bytes=bytes, errors=errors)
+
+    def add_time(self, stage: str, use_case: Optional[str], seconds: float):
+        self._add(stage, use_case, seconds=seconds, calls=1)
+
+    @contextmanager
+    def timer(self, stage: str, use_case: Optional[str] = None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage, use_case, time.perf_counter() - start)
+
+    def summary(self) -> dict:
+        with self._lock:
+            stages: Dict[str, Dict[str, dict]] = {}
+            for (stage, use_case), values in sorted(self._values.items()):
+                stages.setdefault(stage, {})[use_case] = dict(values)
+            return {
+                "started": self.started.isoformat(timespec="seconds"),
+                "duration_seconds": time.monotonic() - self._started_monotonic,
+                "stages": stages,
+            }
+
+    def prometheus(self, summary: Optional[dict] = None) -> str:
+        """The summary in the Prometheus text exposition format."""
+        summary = summary or self.summary()
+        lines = [
+            "# HELP goa_run_timestamp_seconds Start time of the last run",
+            "# TYPE goa_run_timestamp_seconds gauge",
+            f"goa_run_timestamp_seconds {datetime.datetime.fromisoformat(summary['started']).timestamp():.0f}",
+            "# HELP goa_run_duration_seconds Duration of the last run",
+            "# TYPE goa_run_duration_seconds gauge",
+            f"goa_run_duration_seconds {summary['duration_seconds']:.3f}",
+        ]
+        for field in FIELDS:
+            lines.append(f"# HELP goa_stage_{field} {_HELP[field]}")
+            lines.append(f"# TYPE goa_stage_{field} gauge")
+            for stage, use_cases in summary["stages"].items():
+                for use_case, values in use_cases.items():
+                    label = use_case.replace("\\", "\\\\").replace('"', '\\"')
+                    lines.append(f'goa_stage_{field}{{stage="{stage}",use_case="{label}"}} {values[field]:g}')
+        return "\n".join(lines) + "\n"
+
+
+def _write_atomic(path: str, text: str):
+    # the node_exporter textfile collector must never see a half-written file
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as file:
+        file.write(text)
+    os.replace(tmp_path, path)
+
+
+_metrics = RunMetrics()
+_settings = {"json_path": None, "history_path": None, "prometheus_path": None}
+
+
+def configure(json_path: str = None, history_path: str = None, prometheus_path: str = None):
+    """Set where write() puts the JSON summary, the JSON-lines history and the Prometheus textfile."""
+    _settings.update(json_path=json_path, history_path=history_path, prometheus_path=prometheus_path)
+
+
+def reset():
+    _metrics.reset()
+
+
+def count(stage: str, use_case: Optional[str] = None, files: int = 0, bytes: int = 0, errors: int = 0):
+    _metrics.count(stage, use_case, files=files, bytes=bytes, errors=errors)
+
+
+def add_time(stage: str, use_case: Optional[str], seconds: float):
+    _metrics.add_time(stage, use_case, seconds)
+
+
+def timer(stage: str, use_case: Optional[str] = None):
+    return _metrics.timer(stage, use_case)
+
+
+def summary() -> dict:
+    return _metrics.summary()
+
+
+def write():
+    """Export the current run's metrics to the configured files; failures are only logged."""
+    run = summary()
+    try:
+        if _settings["json_path"]:
+            _write_atomic(_settings["json_path"], json.dumps(run, indent=4))
+        if _settings["history_path"]:
+            os.makedirs(os.path.dirname(_settings["history_path"]) or ".", exist_ok=True)
+            with open(_settings["history_path"], "a") as file:
+                file.write(json.dumps(run) + "\n")
+        if _settings["prometheus_path"]:
+            _write_atomic(_settings["prometheus_path"], _metrics.prometheus(run))
+    except OSError as e:
+        logger.warning(f"Failed to write run metrics: {e}")
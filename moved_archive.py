@@ -0,0 +1,318 @@
+import datetime
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from zipfile import ZIP_STORED, ZipFile, ZipInfo
+
+from loguru import logger
+
+import profiling
+from archive_store import file_digest, new_hasher
+from extraction import BUFFER_SIZE
+import leases
+from leases import LEASE_DIR, LeaseManager
+
+
+# months archived in folders of loose files, the current one included; older months are compacted
+DEFAULT_LOOSE_MONTHS = 2
+MONTH_FORMAT = "%Y %m"
+CONTAINER_SUFFIX = ".zip"
+# next to a container while files are appended to it: its central directory as it was before
+_DIRECTORY_SUFFIX = ".dir"
+# members this large need zip64 headers up front
+_ZIP64_SIZE = 2 ** 31
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS archived (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    digest TEXT,
+    month TEXT NOT NULL,
+    root TEXT NOT NULL,
+    path TEXT NOT NULL,
+    container TEXT,
+    member TEXT,
+    archived_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS archived_name_size ON archived (name, size);
+CREATE INDEX IF NOT EXISTS archived_loose ON archived (root, month) WHERE container IS NULL;
+"""
+
+_COLUMNS = ("id", "name", "size", "digest", "month", "root", "path", "container", "member", "archived_at")
+
+
+def month_of(date: Optional[datetime.datetime]) -> str:
+    return (date or datetime.datetime.now()).strftime(MONTH_FORMAT)
+
+
+def location(entry: dict) -> str:
+    """Where an archived file is now: its loose path, or <container>!<member> once compacted."""
+    return f"{entry['container']}!{entry['member']}" if entry["container"] else entry["path"]
+
+
+class MovedArchive:
+    """Local SQLite index of every file archived after it was processed.
+
+    Extracted zips go to <inputs>/moved/YYYY MM/ and split Outbound workbooks
+    to Combined Outputs; each one is recorded here with its name, size, month,
+    archive folder (root) and path. The content hash is filled in lazily, when
+    the file is compacted or a file of the same name and size shows up, so
+    archiving costs no extra read. A re-dropped file is recognised by one
+    indexed lookup on (name, size) and, only on a hit, one hash.
+
+    Months older than loose_months are compacted: their loose files are
+    packed into one <root>/YYYY MM.zip container (stored, the files are zips
+    and workbooks already) and removed, so the archive folders stay small
+    enough to list.
+    """
+
+    def __init__(self, path: str, loose_months: int = DEFAULT_LOOSE_MONTHS):
+        self.path = path
+        self.loose_months = max(1, loose_months)
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+
+    def _select(self, where: str, params: tuple) -> List[dict]:
+        with self._lock:
+            rows = self._db.execute(f"SELECT {', '.join(_COLUMNS)} FROM archived WHERE {where}", params).fetchall()
+        return [dict(zip(_COLUMNS, row)) for row in rows]
+
+    def record(self, name: str, size: int, month: str, root: str, path: str):
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO archived (name, size, month, root, path, archived_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (name, size, month, root, path, datetime.datetime.now().isoformat(timespec="seconds")))
+
+    def _set_digest(self, entry_id: int, digest: str):
+        with self._lock:
+            self._db.execute("UPDATE archived SET digest=? WHERE id=?", (digest, entry_id))
+
+    def find(self, name: str) -> List[dict]:
+        return self._select("name=? ORDER BY archived_at", (name,))
+
+    def duplicate_of(self, path: str, size: int) -> Optional[dict]:
+        """The archived file path is an exact copy of, if any."""
+        candidates = self._select("name=? AND size=?", (os.path.basename(path), size))
+        if not candidates:
+            return None
+        digest = file_digest(path)
+        for entry in candidates:
+            if entry["digest"] is None:
+                try:
+                    entry["digest"] = file_digest(entry["path"])
+                except OSError:
+                    continue
+                self._set_digest(entry["id"], entry["digest"])
+            if entry["digest"] == digest:
+                return entry
+        return None
+
+    def due(self, now: Optional[datetime.datetime] = None) -> List[Tuple[str, str]]:
+        """(root, month) of every month with loose files that is old enough to compact."""
+        now = now or datetime.datetime.now()
+        months = now.year * 12 + now.month - 1 - self.loose_months
+        cutoff = datetime.date(months // 12, months % 12 + 1, 1).strftime(MONTH_FORMAT)
+        with self._lock:
+            rows = self._db.execute("SELECT DISTINCT root, month FROM archived WHERE container IS NULL AND month<=?",
+                                    (cutoff,)).fetchall()
+        return sorted(rows)
+
+    def compact(self, root: str, month: str) -> int:
+        """Pack the loose files of month into <root>/<month>.zip and remove them; returns the files packed.
+
+        The first compaction of a month writes the container next to its
+        final name and swaps it in. Later ones (a late file of a packed month)
+        append to it, so only the new files are written. Before appending, the
+        container's central directory is saved to <container>.dir; an append
+        that fails, or a process that died in one, is rolled back from it. The
+        index is only updated once the container is complete and the loose
+        files only removed after that.
+        """
+        entries = self._select("root=? AND month=? AND container IS NULL ORDER BY id", (root, month))
+        container = os.path.join(root, month + CONTAINER_SUFFIX)
+        _restore_directory(container)
+        packed: Dict[int, Tuple[str, str]] = {}
+        gone = []
+
+        def pack_all(out: ZipFile):
+            names = set(out.namelist())
+            for entry in entries:
+                member = entry["name"] if entry["name"] not in names else f"{entry['id']}-{entry['name']}"
+                try:
+                    packed[entry["id"]] = (member, self._pack(out, entry["path"], member))
+                except FileNotFoundError:
+                    gone.append(entry)
+                    continue
+                names.add(member)
+
+        with profiling.span(profiling.WRITE, container):
+            if not os.path.exists(container):
+                tmp_path = container + ".tmp"
+                with ZipFile(tmp_path, "w", ZIP_STORED) as out:
+                    pack_all(out)
+                os.replace(tmp_path, container)
+            else:
+                _save_directory(container)
+                try:
+                    with ZipFile(container, "a", ZIP_STORED) as out:
+                        pack_all(out)
+                except BaseException:
+                    _restore_directory(container)
+                    raise
+                os.remove(container + _DIRECTORY_SUFFIX)
+
+        with self._lock:
+            for entry_id, (member, digest) in packed.items():
+                self._db.execute("UPDATE archived SET container=?, member=?, digest=? WHERE id=?",
+                                 (container, member, digest, entry_id))
+            for entry in gone:
+                self._db.execute("DELETE FROM archived WHERE id=?", (entry["id"],))
+        for entry in gone:
+            logger.warning(f"{entry['path']} was removed from the archive by hand; dropped from the index")
+        folders = set()
+        for entry in entries:
+            if entry["id"] in packed:
+                try:
+                    os.remove(entry["path"])
+                except OSError as e:
+                    logger.warning(f"Could not remove {entry['path']}, it is packed in {container}: {e}")
+                folders.add(os.path.dirname(entry["path"]))
+        for folder in folders - {root}:
+            try:
+                os.rmdir(folder)
+            except OSError:
+                pass
+        return len(packed)
+
+    @staticmethod
+    def _pack(out: ZipFile, path: str, member: str) -> str:
+        stat = os.stat(path)
+        info = ZipInfo(member, time.localtime(max(stat.st_mtime, 315532800))[:6])
+        info.compress_type = ZIP_STORED
+        hasher = new_hasher()
+        with open(path, "rb") as src, out.open(info, "w", force_zip64=stat.st_size >= _ZIP64_SIZE) as dst:
+            _copy(src, dst, hasher)
+        return hasher.hexdigest()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def _save_directory(container: str):
+    """Keep the central directory (and end record) of container, with its offset, in <container>.dir."""
+    with open(container, "rb") as file:
+        with ZipFile(file) as zf:
+            start = zf.start_dir
+        file.seek(start)
+        tail = file.read()
+    tmp_path = container + _DIRECTORY_SUFFIX + ".tmp"
+    with open(tmp_path, "wb") as file:
+        file.write(start.to_bytes(8, "little") + tail)
+    os.replace(tmp_path, container + _DIRECTORY_SUFFIX)
+
+
+def _restore_directory(container: str):
+    """Undo an unfinished append: cut container back to its saved central directory."""
+    saved = container + _DIRECTORY_SUFFIX
+    try:
+        with open(saved, "rb") as file:
+            data = file.read()
+    except FileNotFoundError:
+        return
+    start = int.from_bytes(data[:8], "little")
+    with open(container, "r+b") as file:
+        file.truncate(start)
+        file.seek(start)
+        file.write(data[8:])
+    os.remove(saved)
+    logger.warning(f"Rolled {container} back to before an unfinished append")
+
+
+def _copy(src, dst, hasher=None):
+    while True:
+        chunk = src.read(BUFFER_SIZE)
+        if not chunk:
+            return
+        if hasher is not None:
+            hasher.update(chunk)
+        dst.write(chunk)
+
+
+_archive: Optional[MovedArchive] = None
+_settings = {"compact": True}
+
+
+def configure(path: Optional[str] = None, loose_months: int = DEFAULT_LOOSE_MONTHS, compact: bool = True):
+    """Open the moved archive index at path; without a path nothing is indexed, checked or compacted."""
+    global _archive
+    if _archive is not None:
+        _archive.close()
+    _archive = MovedArchive(path, loose_months) if path else None
+    _settings["compact"] = compact
+    if _archive is not None:
+        logger.debug(f"Moved archive index at {path}")
+
+
+def enabled() -> bool:
+    return _archive is not None
+
+
+def record(path: str, root: str, date: Optional[datetime.datetime]):
+    """Index a file just archived at path under root (a moved/ folder or Combined Outputs)."""
+    if _archive is None:
+        return
+    try:
+        size = os.stat(path).st_size
+    except OSError as e:
+        logger.warning(f"Could not index archived file {path}: {e}")
+        return
+    _archive.record(os.path.basename(path), size, month_of(date), root, path)
+
+
+def duplicate_of(path: str) -> Optional[dict]:
+    """The archived file path is an exact copy of (same name, size and SHA-256), or None."""
+    if _archive is None:
+        return None
+    try:
+        size = os.stat(path).st_size
+    except OSError:
+        return None
+    return _archive.duplicate_of(path, size)
+
+
+def find(name: str) -> List[dict]:
+    return _archive.find(name) if _archive is not None else []
+
+
+def compact_due() -> int:
+    """Compact every month past loose_months; returns the files packed.
+
+    A month is compacted by one worker: the others see its lease in the
+    archive folder and leave it. The lease is renewed by its heartbeat for as
+    long as the compaction takes.
+    """
+    if _archive is None or not _settings["compact"]:
+        return 0
+    packed = 0
+    for root, month in _archive.due():
+        with LeaseManager(os.path.join(root, LEASE_DIR), leases.lease_seconds()) as lease:
+            if not lease.claim(month):
+                continue
+            try:
+                count = _archive.compact(root, month)
+                logger.info(f"Compacted {count} archived files of {month} into {os.path.join(root, month)}"
+                            f"{CONTAINER_SUFFIX}")
+                packed += count
+            except Exception as e:
+                logger.error(f"Failed to compact {month} in {root}: {e}")
+    return packed
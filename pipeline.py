@@ -0,0 +1,185 @@
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional
+
+from loguru import logger
+
+import metrics
+
+
+DEFAULT_QUEUE_SIZE = 64
+
+# put on a stage's queue to stop one of its workers
+_STOP = object()
+
+# emit(stage name, item) hands an item to another stage
+Emit = Callable[[str, object], None]
+
+
+class Stage:
+    """A named step of a Pipeline: `workers` threads calling fn(item, emit) on items from a bounded queue.
+
+    fn passes its results on with emit; when the next stage's queue is full,
+    emit blocks, which slows this stage down to the pace of the next one.
+    """
+
+    def __init__(self, name: str, fn: Callable[[object, Emit], None], workers: int = 1,
+                 queue_size: int = DEFAULT_QUEUE_SIZE):
+        self.name = name
+        self.fn = fn
+        self.workers = max(1, workers)
+        self.queue: "queue.Queue" = queue.Queue(maxsize=max(1, queue_size))
+        self.items = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+        # time this stage's workers spent waiting on a full downstream queue
+        self.blocked_seconds = 0.0
+        self.peak_queue = 0
+        self._lock = threading.Lock()
+
+    def _note(self, **amounts):
+        with self._lock:
+            for name, amount in amounts.items():
+                setattr(self, name, getattr(self, name) + amount)
+
+
+class Budget:
+    """Caps what the items in flight hold in memory: bytes of their files and open workbooks.
+
+    hold() blocks until the item fits. An item bigger than the whole byte
+    budget is let through once nothing else is held, so it can never wait forever.
+    """
+
+    def __init__(self, max_bytes: int, max_workbooks: int = 1):
+        self.max_bytes = max(1, max_bytes)
+        self.max_workbooks = max(1, max_workbooks)
+        self.bytes = 0
+        self.workbooks = 0
+        self.peak_bytes = 0
+        # time items spent waiting for room in the budget
+        self.waited_seconds = 0.0
+        self._room = threading.Condition()
+
+    @contextmanager
+    def hold(self, size: int = 0, workbooks: int = 0):
+        size = min(size, self.max_bytes)
+        start = time.perf_counter()
+        with self._room:
+            self._room.wait_for(lambda: self.bytes + size <= self.max_bytes
+                                and self.workbooks + workbooks <= self.max_workbooks)
+            self.bytes += size
+            self.workbooks += workbooks
+            self.peak_bytes = max(self.peak_bytes, self.bytes)
+            self.waited_seconds += time.perf_counter() - start
+        try:
+            yield
+        finally:
+            with self._room:
+                self.bytes -= size
+                self.workbooks -= workbooks
+                self._room.notify_all()
+
+
+_settings = {"queue_size": DEFAULT_QUEUE_SIZE, "workers": {}}
+
+
+def configure(queue_size: int = None, workers: Dict[str, int] = None):
+    """Set the queue size between stages and override the worker count of stages by name."""
+    if queue_size is not None:
+        _settings["queue_size"] = max(1, queue_size)
+    if workers is not None:
+        _settings["workers"] = dict(workers)
+
+
+def make_stage(name: str, fn: Callable[[object, Emit], None], workers: int = 1) -> Stage:
+    """A Stage with the configured queue size and worker count (workers is the default)."""
+    return Stage(name, fn, _settings["workers"].get(name, workers), _settings["queue_size"])
+
+
+class Pipeline:
+    """Stages connected by bounded queues, every stage with its own worker pool.
+
+    Items enter through run(source, first stage) and travel through the
+    stages their functions emit them to, so slow network copies, CPU-bound
+    Excel splits and zip extractions all make progress at the same time. An
+    exception in a stage is logged and counted; the item is dropped and the
+    rest keep flowing. run() returns when every item has left the pipeline.
+    """
+
+    def __init__(self, stages: Iterable[Stage], metrics_prefix: str = "pipeline"):
+        self.stages: Dict[str, Stage] = {stage.name: stage for stage in stages}
+        self.metrics_prefix = metrics_prefix
+        self._outstanding = 0
+        self._idle = threading.Condition()
+
+    def _emit_from(self, origin: Optional[Stage]) -> Emit:
+        def emit(name: str, item):
+            stage = self.stages[name]
+            with self._idle:
+                self._outstanding += 1
+            start = time.perf_counter()
+            stage.queue.put(item)
+            waited = time.perf_counter() - start
+            if origin is not None:
+                origin._note(blocked_seconds=waited)
+            size = stage.queue.qsize()
+            with stage._lock:
+                stage.peak_queue = max(stage.peak_queue, size)
+
+        return emit
+
+    def _done_with_item(self):
+        with self._idle:
+            self._outstanding -= 1
+            if self._outstanding == 0:
+                self._idle.notify_all()
+
+    def _work(self, stage: Stage):
+        emit = self._emit_from(stage)
+        while True:
+            item = stage.queue.get()
+            if item is _STOP:
+                return
+            start = time.perf_counter()
+            try:
+                stage.fn(item, emit)
+            except Exception as e:
+                stage._note(errors=1)
+                logger.critical(f"Error: {e} in pipeline stage {stage.name} with {item}")
+            finally:
+                stage._note(items=1, busy_seconds=time.perf_counter() - start)
+                self._done_with_item()
+
+    def run(self, source: Iterable, first: str):
+        """Feed every item of source to the stage named first and wait until all work is done."""
+        threads: List[threading.Thread] = []
+        for stage in self.stages.values():
+            for i in range(stage.workers):
+                thread = threading.Thread(target=self._work, args=(stage,), name=f"{stage.name}-{i}", daemon=True)
+                thread.start()
+                threads.append(thread)
+        emit = self._emit_from(None)
+        try:
+            for item in source:
+                emit(first, item)
+            with self._idle:
+                self._idle.wait_for(lambda: self._outstanding == 0)
+        finally:
+            for stage in self.stages.values():
+                for _ in range(stage.workers):
+                    stage.queue.put(_STOP)
+            for thread in threads:
+                thread.join()
+            self.record_metrics()
+
+    def record_metrics(self):
+        for stage in self.stages.values():
+            name = f"{self.metrics_prefix}_{stage.name}"
+            metrics.count(name, files=stage.items, errors=stage.errors)
+            metrics.add_time(name, None, stage.busy_seconds)
+            metrics.add_time(f"{name}_blocked", None, stage.blocked_seconds)
+            logger.debug(f"Pipeline stage {stage.name}: {stage.items} items on {stage.workers} workers, "
+                         f"{stage.busy_seconds:.2f}s busy, {stage.blocked_seconds:.2f}s blocked on the next stage, "
+                         f"queue peak {stage.peak_queue}")
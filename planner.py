@@ -0,0 +1,401 @@
+import datetime
+import json
+import os
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from loguru import logger
+
+from config import InputRule, OutputRule, SplitRule, Rules
+from date_tokens import InvalidDate, date_format, render_destinations
+from file_index import FileIndex, INPUTS, OUTPUTS, OUTBOUND, EPIC_OUTBOUND, LAB_OUTPUTS
+from transfers import host_of
+
+
+COMBINED_OUTPUTS_DIR = '\\\\NT2KWB972SRV03\\SHAREDATA\\CPP-Data\\Sutherland RPA\\Combined Outputs'
+LAB_OUTPUTS_DIR = '\\NASDATA201\\SHAREDATA\\NSHS-CENTRAL-LAB\\SHARED\\BILLING\\RPA Medical Records Denials\\Bot Output Files'
+
+# outbound files use MMDDYYYY in the filename
+OUTBOUND_DATE_FORMATTING = 'MMDDYYYY'
+OUTBOUND_DATE_FORMATTING_DT = '%m%d%Y'
+LAB_OUTPUTS_DATE_FORMATTING = 'MM DD YYYY'
+LAB_OUTPUTS_DATE_FORMATTING_DT = '%m %d %Y'
+
+DEFAULT_BATCH_SIZE = 32
+
+# what happens to a planned file at a target
+MOVE = "move"
+COPY = "copy"
+EXTRACT = "extract"
+SPLIT = "split"
+ARCHIVE = "archive"
+
+# stages whose files are plain transfers, executed in destination batches
+TRANSFER_STAGES = (INPUTS, LAB_OUTPUTS)
+
+
+def _ensure_list(destination: Union[str, List[str]]) -> List[str]:
+    return destination if isinstance(destination, list) else [destination]
+
+
+def folder_of(path: str) -> str:
+    """The folder a target path is in, for Windows ("\\") and POSIX ("/") separators alike."""
+    path = path.rstrip("\\/")
+    cut = max(path.rfind("\\"), path.rfind("/"))
+    return path[:cut] if cut > 0 else path
+
+
+def apply_filename_transform(original_filename: str, transform: dict) -> str:
+    """Apply transformations to a filename (e.g., date offsets).
+
+    Args:
+        original_filename: The original filename (without path).
+        transform: A dict with transformation rules, e.g.:
+            {"date_offset_days": 1, "date_format": "YYYYMMDD", "date_format_dt": "%Y%m%d"}
+
+    Returns:
+        The transformed filename.
+    """
+    if not transform:
+        return original_filename
+
+    date_offset = transform.get("date_offset_days", 0)
+    if date_offset == 0:
+        return original_filename
+
+    fmt = date_format(transform.get("date_format", "YYYYMMDD"), transform.get("date_format_dt", "%Y%m%d"))
+    try:
+        found = fmt.find(original_filename)
+    except InvalidDate as e:
+        logger.warning(f"Failed to apply date offset to {original_filename}: {e}")
+        return original_filename
+    if not found:
+        logger.warning(f"Could not extract date from filename {original_filename} using format {fmt.date_formatting}")
+        return original_filename
+
+    date_str, date_obj = found
+    new_date = date_obj + datetime.timedelta(days=date_offset)
+    new_filename = original_filename.replace(date_str, new_date.strftime(fmt.date_formatting_dt))
+    logger.debug(f"Transformed filename: {original_filename} -> {new_filename} (offset: {date_offset} days)")
+    return new_filename
+
+
+def destination_targets(fname: str, dests: List[str], transforms: Union[List[dict], None] = None) -> List[str]:
+    """Full target paths of fname in every destination folder, with its per-destination transform applied."""
+    targets = []
+    for i, dest in enumerate(dests):
+        # Apply transformation if provided
+        target_name = fname
+        if transforms and i < len(transforms) and transforms[i]:
+            target_name = apply_filename_transform(fname, transforms[i])
+        targets.append(os.path.join(dest, target_name))
+    return targets
+
+
+def resolve_destinations(file_name: str, destination: Union[str, List[str]], date_formatting: str,
+                         date_formatting_dt: str) -> Tuple[List[str], Optional[datetime.datetime]]:
+    """The destinations with the file's date rendered into their tokens, and that date.
+
+    The destinations are returned unchanged (and the date is None) when the
+    file name carries no date in the given format. Nothing is touched on disk.
+    """
+    date = date_format(date_formatting, date_formatting_dt).parse(file_name)
+    if date is None:
+        return _ensure_list(destination), None
+    return render_destinations(_ensure_list(destination), date), date
+
+
+def input_targets(file: str, rule: InputRule) -> List[str]:
+    """Where an input file ends up: its primary target first, then the copies."""
+    destination = rule.destination
+    if rule.date_formatting:
+        destination, _ = resolve_destinations(file, destination, rule.date_formatting, rule.date_formatting_dt)
+    return destination_targets(os.path.basename(file), _ensure_list(destination), rule.destination_transforms)
+
+
+def output_folder(use_case: str, rule: OutputRule, primary_dest: str, date: datetime.datetime) -> str:
+    """The dated folder an output zip is extracted into, below its rendered primary destination."""
+    if use_case == 'chargecorrection':
+        fldr_frmt = '%m%d%Y'
+        primary_dest = f'{primary_dest}{date.strftime(fldr_frmt)}/'
+    return f'{primary_dest}{date.strftime(rule.date_formatting_dt)}'
+
+
+def lab_output_target(output_file: str) -> Optional[str]:
+    """Where a Labappeals Output workbook is moved, None when its name has no date."""
+    destination, date = resolve_destinations(output_file, LAB_OUTPUTS_DIR, LAB_OUTPUTS_DATE_FORMATTING,
+                                           LAB_OUTPUTS_DATE_FORMATTING_DT)
+    if date is None:
+        return None
+    file_name_base = os.path.basename(output_file).split(' - ')[0]
+    file_name = file_name_base + " - " + date.strftime('%m%d%Y') + ".xlsx"
+    return f'{destination[0]}/{file_name}'
+
+
+def moved_root(source_dir: str) -> str:
+    """The folder extracted zips are archived under, one subfolder per month."""
+    return f'{source_dir}/moved'
+
+
+def moved_target(file: str, source_dir: str, date: datetime.datetime) -> Tuple[str, str]:
+    """The moved/ folder an extracted zip is archived in, and its path there."""
+    file_name = os.path.basename(file)
+    moved_folder_date = date.strftime('%Y %m')
+    moved_folder_dir = f'{moved_root(source_dir)}/{moved_folder_date}/'
+    return moved_folder_dir, f'{moved_folder_dir}/{file_name}'
+
+
+def outbound_date(output_file: str) -> Optional[datetime.datetime]:
+    """The date in a combined Outbound workbook's name."""
+    return date_format(OUTBOUND_DATE_FORMATTING, OUTBOUND_DATE_FORMATTING_DT).parse(os.path.basename(output_file))
+
+
+def split_targets(output_file: str, rule: SplitRule) -> Tuple[Optional[str], List[str], Optional[datetime.datetime]]:
+    """The workbook a BotName's rows are written to, the folders it is copied to, and the file's date.
+
+    The path is None when the combined workbook's name has no date.
+    """
+    destinations, date = resolve_destinations(output_file, rule.destination, OUTBOUND_DATE_FORMATTING,
+                                              OUTBOUND_DATE_FORMATTING_DT)
+    if date is None:
+        return None, [], None
+    return os.path.join(destinations[0], rule.output_name(date)), destinations[1:], date
+
+
+def file_date(file_name: str, routes: Iterable[Tuple[str, str]], rules: Rules) -> Optional[datetime.datetime]:
+    """The date in a file's name, read with the date format of the first route that has one."""
+    for stage, use_case in routes:
+        if stage == INPUTS:
+            fmt = rules.inputs[use_case].date_format
+        elif stage == OUTPUTS:
+            fmt = rules.outputs[use_case].date_format
+        elif stage in (OUTBOUND, EPIC_OUTBOUND):
+            fmt = date_format(OUTBOUND_DATE_FORMATTING, OUTBOUND_DATE_FORMATTING_DT)
+        else:
+            fmt = date_format(LAB_OUTPUTS_DATE_FORMATTING, LAB_OUTPUTS_DATE_FORMATTING_DT)
+        try:
+            date = fmt.parse(file_name) if fmt is not None else None
+        except InvalidDate:
+            continue
+        if date is not None:
+            return date
+    return None
+
+
+class Action:
+    """One thing done to a planned file: kind (move, copy, extract, split, archive) at target."""
+
+    __slots__ = ("kind", "target", "use_case")
+
+    def __init__(self, kind: str, target: str, use_case: Optional[str] = None):
+        self.kind = kind
+        self.target = target
+        self.use_case = use_case
+
+    @property
+    def folder(self) -> str:
+        # an extraction target is a folder already
+        return self.target.rstrip("\\/") if self.kind == EXTRACT else folder_of(self.target)
+
+    def to_dict(self) -> dict:
+        data = {"kind": self.kind, "target": self.target}
+        if self.use_case is not None:
+            data["use_case"] = self.use_case
+        return data
+
+
+class PlannedFile:
+    """A file from the inputs folder with every action it will get, its primary destination first."""
+
+    __slots__ = ("source", "stage", "use_case", "size", "actions", "note")
+
+    def __init__(self, source: str, stage: str, use_case: str, size: int, actions: List[Action],
+                 note: Optional[str] = None):
+        self.source = source
+        self.stage = stage
+        self.use_case = use_case
+        self.size = size
+        self.actions = actions
+        # why the file has no actions
+        self.note = note
+
+    @property
+    def group(self) -> Tuple[str, str]:
+        """(host, folder) of the primary destination; ("", "") for a file that goes nowhere."""
+        if not self.actions:
+            return "", ""
+        folder = self.actions[0].folder
+        return host_of(folder), folder
+
+    def __repr__(self):
+        return f"PlannedFile({self.source!r}, {self.stage!r}, {self.use_case!r})"
+
+    def to_dict(self) -> dict:
+        data = {"source": os.path.basename(self.source), "stage": self.stage, "use_case": self.use_case,
+                "size": self.size, "actions": [action.to_dict() for action in self.actions]}
+        if self.note:
+            data["note"] = self.note
+        return data
+
+
+class Batch:
+    """Transfers into the same folder of the same host, executed one after another by one worker."""
+
+    __slots__ = ("host", "folder", "files")
+
+    def __init__(self, host: str, folder: str, files: List[PlannedFile]):
+        self.host = host
+        self.folder = folder
+        self.files = files
+
+    def __repr__(self):
+        return f"Batch({self.host!r}, {self.folder!r}, {len(self.files)} files)"
+
+
+_settings = {"batch_size": DEFAULT_BATCH_SIZE}
+
+
+def configure(batch_size: int = None):
+    """Set the most transfers executed as one batch."""
+    if batch_size is not None:
+        _settings["batch_size"] = max(1, batch_size)
+
+
+class Plan:
+    """Every file of one run resolved to its destinations, before anything is touched."""
+
+    def __init__(self, source_dir: str, files: List[PlannedFile], deferred: Dict[str, List[str]],
+                 unmatched: List[str]):
+        self.source_dir = source_dir
+        self.files = files
+        self.deferred = deferred
+        self.unmatched = unmatched
+
+    def groups(self, stages: Iterable[str] = TRANSFER_STAGES) -> Dict[Tuple[str, str], List[PlannedFile]]:
+        """The files of the given stages by (host, folder) of their primary destination, in host and folder order."""
+        stages = set(stages)
+        groups: Dict[Tuple[str, str], List[PlannedFile]] = {}
+        for planned in self.files:
+            if planned.stage in stages:
+                groups.setdefault(planned.group, []).append(planned)
+        return {key: groups[key] for key in sorted(groups)}
+
+    def batches(self, batch_size: Optional[int] = None) -> List[Batch]:
+        """The transfers cut into batches of one folder each, taking turns between the hosts.
+
+        A folder is written to by a single worker at a time, so its connection
+        and directory listing stay warm, while the hosts take turns so every
+        host's transfer slots are in use at once.
+        """
+        batch_size = batch_size or _settings["batch_size"]
+        by_host: Dict[str, List[Batch]] = {}
+        for (host, folder), files in self.groups().items():
+            for start in range(0, len(files), batch_size):
+                by_host.setdefault(host, []).append(Batch(host, folder, files[start:start + batch_size]))
+        batches = []
+        queues = list(by_host.values())
+        while queues:
+            batches.extend(queue.pop(0) for queue in queues)
+            queues = [queue for queue in queues if queue]
+        return batches
+
+    def heavy(self) -> List[PlannedFile]:
+        """Zips and Outbound workbooks, largest first, so a long extraction or split starts early."""
+        return sorted((planned for planned in self.files if planned.stage not in TRANSFER_STAGES),
+                      key=lambda planned: planned.size, reverse=True)
+
+    def to_dict(self) -> dict:
+        groups = [{"host": host, "folder": folder, "files": [planned.to_dict() for planned in files]}
+                  for (host, folder), files in self.groups(
+                      (INPUTS, LAB_OUTPUTS, OUTPUTS, OUTBOUND, EPIC_OUTBOUND)).items()]
+        return {
+            "source_dir": self.source_dir,
+            "files": len(self.files),
+            "bytes": sum(planned.size for planned in self.files),
+            "groups": groups,
+            "deferred": self.deferred,
+            "unmatched": self.unmatched,
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), indent=2)
+
+
+def _plan_output(file: str, use_case: str, rule: OutputRule, source_dir: str, size: int) -> PlannedFile:
+    destinations, date = resolve_destinations(file, rule.destination, rule.date_formatting, rule.date_formatting_dt)
+    if date is None:
+        return PlannedFile(file, OUTPUTS, use_case, size, [], "no date in the file name, it is not extracted")
+    actions = [Action(EXTRACT, output_folder(use_case, rule, destinations[0], date))]
+    actions += [Action(COPY, target) for target in destination_targets(os.path.basename(file), destinations[1:])]
+    actions.append(Action(ARCHIVE, moved_target(file, source_dir, date)[1]))
+    return PlannedFile(file, OUTPUTS, use_case, size, actions)
+
+
+def _plan_split(file: str, stage: str, rules: Dict[str, SplitRule], source_dir: str, size: int,
+                deferred: Iterable[str]) -> PlannedFile:
+    actions = []
+    for use_case, rule in rules.items():
+        if use_case in deferred:
+            continue
+        target, secondary, _ = split_targets(file, rule)
+        if target is None:
+            continue
+        actions.append(Action(SPLIT, target, use_case))
+        actions += [Action(COPY, copy, use_case) for copy in destination_targets(os.path.basename(target), secondary)]
+    note = None
+    if set(deferred) & rules.keys():
+        note = "deferred use cases are not written, the workbook stays in the inputs folder"
+    else:
+        actions.append(Action(ARCHIVE, file.replace(source_dir, COMBINED_OUTPUTS_DIR)))
+    # a BotName with no rows in the workbook is not written, which only reading it can tell
+    return PlannedFile(file, stage, stage, size, actions, note)
+
+
+def _plan_file(file: str, stage: str, use_case: str, rules: Rules, source_dir: str, size: int,
+               deferred: Dict[str, dict]) -> PlannedFile:
+    if stage == INPUTS:
+        primary, *copies = input_targets(file, rules.inputs[use_case])
+        actions = [Action(MOVE, primary)] + [Action(COPY, target) for target in copies]
+        return PlannedFile(file, stage, use_case, size, actions)
+    elif stage == LAB_OUTPUTS:
+        target = lab_output_target(file)
+        if target is None:
+            return PlannedFile(file, stage, use_case, size, [], "no date in the file name")
+        return PlannedFile(file, stage, use_case, size, [Action(MOVE, target)])
+    elif stage == OUTPUTS:
+        return _plan_output(file, use_case, rules.outputs[use_case], source_dir, size)
+    elif stage == OUTBOUND:
+        return _plan_split(file, stage, rules.shs, source_dir, size, deferred.get("shs", ()))
+    elif stage == EPIC_OUTBOUND:
+        return _plan_split(file, stage, rules.epic_shs, source_dir, size, deferred.get("epic_shs", ()))
+    raise ValueError(f"Unknown stage {stage}")
+
+
+def plan(index: FileIndex, rules: Rules, source_dir: str, deferred: Optional[Dict[str, dict]] = None) -> Plan:
+    """Resolve every indexed file to its destinations without any I/O.
+
+    Uses the same date tokens, destination_transforms and naming as the
+    stages that execute the plan. Every file is planned once, for the first
+    stage and use case it is routed to. deferred is
+    share_health.deferred_use_cases(): those use cases are left out.
+    """
+    deferred = deferred or {}
+    skipped = {INPUTS: deferred.get("inputs", {}), OUTPUTS: deferred.get("outputs", {})}
+    files = []
+    unmatched = []
+    for file_name in index.file_names:
+        file = os.path.join(source_dir, file_name)
+        size = index.size(file)
+        routes = index.routes(file_name)
+        if not routes:
+            unmatched.append(file_name)
+            continue
+        # a file is handled by one stage only, the first it is routed to, so no two workers move the same source
+        stage, use_case = routes[0]
+        if use_case in skipped.get(stage, ()):
+            continue
+        try:
+            files.append(_plan_file(file, stage, use_case, rules, source_dir, size, deferred))
+        except InvalidDate as e:
+            files.append(PlannedFile(file, stage, use_case, size, [], f"{e}; it stays in the inputs folder"))
+    deferred_names = {key: sorted(use_cases) for key, use_cases in deferred.items() if use_cases}
+    return Plan(source_dir, files, deferred_names, unmatched)
@@ -0,0 +1,176 @@
+import collections
+import cProfile
+import datetime
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Dict, List, Optional
+
+from loguru import logger
+
+
+DEFAULT_FOLDER = "./logs"
+# seconds between two stack samples of every thread
+DEFAULT_INTERVAL = 0.005
+
+# filesystem call kinds recorded as spans
+STAT = "stat"
+MAKEDIRS = "makedirs"
+MOVE = "move"
+COPY = "copy"
+EXTRACT = "extract"
+WRITE = "write"
+
+# checked by span(); None outside a profiled run, so a span costs one call and one global lookup
+_active: Optional["Profiler"] = None
+_NULL = nullcontext()
+
+
+class _Span:
+    __slots__ = ("profiler", "kind", "path", "start")
+
+    def __init__(self, profiler: "Profiler", kind: str, path: Optional[str]):
+        self.profiler = profiler
+        self.kind = kind
+        self.path = path
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.record_span(self.kind, self.path, self.start, time.perf_counter() - self.start)
+
+
+def span(kind: str, path: Optional[str] = None):
+    """Time a filesystem call as a span of the running profile; does nothing when not profiling."""
+    profiler = _active
+    if profiler is None:
+        return _NULL
+    return _Span(profiler, kind, None if path is None else str(path))
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class Profiler:
+    """Profiles a whole run, every thread of it.
+
+    - cProfile, deterministic, written as a .prof file for pstats / snakeviz.
+      It is enabled in the calling thread only: Python allows one cProfile at
+      a time (3.12+ raises for a second one), and from 3.12 it sees every
+      thread through sys.monitoring anyway. When another profiler is already
+      active it is left out and the run is covered by the two below.
+    - a sampling thread that records every thread's stack each `interval`
+      seconds, written as collapsed stacks (flamegraph.pl, speedscope); this
+      is what covers the pipeline's stage workers before 3.12.
+    - spans: wall time of each filesystem call made through span(), from any thread.
+    """
+
+    def __init__(self, folder: str = DEFAULT_FOLDER, interval: float = DEFAULT_INTERVAL):
+        self.folder = folder
+        self.interval = interval
+        self.spans: List[tuple] = []
+        self.samples: Dict[str, int] = collections.Counter()
+        self._profile: Optional[cProfile.Profile] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+        self._started = 0.0
+
+    def record_span(self, kind: str, path: Optional[str], start: float, seconds: float):
+        with self._lock:
+            self.spans.append((kind, path, start - self._started, seconds, threading.current_thread().name))
+
+    def _sample(self):
+        sampler = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == sampler:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_name(frame))
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)).rsplit("-", 1)[0])
+                self.samples[";".join(reversed(stack))] += 1
+
+    def start(self):
+        global _active
+        self._started = time.perf_counter()
+        self._sampler = threading.Thread(target=self._sample, name="profiler-sampler", daemon=True)
+        self._sampler.start()
+        _active = self
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError as e:
+            logger.warning(f"Profiling without cProfile, only stack samples and spans: {e}")
+            return
+        self._profile = profile
+
+    def stop(self) -> Dict[str, str]:
+        """Stop profiling and write the profile (when cProfile ran), collapsed stacks and spans; returns their paths."""
+        global _active
+        if self._profile is not None:
+            self._profile.disable()
+        _active = None
+        self._stop.set()
+        self._sampler.join()
+
+        os.makedirs(self.folder, exist_ok=True)
+        stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        paths = {
+            "profile": os.path.join(self.folder, f"profile-{stamp}.prof"),
+            "collapsed": os.path.join(self.folder, f"profile-{stamp}.collapsed"),
+            "spans": os.path.join(self.folder, f"profile-{stamp}.spans.json"),
+        }
+        if self._profile is not None:
+            pstats.Stats(self._profile).dump_stats(paths["profile"])
+        else:
+            del paths["profile"]
+        with open(paths["collapsed"], "w") as file:
+            for stack, count in sorted(self.samples.items()):
+                file.write(f"{stack} {count}\n")
+        with open(paths["spans"], "w") as file:
+            json.dump({"summary": self.span_summary(),
+                       "spans": [{"kind": kind, "path": path, "start": round(start, 6), "seconds": round(seconds, 6),
+                                  "thread": thread} for kind, path, start, seconds, thread in self.spans]},
+                      file, indent=1)
+        return paths
+
+    def span_summary(self) -> Dict[str, dict]:
+        """kind -> calls, total and slowest seconds, and the path of the slowest call."""
+        summary = {}
+        for kind, path, _, seconds, _ in self.spans:
+            entry = summary.setdefault(kind, {"calls": 0, "seconds": 0.0, "max_seconds": 0.0, "slowest": None})
+            entry["calls"] += 1
+            entry["seconds"] += seconds
+            if seconds >= entry["max_seconds"]:
+                entry["max_seconds"] = seconds
+                entry["slowest"] = path
+        return summary
+
+
+@contextmanager
+def profiled(folder: str = DEFAULT_FOLDER, interval: float = DEFAULT_INTERVAL):
+    """Profile the block (see Profiler) and log where the results were written."""
+    profiler = Profiler(folder, interval)
+    profiler.start()
+    try:
+        yield profiler
+    finally:
+        paths = profiler.stop()
+        for kind, entry in sorted(profiler.span_summary().items(), key=lambda item: -item[1]["seconds"]):
+            logger.info(f"Profile: {entry['calls']} {kind} calls took {entry['seconds']:.3f}s, "
+                        f"the slowest {entry['max_seconds']:.3f}s ({entry['slowest']})")
+        if "profile" in paths:
+            logger.info(f"Profile written to {paths['profile']}")
+        logger.info(f"Flamegraph stacks written to {paths['collapsed']}, filesystem spans to {paths['spans']}")
@@ -0,0 +1,205 @@
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+from loguru import logger
+
+from transfers import host_of, LOCAL_HOST
+
+
+DEFAULT_TIMEOUT = 5.0
+# consecutive failed probes before the breaker opens and the share is no longer probed
+DEFAULT_FAILURE_THRESHOLD = 2
+# seconds an open breaker waits before the share is probed again; doubles with every failure after that
+DEFAULT_COOLDOWN = 300.0
+MAX_COOLDOWN = 3600.0
+# a healthy share is not probed again for this long (watch mode runs back to back)
+DEFAULT_RECHECK_AFTER = 60.0
+
+# config key -> where the destination of a use case lives in it
+_DESTINATIONS = {
+    "inputs": lambda use_case_data: use_case_data["inputs"]["destination"],
+    "outputs": lambda use_case_data: use_case_data["destination"],
+    "shs": lambda use_case_data: use_case_data["destination"],
+    "epic_shs": lambda use_case_data: use_case_data["destination"],
+}
+
+
+def share_of(path: str) -> Optional[str]:
+    """The share a UNC path lives on (\\\\NASDATA201\\SHAREDATA for \\\\NASDATA201\\SHAREDATA\\a\\b).
+
+    Local paths have no share and are never probed.
+    """
+    if host_of(path) == LOCAL_HOST:
+        return None
+    parts = [part for part in str(path).replace("/", "\\").split("\\") if part]
+    return "\\\\" + "\\".join(parts[:2]).upper()
+
+
+def use_case_shares(configs: dict) -> Dict[str, Dict[str, Set[str]]]:
+    """config key ("inputs", "outputs", "shs", "epic_shs") -> use case -> the shares it writes to."""
+    shares = {}
+    for key, destination_of in _DESTINATIONS.items():
+        shares[key] = {}
+        for use_case, use_case_data in configs.get(key, {}).items():
+            destinations = destination_of(use_case_data)
+            if not isinstance(destinations, list):
+                destinations = [destinations]
+            shares[key][use_case] = {share for share in map(share_of, destinations) if share}
+    return shares
+
+
+def _default_probe(share: str):
+    if not os.path.isdir(share):
+        raise FileNotFoundError(f"{share} is not reachable")
+
+
+class ShareHealth:
+    """Probes shares concurrently with a hard timeout and keeps a circuit breaker per share.
+
+    A probe that does not answer within the timeout counts as a failure; the
+    probing thread is left behind as a daemon instead of blocking the run on
+    the SMB client's own timeout. After failure_threshold failures in a row
+    the breaker opens: the share is reported down without being probed until
+    its cooldown has passed, and then gets a single probe (half open). The
+    breaker state is saved to state_path so it carries over between runs.
+    """
+
+    def __init__(self, state_path: Optional[str] = None, timeout: float = DEFAULT_TIMEOUT,
+                 failure_threshold: int = DEFAULT_FAILURE_THRESHOLD, cooldown: float = DEFAULT_COOLDOWN,
+                 recheck_after: float = DEFAULT_RECHECK_AFTER, probe: Callable[[str], None] = _default_probe):
+        self.state_path = state_path
+        self.timeout = timeout
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown = cooldown
+        self.recheck_after = recheck_after
+        self._probe = probe
+        self._lock = threading.Lock()
+        # share -> {"healthy", "failures", "open_until", "checked_at", "error"}
+        self.state: Dict[str, dict] = self._load()
+
+    def _load(self) -> Dict[str, dict]:
+        if not self.state_path or not os.path.exists(self.state_path):
+            return {}
+        try:
+            with open(self.state_path) as file:
+                return json.load(file)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable share health state {self.state_path}: {e}")
+            return {}
+
+    def _save(self):
+        if not self.state_path:
+            return
+        folder = os.path.dirname(self.state_path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        tmp_path = f"{self.state_path}.tmp"
+        try:
+            with open(tmp_path, "w") as file:
+                json.dump(self.state, file, indent=4)
+            os.replace(tmp_path, self.state_path)
+        except OSError as e:
+            logger.warning(f"Failed to save share health state: {e}")
+
+    def _needs_probe(self, share: str, now: float) -> bool:
+        entry = self.state.get(share)
+        if entry is None:
+            return True
+        if entry["healthy"]:
+            return now - entry["checked_at"] >= self.recheck_after
+        # open breaker: down without a probe until the cooldown has passed
+        return now >= entry["open_until"]
+
+    def _run_probes(self, shares: List[str]) -> Dict[str, Optional[str]]:
+        """share -> None if it answered in time, else the error."""
+        results: Dict[str, Optional[str]] = {}
+        finished = {share: threading.Event() for share in shares}
+
+        def probe(share):
+            try:
+                self._probe(share)
+                results[share] = None
+            except Exception as e:
+                results[share] = str(e) or type(e).__name__
+            finished[share].set()
+
+        for share in shares:
+            threading.Thread(target=probe, args=(share,), name=f"probe {share}", daemon=True).start()
+        deadline = time.monotonic() + self.timeout
+        for share in shares:
+            if not finished[share].wait(max(0.0, deadline - time.monotonic())):
+                results.setdefault(share, f"no answer within {self.timeout:g}s")
+        return {share: results[share] for share in shares}
+
+    def check(self, shares: Iterable[str]) -> Dict[str, bool]:
+        """share -> healthy, probing the shares that are due for it all at once."""
+        shares = sorted(set(shares))
+        with self._lock:
+            now = time.time()
+            due = [share for share in shares if self._needs_probe(share, now)]
+            for share, error in self._run_probes(due).items():
+                entry = self.state.setdefault(share, {"healthy": True, "failures": 0, "open_until": 0.0,
+                                                      "checked_at": 0.0, "error": None})
+                entry["checked_at"] = now
+                entry["error"] = error
+                if error is None:
+                    if not entry["healthy"]:
+                        logger.success(f"{share} is reachable again")
+                    entry.update(healthy=True, failures=0, open_until=0.0)
+                    continue
+                entry["healthy"] = False
+                entry["failures"] += 1
+                if entry["failures"] >= self.failure_threshold:
+                    backoff = 2 ** (entry["failures"] - self.failure_threshold)
+                    entry["open_until"] = now + min(self.cooldown * backoff, max(self.cooldown, MAX_COOLDOWN))
+                logger.error(f"{share} is unavailable ({error}), failure {entry['failures']} in a row")
+            if due:
+                self._save()
+            return {share: self.state.get(share, {}).get("healthy", True) for share in shares}
+
+    def is_healthy(self, path: str) -> bool:
+        share = share_of(path)
+        with self._lock:
+            return share is None or self.state.get(share, {}).get("healthy", True)
+
+
+_health = ShareHealth()
+
+
+def configure(state_path: Optional[str] = None, timeout: float = DEFAULT_TIMEOUT,
+              failure_threshold: int = DEFAULT_FAILURE_THRESHOLD, cooldown: float = DEFAULT_COOLDOWN,
+              recheck_after: float = DEFAULT_RECHECK_AFTER):
+    """Set the probe timeout and breaker settings; state_path keeps the breakers across runs."""
+    global _health
+    _health = ShareHealth(state_path, timeout, failure_threshold, cooldown, recheck_after)
+
+
+def check(paths: Iterable[str]) -> Dict[str, bool]:
+    """Probe the shares of the given paths; share -> healthy."""
+    return _health.check(share for share in map(share_of, paths) if share)
+
+
+def is_healthy(path: str) -> bool:
+    """Whether the share of path passed its last probe (local paths always do)."""
+    return _health.is_healthy(path)
+
+
+def deferred_use_cases(configs: dict) -> Dict[str, Dict[str, Set[str]]]:
+    """Probe every share the configs write to.
+
+    Returns, per config key, the use cases to defer this run and the shares
+    that are down for each of them.
+    """
+    shares = use_case_shares(configs)
+    health = check({share for use_cases in shares.values() for s in use_cases.values() for share in s})
+    deferred = {}
+    for key, use_cases in shares.items():
+        deferred[key] = {}
+        for use_case, needed in use_cases.items():
+            down = {share for share in needed if not health.get(share, True)}
+            if down:
+                deferred[key][use_case] = down
+    return deferred
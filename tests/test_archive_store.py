@@ -0,0 +1,91 @@
+import os
+
+import pytest
+
+import archive_store
+from functions import move_single_file
+
+
+@pytest.fixture
+def store(tmp_path):
+    def open_store(mode=archive_store.LINK):
+        archive_store.configure(str(tmp_path / "store" / "archive.sqlite3"), mode)
+        return archive_store
+
+    yield open_store
+    archive_store.configure(None)
+
+
+def _drop(folder, name, content):
+    folder.mkdir(exist_ok=True)
+    path = folder / name
+    path.write_bytes(content)
+    return str(path)
+
+
+def test_redropped_file_is_hardlinked_in_the_archive(tmp_path, store):
+    store()
+    inputs = tmp_path / "inputs"
+    content = b"claim batch" * 1000
+
+    assert move_single_file(_drop(inputs, "a_01152025.xls", content),
+                            [str(tmp_path / "primary"), str(tmp_path / "archive" / "0115")])
+    assert move_single_file(_drop(inputs, "a_01152025.xls", content),
+                            [str(tmp_path / "primary2"), str(tmp_path / "archive" / "0116")])
+
+    first = tmp_path / "archive" / "0115" / "a_01152025.xls"
+    second = tmp_path / "archive" / "0116" / "a_01152025.xls"
+    assert second.read_bytes() == content
+    assert os.path.samefile(first, second)
+
+
+def test_new_content_of_a_known_size_is_still_copied(tmp_path, store):
+    store()
+    inputs = tmp_path / "inputs"
+
+    move_single_file(_drop(inputs, "a.xls", b"1" * 64), [str(tmp_path / "primary"), str(tmp_path / "archive1")])
+    move_single_file(_drop(inputs, "a.xls", b"2" * 64), [str(tmp_path / "primary"), str(tmp_path / "archive2")])
+
+    assert (tmp_path / "archive2" / "a.xls").read_bytes() == b"2" * 64
+    assert not os.path.samefile(tmp_path / "archive1" / "a.xls", tmp_path / "archive2" / "a.xls")
+
+
+def test_pointer_mode_writes_a_reference_instead_of_a_copy(tmp_path, store):
+    store(archive_store.POINTER)
+    inputs = tmp_path / "inputs"
+
+    move_single_file(_drop(inputs, "a.xls", b"same"), [str(tmp_path / "p1"), str(tmp_path / "archive1")])
+    move_single_file(_drop(inputs, "a.xls", b"same"), [str(tmp_path / "p2"), str(tmp_path / "archive2")])
+
+    assert not (tmp_path / "archive2" / "a.xls").exists()
+    pointer = (tmp_path / "archive2" / "a.xls.ref").read_text().strip()
+    assert pointer == str(tmp_path / "archive1" / "a.xls")
+
+
+def test_a_deleted_archive_copy_is_not_reused(tmp_path, store):
+    store()
+    inputs = tmp_path / "inputs"
+
+    move_single_file(_drop(inputs, "a.xls", b"same"), [str(tmp_path / "p1"), str(tmp_path / "archive1")])
+    os.remove(tmp_path / "archive1" / "a.xls")
+    move_single_file(_drop(inputs, "a.xls", b"same"), [str(tmp_path / "p2"), str(tmp_path / "archive2")])
+
+    assert (tmp_path / "archive2" / "a.xls").read_bytes() == b"same"
+    assert archive_store.find(archive_store.file_digest(str(tmp_path / "archive2" / "a.xls")), 4) == \
+        str(tmp_path / "archive2" / "a.xls")
+
+
+def test_a_size_match_is_hashed_during_the_transfer_not_before(tmp_path, store, monkeypatch):
+    import functions
+    store()
+    inputs = tmp_path / "inputs"
+    monkeypatch.setattr(functions, "_same_filesystem", lambda path, folder: False)
+    move_single_file(_drop(inputs, "a.xls", b"same"), [str(tmp_path / "p1"), str(tmp_path / "archive1")])
+
+    hashed_up_front = []
+    monkeypatch.setattr(archive_store, "file_digest", lambda path, *args: hashed_up_front.append(path))
+    move_single_file(_drop(inputs, "a.xls", b"same"), [str(tmp_path / "p2"), str(tmp_path / "archive2")])
+
+    assert hashed_up_front == []
+    assert (tmp_path / "p2" / "a.xls").read_bytes() == b"same"
+    assert os.path.samefile(tmp_path / "archive1" / "a.xls", tmp_path / "archive2" / "a.xls")
@@ -0,0 +1,91 @@
+import datetime
+import json
+import threading
+import time
+
+import backlog
+from backlog import Backlog, TODAY_FIRST, TODAY_LAST, IN_ORDER
+from config import compile_rules
+from file_index import PatternMatcher, build_rules
+from pipeline import Budget
+
+NOW = datetime.datetime(2025, 1, 20, 9, 0)
+
+
+def _names(policy, files, attempted=None):
+    queue = Backlog(policy, attempted, now=NOW)
+    for name, date in files:
+        queue.add(name, 1, date)
+    return [name for name, _ in queue.take(len(files))]
+
+
+def test_oldest_files_first_and_today_by_policy():
+    files = [("today", datetime.datetime(2025, 1, 20)), ("friday", datetime.datetime(2025, 1, 17)),
+             ("undated", None), ("thursday", datetime.datetime(2025, 1, 16))]
+
+    assert _names(TODAY_LAST, files) == ["thursday", "friday", "today", "undated"]
+    assert _names(TODAY_FIRST, files) == ["today", "undated", "thursday", "friday"]
+    assert _names(IN_ORDER, files) == ["thursday", "friday", "today", "undated"]
+
+
+def test_files_attempted_by_an_interrupted_catch_up_go_last():
+    files = [("stuck", datetime.datetime(2025, 1, 10)), ("fresh", datetime.datetime(2025, 1, 17))]
+    assert _names(TODAY_LAST, files, {"stuck": 1}) == ["fresh", "stuck"]
+    # a file of another size is a new file under the same name
+    assert _names(TODAY_LAST, files, {"stuck": 2}) == ["stuck", "fresh"]
+
+
+def test_budget_holds_back_items_until_they_fit():
+    budget = Budget(max_bytes=100, max_workbooks=1)
+    inside = []
+    # bytes held by the items inside the budget, every time one got in
+    peak = []
+    lock = threading.Lock()
+
+    def work(size, workbooks):
+        with budget.hold(size, workbooks):
+            with lock:
+                inside.append(size)
+                peak.append(sum(inside))
+            time.sleep(0.02)
+            with lock:
+                inside.remove(size)
+
+    threads = [threading.Thread(target=work, args=(60, 0)) for _ in range(3)]
+    threads += [threading.Thread(target=work, args=(500, 0))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # the 500 byte file is let through on its own, the others one at a time
+    assert all(p <= 100 or p == 500 for p in peak)
+    assert budget.bytes == 0 and budget.peak_bytes == 100
+
+
+def test_catch_up_drains_the_backlog_in_chunks_and_checkpoints(tmp_path, monkeypatch):
+    src_dir = tmp_path / "inputs"
+    src_dir.mkdir()
+    for day in (17, 15, 16):
+        (src_dir / f"ECHO_01{day}2025.xls").write_text(str(day))
+    (src_dir / "notes.txt").write_text("not ours")
+    configs = {"inputs": {"echo": {"inputs": {"name": "ECHO_*.xls", "destination": str(tmp_path / "echo"),
+                                              "date_formatting": "MMDDYYYY", "date_formatting_dt": "%m%d%Y"}}}}
+    rules = compile_rules(configs)
+    matcher = PatternMatcher(build_rules(rules.inputs))
+    checkpoint_path = tmp_path / "catch_up.json"
+    monkeypatch.setattr(backlog, "_settings", dict(backlog._settings, chunk_files=2,
+                                                   checkpoint_path=str(checkpoint_path)))
+    chunks = []
+    real_distribute = backlog.distribute
+    monkeypatch.setattr(backlog, "distribute", lambda index, *args: chunks.append(index.file_names)
+                        or real_distribute(index, *args))
+
+    assert backlog.catch_up(str(src_dir), rules, matcher)
+
+    assert chunks == [["ECHO_01152025.xls", "ECHO_01162025.xls"], ["ECHO_01172025.xls"]]
+    assert sorted(p.name for p in (tmp_path / "echo").iterdir()) == [
+        "ECHO_01152025.xls", "ECHO_01162025.xls", "ECHO_01172025.xls"]
+    checkpoint = json.loads(checkpoint_path.read_text())
+    assert checkpoint["finished"] and checkpoint["chunks"] == 2 and checkpoint["files_done"] == 3
+    assert (src_dir / "notes.txt").exists()
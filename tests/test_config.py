@@ -0,0 +1,104 @@
+import json
+import os
+import shutil
+
+import pytest
+
+import config
+import date_tokens
+from config import ConfigError, InputRule, OutputRule, SplitRule, compile_rules
+
+REPO_JSON = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "json_data")
+
+
+@pytest.fixture
+def config_dir(tmp_path):
+    for file_name in config.FILES.values():
+        shutil.copy(os.path.join(REPO_JSON, file_name), tmp_path / file_name)
+    return tmp_path
+
+
+def test_repository_configs_compile():
+    configs = config.load(REPO_JSON)
+    rules = configs["rules"]
+    assert set(rules.inputs) == set(configs["inputs"])
+    assert all(isinstance(rule, OutputRule) for rule in rules.outputs.values())
+    assert all(isinstance(rule, SplitRule) for rule in rules.epic_shs.values())
+
+
+def test_every_problem_is_reported_at_once():
+    configs = {
+        "inputs": {"a": {"inputs": {"name": "A_*.xls", "destinaton": "\\\\HOST\\S\\a"}}},
+        "outputs": {"b": {"zip_name": "B_??.zip", "date_formatting": "QQ", "date_formatting_dt": "%d",
+                          "destination": "\\\\HOST\\S\\b\\"}},
+        "shs": {"c": {"BotName": "C", "destination": [], "file_name": "C.xlsx", "date_format": "YYYYMMDD"}},
+    }
+    with pytest.raises(ConfigError) as error:
+        compile_rules(configs)
+    message = str(error.value)
+    assert "inputs.json a: missing 'destination'" in message
+    assert "inputs.json a: unknown key 'destinaton'" in message
+    assert "outputs.json b: unsupported date format 'QQ'" in message
+    assert "outbound_shs.json c: destination must be a path" in message
+    assert "outbound_shs.json c: file_name does not contain its date_format" in message
+
+
+def test_rules_have_slots_and_typed_fields():
+    rule = InputRule.of("a", {"name": "A_*.xls", "destination": ["\\\\H\\S\\a", "\\\\H\\S\\archive"],
+                              "date_formatting": "MMDDYYYY", "date_formatting_dt": "%m%d%Y"})
+    assert not hasattr(rule, "__dict__")
+    assert rule.date_format.parse("A_01152025.xls").day == 15
+    assert InputRule.of("a", rule) is rule
+
+
+def test_split_rule_output_name():
+    import datetime
+    rule = SplitRule.of("c", {"BotName": "C", "destination": "\\\\H\\S\\c", "file_name": "YYYYMMDD_C.xlsx",
+                              "date_format": "YYYYMMDD"})
+    assert rule.output_name(datetime.datetime(2025, 1, 15)) == "20250115_C.xlsx"
+
+
+def test_cache_is_reused_until_a_config_changes(config_dir, monkeypatch):
+    cache_path = str(config_dir / "cache" / "configs.pickle")
+    first = config.load(str(config_dir), cache_path)
+    assert os.path.exists(cache_path)
+
+    compiled = []
+    real_compile = config.compile_rules
+    monkeypatch.setattr(config, "compile_rules", lambda configs: compiled.append(1) or real_compile(configs))
+
+    built = []
+    real_matcher = config.PatternMatcher
+    monkeypatch.setattr(config, "PatternMatcher", lambda rules: built.append(1) or real_matcher(rules))
+    monkeypatch.setattr(date_tokens, "_formats", {})
+    monkeypatch.setattr(date_tokens, "_templates", {})
+
+    cached = config.load(str(config_dir), cache_path)
+    assert compiled == [] and built == []
+    assert set(cached["rules"].outputs) == set(first["rules"].outputs)
+    assert cached["matcher"].rules == first["matcher"].rules
+    # the formats and templates come back compiled, the next lookup does not build them again
+    rule = next(iter(cached["rules"].outputs.values()))
+    assert (rule.date_formatting, rule.date_formatting_dt) in date_tokens._formats
+    assert rule.date_format is date_tokens._formats[(rule.date_formatting, rule.date_formatting_dt)]
+
+    outputs_path = config_dir / "outputs.json"
+    outputs = json.loads(outputs_path.read_text())
+    outputs.popitem()
+    outputs_path.write_text(json.dumps(outputs))
+    changed = config.load(str(config_dir), cache_path)
+    assert compiled == [1]
+    assert len(changed["rules"].outputs) == len(first["rules"].outputs) - 1
+
+
+def test_merged_archive_path_needs_a_date():
+    import datetime
+    data = {"zip_name": "L_*.zip", "date_formatting": "MM_DD_YY", "date_formatting_dt": "%m_%d_%y",
+            "destination": "\\\\H\\S\\l\\", "merged_archive": {"path": "\\\\H\\S\\MM_DD_YY\\L_MM_DD_YYYY.zip",
+                                                                "members": "*_Merged*"}}
+    rule = OutputRule.of("l", data)
+    assert rule.merged_archive.path_for(datetime.datetime(2025, 1, 15)) == "\\\\H\\S\\01_15_25\\L_01_15_2025.zip"
+
+    data["merged_archive"] = {"path": "\\\\H\\S\\merged.zip", "members": "*_Merged*"}
+    with pytest.raises(ConfigError, match="merged_archive: path must be a path with a date"):
+        OutputRule.of("l", data)
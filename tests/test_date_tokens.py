@@ -0,0 +1,61 @@
+
+import datetime
+
+import pytest
+
+from date_tokens import DateFormat, DestinationTemplate, InvalidDate, compile_configs, date_format, template
+
+
+def test_date_format_parses_every_supported_layout():
+    assert DateFormat("MM_DD_YY", "%m_%d_%y").parse("Allscripts_01_15_25.zip") == datetime.datetime(2025, 1, 15)
+    assert DateFormat("MM_DD_YYYY", "%m_%d_%Y").parse("EPIC_Codify_01_15_2025.zip") == datetime.datetime(2025, 1, 15)
+    assert DateFormat("MMDDYYYY", "%m%d%Y").parse("Outbound_01152025.xlsx") == datetime.datetime(2025, 1, 15)
+    assert DateFormat("MM DD YYYY", "%m %d %Y").parse("Labappeals Output - 01 15 2025.xlsx") == datetime.datetime(2025, 1, 15)
+    assert DateFormat("YYMMDD", "%y%m%d").parse("Report_250115.txt") == datetime.datetime(2025, 1, 15)
+
+
+def test_date_format_returns_none_for_missing_dates():
+    fmt = DateFormat("MMDDYYYY", "%m%d%Y")
+    assert fmt.parse("Outbound.xlsx") is None
+    assert DateFormat("MM_DD", "%m_%d").parse("file_01_15.txt") is None
+
+
+def test_date_format_raises_for_a_date_that_does_not_parse():
+    with pytest.raises(InvalidDate, match="99999999"):
+        DateFormat("MMDDYYYY", "%m%d%Y").parse("Outbound_99999999.xlsx")
+
+
+def test_date_format_memoizes_per_filename():
+    fmt = DateFormat("MMDDYYYY", "%m%d%Y")
+    for _ in range(3):
+        fmt.parse("Outbound_01152025.xlsx")
+    assert fmt.find.cache_info().hits == 2
+    assert fmt.find.cache_info().misses == 1
+
+
+def test_template_renders_tokens_in_one_pass():
+    date = datetime.datetime(2025, 1, 5)
+    assert DestinationTemplate("C:\\out\\YYYY\\MM YYYY\\").render(date) == "C:\\out\\2025\\01 2025\\"
+    assert DestinationTemplate("YY-MM-DD").render(date) == "25-01-05"
+    # rendered digits are never scanned again and YYYY is not split into YY YY
+    assert DestinationTemplate("YYYYYY").render(date) == "202525"
+    assert DestinationTemplate("C:\\static").render(date) == "C:\\static"
+
+
+def test_compile_configs_caches_formats_and_templates():
+    configs = {
+        "inputs": {"cc": {"inputs": {"name": "*.csv", "destination": "X\\YYYY\\MM YYYY",
+                                     "date_formatting": "MMDDYYYY", "date_formatting_dt": "%m%d%Y"}}},
+        "outputs": {"aehr": {"zip_name": "*.zip", "date_formatting": "MM_DD_YY", "date_formatting_dt": "%m_%d_%y",
+                             "destination": ["A\\YYYY\\", "B\\YYYY\\"]}},
+        "shs": {"mr": {"BotName": "MRAuditPull", "destination": "M\\", "file_name": "MR_MMDDYYYY.xlsx",
+                       "date_format": "MMDDYYYY"}},
+        "epic_shs": {},
+    }
+    compile_configs(configs)
+    assert date_format("MM_DD_YY", "%m_%d_%y") is date_format("MM_DD_YY", "%m_%d_%y")
+    assert template("A\\YYYY\\") is template("A\\YYYY\\")
+
+
+if __name__ == "__main__":
+    pytest.main(["-q"])
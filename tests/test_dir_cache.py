@@ -0,0 +1,48 @@
+
+import pytest
+
+from dir_cache import DirectoryCache
+
+
+def test_ensure_creates_once_and_counts_hits(tmp_path):
+    cache = DirectoryCache()
+    target = tmp_path / "2025" / "01 2025"
+
+    assert cache.ensure(str(target))
+    assert target.is_dir()
+    assert cache.ensure(str(target))
+    assert cache.ensure(str(target) + "/")
+    assert cache.stats() == {"hits": 2, "misses": 1, "cached": 1}
+
+
+def test_exists_only_caches_folders_that_were_found(tmp_path):
+    cache = DirectoryCache()
+    target = tmp_path / "later"
+
+    assert not cache.exists(str(target))
+    target.mkdir()
+    assert cache.exists(str(target))
+    assert cache.exists(str(target))
+    assert cache.stats()["hits"] == 1
+
+
+def test_invalidate_forces_a_recheck(tmp_path):
+    cache = DirectoryCache()
+    target = tmp_path / "gone"
+    cache.ensure(str(target))
+    target.rmdir()
+
+    cache.invalidate(str(target))
+    assert not cache.exists(str(target))
+
+
+def test_reset_clears_folders_and_counters(tmp_path):
+    cache = DirectoryCache()
+    cache.ensure(str(tmp_path / "a"))
+    cache.ensure(str(tmp_path / "a"))
+    cache.reset()
+    assert cache.stats() == {"hits": 0, "misses": 0, "cached": 0}
+
+
+if __name__ == "__main__":
+    pytest.main(["-q"])
@@ -0,0 +1,54 @@
+
+import pandas as pd
+import pytest
+
+import excel_io
+from excel_io import engine_available, read_workbook, write_workbook
+
+
+FRAME = pd.DataFrame({
+    "BotName": ["MRAuditPull", "LabAppeals", "MRAuditPull"],
+    "Account": [1, 2, 3],
+    "Balance": [10.5, None, 3.25],
+    "ServiceDate": pd.to_datetime(["2025-01-02", "2025-01-03", None]),
+})
+
+
+@pytest.mark.parametrize("write_engine", excel_io.WRITE_ENGINES)
+@pytest.mark.parametrize("read_engine", excel_io.READ_ENGINES)
+def test_round_trip_through_every_engine(tmp_path, write_engine, read_engine):
+    if not (engine_available(write_engine) and engine_available(read_engine)):
+        pytest.skip("engine not installed")
+    path = tmp_path / "split.xlsx"
+
+    write_workbook(FRAME, str(path), engine=write_engine)
+    result = read_workbook(str(path), engine=read_engine)
+
+    assert list(result.columns) == list(FRAME.columns)
+    assert result["BotName"].tolist() == FRAME["BotName"].tolist()
+    assert result["Account"].tolist() == [1, 2, 3]
+    assert pd.isna(result["Balance"][1])
+    assert pd.Timestamp(result["ServiceDate"][0]) == pd.Timestamp("2025-01-02")
+    assert pd.isna(result["ServiceDate"][2])
+
+
+def test_configure_rejects_unknown_engine():
+    with pytest.raises(ValueError):
+        excel_io.configure(read_engine="xlrd")
+
+
+def test_round_trip_in_a_worker_process(tmp_path):
+    path = tmp_path / "split.xlsx"
+    excel_io.configure(processes=1)
+    try:
+        write_workbook(FRAME, str(path))
+        result = read_workbook(str(path))
+    finally:
+        excel_io.configure(processes=0)
+
+    assert result["BotName"].tolist() == FRAME["BotName"].tolist()
+    assert result["Account"].tolist() == [1, 2, 3]
+
+
+if __name__ == "__main__":
+    pytest.main(["-q"])
@@ -0,0 +1,45 @@
+
+import pytest
+
+from file_index import PatternMatcher, FileIndex, build_rules, INPUTS, OUTPUTS, OUTBOUND
+
+
+INPUTS_CONFIG = {
+    "aehr": {"inputs": {"name": "GECB_MedicalRecord_Inbound_????????.xls", "destination": "a"}},
+    "aehr oc": {"inputs": {"name": "GECB_MedicalRecord_Inbound_*_OnC.xls", "destination": "b"}},
+    "EPIC Lab Appeals Outbound": {"inputs": {"name": "EPIC_LabAppeals_Outbound_*.xlsx", "destination": "c"}},
+    "EPIC Outbounds": {"inputs": {"name": "EPIC_*_Outbound_*.xlsx", "destination": "d"}},
+}
+OUTPUTS_CONFIG = {
+    "aehr": {"zip_name": "Allscripts_*.zip"},
+}
+
+
+def test_pattern_matcher_routes_to_the_first_matching_use_case():
+    matcher = PatternMatcher(build_rules(INPUTS_CONFIG, OUTPUTS_CONFIG, {}, {}))
+
+    assert matcher.match("GECB_MedicalRecord_Inbound_01022025.xls") == [(INPUTS, "aehr")]
+    assert matcher.match("GECB_MedicalRecord_Inbound_01022025_OnC.xls") == [(INPUTS, "aehr oc")]
+    assert matcher.match("EPIC_LabAppeals_Outbound_01022025.xlsx") == [(INPUTS, "EPIC Lab Appeals Outbound")]
+    assert matcher.match("EPIC_Radiology_Outbound_01022025.xlsx") == [(INPUTS, "EPIC Outbounds")]
+    assert matcher.match("Allscripts_01_02_25.zip") == [(OUTPUTS, "aehr")]
+    assert matcher.match("Outbound_01022025.xlsx") == [(OUTBOUND, OUTBOUND)]
+    assert matcher.match("unrelated.pdf") == []
+
+
+def test_file_index_scans_directory_once(tmp_path):
+    (tmp_path / "GECB_MedicalRecord_Inbound_01022025.xls").write_text("x")
+    (tmp_path / "Allscripts_01_02_25.zip").write_text("x")
+    (tmp_path / "~$Outbound_01022025.xlsx").write_text("x")
+    (tmp_path / "subdir.zip").mkdir()
+
+    index = FileIndex.scan(str(tmp_path), PatternMatcher(build_rules(INPUTS_CONFIG, OUTPUTS_CONFIG, {}, {})))
+
+    assert sorted(index.file_names) == ["Allscripts_01_02_25.zip", "GECB_MedicalRecord_Inbound_01022025.xls"]
+    assert index.files(INPUTS, "aehr") == [str(tmp_path / "GECB_MedicalRecord_Inbound_01022025.xls")]
+    assert index.files(OUTPUTS, "aehr") == [str(tmp_path / "Allscripts_01_02_25.zip")]
+    assert index.files(OUTBOUND) == []
+
+
+if __name__ == "__main__":
+    pytest.main(["-q"])
@@ -1,7 +1,12 @@
 
+import zipfile
+
+import pandas as pd
 import pytest
+from loguru import logger
 
-from functions import _ensure_list_destination, move_single_file, _apply_filename_transform
+import functions
+from functions import _ensure_list_destination, move_single_file, _apply_filename_transform, move_inputs, parse_output_files
 
 
 def test_ensure_list_destination_with_string():
@@ -38,6 +43,35 @@ def test_move_single_file_with_secondary_copy(tmp_path):
     assert (secondary / "example.txt").exists()
 
 
+def test_move_single_file_across_filesystems_reads_source_once(tmp_path, monkeypatch):
+    src = tmp_path / "example.txt"
+    src.write_text("hello")
+    primary = tmp_path / "primary"
+    secondary = tmp_path / "secondary"
+    monkeypatch.setattr(functions, "_same_filesystem", lambda path, folder: False)
+
+    assert move_single_file(str(src), [str(primary), str(secondary)])
+
+    assert not src.exists()
+    assert (primary / "example.txt").read_text() == "hello"
+    assert (secondary / "example.txt").read_text() == "hello"
+
+
+def test_move_output_file_archives_and_extracts_from_one_read(tmp_path):
+    src_dir = tmp_path / "inputs"
+    src_dir.mkdir()
+    zip_path = src_dir / "Allscripts_01_15_25.zip"
+    with zipfile.ZipFile(zip_path, "w") as zf:
+        zf.writestr("batch/one.pdf", "1")
+
+    data = {"zip_name": "Allscripts_*.zip", "date_formatting": "MM_DD_YY", "date_formatting_dt": "%m_%d_%y",
+            "destination": [str(tmp_path / "dest") + "/", str(tmp_path / "archive")]}
+    functions._move_output_file(str(zip_path), "aehr", data, str(src_dir))
+
+    assert (tmp_path / "dest" / "01_15_25" / "batch" / "one.pdf").read_text() == "1"
+    assert (tmp_path / "archive" / "Allscripts_01_15_25.zip").exists()
+
+
 def test_apply_filename_transform_date_offset():
     # Test date offset: add 1 day to filename date
     transform = {
@@ -84,5 +118,96 @@ def test_move_single_file_with_date_offset(tmp_path):
     assert not src_file.exists()
 
 
+def test_move_inputs_resolves_date_tokens_per_file(tmp_path):
+    src_dir = tmp_path / "inputs"
+    src_dir.mkdir()
+    (src_dir / "Northwell_ChargeCorrection_Input_01152025.csv").write_text("jan")
+    (src_dir / "Northwell_ChargeCorrection_Input_02162025.csv").write_text("feb")
+    (src_dir / "GECB_ECHO_Inbound_01152025.xls").write_text("echo")
+
+    data = {
+        "charge correction": {
+            "inputs": {
+                "name": "Northwell_ChargeCorrection_Input_*.csv",
+                "destination": str(tmp_path / "cc" / "YYYY" / "MM YYYY"),
+                "date_formatting": "MMDDYYYY",
+                "date_formatting_dt": "%m%d%Y",
+            }
+        },
+        "echo": {"inputs": {"name": "GECB_ECHO_Inbound_*.xls", "destination": str(tmp_path / "echo")}},
+    }
+
+    move_inputs(data, str(src_dir))
+
+    assert (tmp_path / "cc" / "2025" / "01 2025" / "Northwell_ChargeCorrection_Input_01152025.csv").exists()
+    assert (tmp_path / "cc" / "2025" / "02 2025" / "Northwell_ChargeCorrection_Input_02162025.csv").exists()
+    assert (tmp_path / "echo" / "GECB_ECHO_Inbound_01152025.xls").exists()
+    assert list(src_dir.iterdir()) == []
+
+
+def test_move_inputs_leaves_a_file_with_an_invalid_date_in_place(tmp_path):
+    src_dir = tmp_path / "inputs"
+    src_dir.mkdir()
+    (src_dir / "Northwell_ChargeCorrection_Input_13452025.csv").write_text("bad")
+    data = {
+        "charge correction": {
+            "inputs": {
+                "name": "Northwell_ChargeCorrection_Input_*.csv",
+                "destination": str(tmp_path / "cc" / "YYYY" / "MM YYYY"),
+                "date_formatting": "MMDDYYYY",
+                "date_formatting_dt": "%m%d%Y",
+            }
+        },
+    }
+
+    move_inputs(data, str(src_dir))
+
+    assert [path.name for path in src_dir.iterdir()] == ["Northwell_ChargeCorrection_Input_13452025.csv"]
+    assert not (tmp_path / "cc").exists()
+
+
+def test_parse_output_files_splits_by_bot_name(tmp_path, monkeypatch):
+    src_dir = tmp_path / "inputs"
+    src_dir.mkdir()
+    combined = tmp_path / "combined"
+    combined.mkdir()
+    monkeypatch.setattr(functions, "COMBINED_OUTPUTS_DIR", str(combined))
+
+    pd.DataFrame({
+        "BotName": ["MRAuditPull", "HomeCareDischarge", "MRAuditPull", "Unknown Bot"],
+        "Account": [1, 2, 3, 4],
+    }).to_excel(src_dir / "Outbound_01152025.xlsx", index=False)
+
+    mr_dest = tmp_path / "mr"
+    homecare_dest = tmp_path / "homecare"
+    cpe_dest = tmp_path / "cpe"
+    for folder in (mr_dest, homecare_dest, cpe_dest):
+        folder.mkdir()
+    data = {
+        "mr_audit": {"BotName": "MRAuditPull", "destination": str(mr_dest),
+                     "file_name": "GECB_CodingMRAuditPull_Outbound_MMDDYYYY.xlsx", "date_format": "MMDDYYYY"},
+        "Homecare": {"BotName": "HomeCareDischarge", "destination": str(homecare_dest),
+                     "file_name": "CAREPORT_HomeCare_Outbound_MMDDYYYY.xlsx", "date_format": "MMDDYYYY"},
+        "cpe": {"BotName": "MedicarePartBCPE", "destination": str(cpe_dest),
+                "file_name": "CPE_Outbound_MMDDYYYY.xlsx", "date_format": "MMDDYYYY"},
+    }
+
+    messages = []
+    sink = logger.add(lambda m: messages.append(m.record["message"]), level="WARNING")
+    try:
+        parse_output_files(data, str(src_dir))
+    finally:
+        logger.remove(sink)
+
+    mr = pd.read_excel(mr_dest / "GECB_CodingMRAuditPull_Outbound_01152025.xlsx")
+    assert mr["Account"].tolist() == [1, 3]
+    homecare = pd.read_excel(homecare_dest / "CAREPORT_HomeCare_Outbound_01152025.xlsx")
+    assert homecare["Account"].tolist() == [2]
+    assert list(cpe_dest.iterdir()) == []
+    assert any("no BotName mapping" in m and "Unknown Bot" in m for m in messages)
+    # the combined workbook is moved out of the inputs folder afterwards
+    assert (combined / "Outbound_01152025.xlsx").exists()
+
+
 if __name__ == "__main__":
     pytest.main(["-q"])
@@ -0,0 +1,114 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+from file_index import FileIndex, PatternMatcher
+import leases
+from leases import LeaseManager, shard_order, SHARD_BY_USE_CASE
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_only_one_worker_holds_a_lease(tmp_path):
+    first = LeaseManager(str(tmp_path), owner="a")
+    second = LeaseManager(str(tmp_path), owner="b")
+
+    assert first.claim("A_1.xls")
+    assert not second.claim("A_1.xls")
+    first.release("A_1.xls")
+    assert second.claim("A_1.xls")
+
+
+def test_a_stale_lease_is_reclaimed_and_its_owner_does_not_delete_the_new_one(tmp_path):
+    dead = LeaseManager(str(tmp_path), lease_seconds=60, owner="dead")
+    alive = LeaseManager(str(tmp_path), lease_seconds=60, owner="alive")
+    assert dead.claim("A_1.xls")
+    lease = tmp_path / "A_1.xls.lease"
+    old = time.time() - 120
+    os.utime(lease, (old, old))
+
+    assert alive.claim("A_1.xls")
+    assert json.loads(lease.read_text())["owner"] == "alive"
+    dead.release("A_1.xls")
+    assert lease.exists()
+    assert not list(tmp_path.glob("*.stale"))
+
+
+def test_renewed_leases_are_not_stale(tmp_path):
+    holder = LeaseManager(str(tmp_path), lease_seconds=0.3, owner="holder")
+    other = LeaseManager(str(tmp_path), lease_seconds=0.3, owner="other")
+    with holder:
+        assert holder.claim("A_1.xls")
+        time.sleep(0.5)
+        assert not other.claim("A_1.xls")
+    assert not (tmp_path / "A_1.xls.lease").exists()
+
+
+def test_shards_split_the_files_and_steal_the_rest(tmp_path):
+    names = [f"A_{i}.xls" for i in range(20)] + [f"B_{i}.txt" for i in range(20)]
+    matcher = PatternMatcher([("inputs", "a", "A_*.xls"), ("inputs", "b", "B_*.txt")])
+    index = FileIndex(str(tmp_path), names, matcher)
+
+    shards = [shard_order(index, 3, i, steal=False) for i in range(3)]
+    assert sorted(sum(shards, [])) == sorted(names)
+    assert all(shards)
+    assert shard_order(index, 3, 0)[:len(shards[0])] == shards[0]
+
+    by_use_case = [shard_order(index, 2, i, SHARD_BY_USE_CASE, steal=False) for i in range(2)]
+    # every use case is on one worker only
+    for prefix in ("A", "B"):
+        assert sum(any(name.startswith(prefix) for name in shard) for shard in by_use_case) == 1
+
+
+_WORKER = """
+import json, sys
+import leases, main, metrics
+from config import compile_rules
+from file_index import PatternMatcher, build_rules
+inputs_dir, destination, index = sys.argv[1], sys.argv[2], int(sys.argv[3])
+configs = {"inputs": {"echo": {"inputs": {"name": "ECHO_*.xls", "destination": destination}}},
+           "outputs": {}, "shs": {}, "epic_shs": {}}
+configs["rules"] = compile_rules(configs)
+leases.configure(workers=3, worker_index=index)
+main.run(inputs_dir, configs, PatternMatcher(build_rules(configs["rules"].inputs)))
+print(json.dumps(sum(values["files"] for values in metrics.summary()["stages"].get("inputs", {}).values())))
+"""
+
+
+def test_several_worker_processes_drain_the_folder_together(tmp_path):
+    file_count = 60
+    inputs_dir = tmp_path / "inputs"
+    inputs_dir.mkdir()
+    destination = tmp_path / "echo"
+    for i in range(file_count):
+        (inputs_dir / f"ECHO_{i:03}.xls").write_text(str(i))
+
+    workers = [subprocess.Popen([sys.executable, "-c", _WORKER, str(inputs_dir), str(destination), str(i)],
+                                cwd=REPO, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+               for i in range(3)]
+    results = [worker.communicate(timeout=60) for worker in workers]
+
+    handled = [json.loads(stdout.strip().splitlines()[-1]) for stdout, _ in results]
+    assert sum(handled) == file_count
+    assert sorted(p.name for p in destination.iterdir()) == [f"ECHO_{i:03}.xls" for i in range(file_count)]
+    assert [p.name for p in inputs_dir.iterdir() if p.is_file()] == []
+    assert not any("CRITICAL" in stderr for _, stderr in results)
+    assert list((inputs_dir / ".leases").iterdir()) == []
+
+
+def test_a_single_worker_takes_one_lease_for_the_whole_run(tmp_path, monkeypatch):
+    names = [f"A_{i}.xls" for i in range(5)]
+    for name in names:
+        (tmp_path / name).write_text(name)
+    matcher = PatternMatcher([("inputs", "a", "A_*.xls")])
+    index = FileIndex(str(tmp_path), names, matcher)
+    monkeypatch.setitem(leases._settings, "workers", 1)
+
+    with leases.claimed(index, matcher) as first:
+        assert first is index
+        assert [p.name for p in (tmp_path / ".leases").iterdir()] == [leases.RUN_LEASE + ".lease"]
+        with leases.claimed(index, matcher) as overlapping:
+            assert len(overlapping) == 0
+    assert list((tmp_path / ".leases").iterdir()) == []
@@ -0,0 +1,75 @@
+
+import os
+import zipfile
+
+import pytest
+
+import ledger
+from functions import _move_output_file, move_single_file
+
+
+@pytest.fixture
+def active_ledger(tmp_path):
+    ledger.configure(str(tmp_path / "ledger" / "transfers.sqlite3"))
+    yield ledger
+    ledger.configure(None)
+
+
+def test_operation_records_planned_done_and_failed(tmp_path):
+    book = ledger.Ledger(str(tmp_path / "ledger.sqlite3"))
+    stamp = (10, 1.5)
+
+    book.record(ledger.COPY, "C:\\in\\a.xls", "D:\\out\\a.xls", stamp, ledger.PLANNED)
+    assert book.status(ledger.COPY, "C:\\in\\a.xls", "D:\\out\\a.xls", stamp) == ledger.PLANNED
+    book.record(ledger.COPY, "C:\\in\\a.xls", "D:\\out\\a.xls", stamp, ledger.DONE)
+    assert book.status(ledger.COPY, "C:\\in\\a.xls", "D:\\out\\a.xls", stamp) == ledger.DONE
+    # a re-dropped file with a different size is new work
+    assert book.status(ledger.COPY, "C:\\in\\a.xls", "D:\\out\\a.xls", (11, 1.5)) is None
+    book.close()
+
+
+def test_move_is_recorded_and_queryable_by_file_name(tmp_path, active_ledger):
+    src = tmp_path / "GECB_ECHO_Inbound_01152025.xls"
+    src.write_text("echo")
+
+    move_single_file(str(src), [str(tmp_path / "primary"), str(tmp_path / "archive")])
+
+    history = ledger.history("GECB_ECHO_Inbound_01152025.xls")
+    assert {(op["kind"], op["status"]) for op in history} == {(ledger.COPY, ledger.DONE), (ledger.MOVE, ledger.DONE)}
+
+
+def test_failed_operation_is_marked_failed(tmp_path, active_ledger):
+    src = tmp_path / "a.txt"
+    src.write_text("a")
+    with pytest.raises(OSError):
+        with ledger.operation(ledger.MOVE, str(src), str(tmp_path / "b.txt")):
+            raise OSError("share went away")
+    assert ledger.history("a.txt")[0]["status"] == ledger.FAILED
+
+
+def test_interrupted_extraction_is_resumed(tmp_path, active_ledger):
+    src_dir = tmp_path / "inputs"
+    src_dir.mkdir()
+    zip_path = src_dir / "Allscripts_01_15_25.zip"
+    with zipfile.ZipFile(zip_path, "w") as zf:
+        zf.writestr("batch/one.pdf", "1")
+        zf.writestr("batch/two.pdf", "2")
+
+    dest = tmp_path / "dest"
+    primary_dest = str(dest) + "01_15_25"
+    stamp = ledger.fingerprint(str(zip_path))
+    # a previous run extracted one.pdf and died
+    ledger.record(ledger.EXTRACT, str(zip_path), primary_dest, stamp, ledger.PLANNED)
+    zipfile.ZipFile(zip_path).extract("batch/one.pdf", primary_dest)
+    ledger.record(ledger.EXTRACT, str(zip_path), os.path.join(primary_dest, "batch/one.pdf"), stamp, ledger.DONE)
+
+    data = {"zip_name": "Allscripts_*.zip", "date_formatting": "MM_DD_YY", "date_formatting_dt": "%m_%d_%y",
+            "destination": str(dest)}
+    _move_output_file(str(zip_path), "aehr", data, str(src_dir))
+
+    assert (tmp_path / "dest01_15_25" / "batch" / "two.pdf").read_text() == "2"
+    assert ledger.status(ledger.EXTRACT, str(zip_path), primary_dest, stamp) == ledger.DONE
+
+
+if __name__ == "__main__":
+    pytest.main(["-q"])
@@ -0,0 +1,108 @@
+import datetime
+import os
+import time
+import zipfile
+
+import pytest
+from loguru import logger
+
+import log_sink
+from log_sink import BatchedFileSink
+
+
+@pytest.fixture
+def settings(monkeypatch):
+    monkeypatch.setattr(log_sink, "_settings", dict(log_sink._settings, flush_interval=0.05, burst=3, window=60))
+    return log_sink._settings
+
+
+@pytest.fixture
+def sink_to(settings):
+    handlers = []
+
+    def add(path):
+        sink = BatchedFileSink(str(path))
+        handlers.append((logger.add(sink, level="INFO", format=log_sink.FORMAT), sink))
+        return sink
+
+    yield add
+    for handler_id, sink in handlers:
+        logger.remove(handler_id)
+        sink.stop()
+
+
+def test_messages_are_written_in_batches_and_flushed_on_stop(tmp_path, sink_to):
+    sink = sink_to(tmp_path / "log.log")
+    for i in range(200):
+        with logger.contextualize(use_case=f"case{i}"):
+            logger.info(f"moved file {i}")
+    sink.stop()
+
+    lines = (tmp_path / "log.log").read_text().splitlines()
+    assert len(lines) == 200 and lines[-1].endswith("moved file 199")
+    assert sink.batches < 20
+
+
+def test_repetitive_messages_are_summarized_per_use_case_but_warnings_never(tmp_path, sink_to):
+    sink = sink_to(tmp_path / "log.log")
+    for i in range(10):
+        with logger.contextualize(use_case="echo"):
+            logger.info(f"moved echo file {i}")
+        with logger.contextualize(use_case="bundle"):
+            logger.info(f"moved bundle file {i}")
+        logger.warning(f"slow share {i}")
+    sink.stop()
+
+    text = (tmp_path / "log.log").read_text()
+    assert text.count("moved echo file") == 4 and text.count("moved bundle file") == 4
+    assert "7 more similar messages, the last one: moved echo file 9" in text
+    assert "(bundle) - 7 more similar messages" in text
+    assert text.count("slow share") == 10
+    assert sink.suppressed == 14
+
+
+def test_a_failing_share_does_not_block_and_the_lines_are_kept(tmp_path, sink_to):
+    folder = tmp_path / "share"
+    sink = sink_to(folder / "log.log")
+    start = time.perf_counter()
+    logger.info("while the share is down")
+    assert time.perf_counter() - start < 0.05
+    time.sleep(0.2)
+    folder.mkdir()
+    logger.info("share is back")
+    sink.stop()
+
+    assert (folder / "log.log").read_text().count("\n") == 2
+
+
+def test_yesterdays_file_is_rotated_and_zipped(tmp_path, sink_to):
+    path = tmp_path / "log.log"
+    path.write_text("old line\n")
+    yesterday = time.time() - 86400
+    os.utime(path, (yesterday, yesterday))
+    sink = sink_to(path)
+    logger.info("new day")
+    sink.stop()
+
+    day = datetime.date.fromtimestamp(yesterday).isoformat()
+    with zipfile.ZipFile(tmp_path / f"log.{day}.log.zip") as archive:
+        assert archive.read(f"log.{day}.log") == b"old line\n"
+    assert "new day" in path.read_text() and "old line" not in path.read_text()
+
+
+def test_a_file_held_for_rotation_by_another_worker_is_left_alone(tmp_path, sink_to):
+    from leases import LEASE_DIR, LeaseManager
+    path = tmp_path / "log.log"
+    path.write_text("old line\n")
+    yesterday = time.time() - 86400
+    os.utime(path, (yesterday, yesterday))
+    other_worker = LeaseManager(str(tmp_path / LEASE_DIR), owner="other")
+    assert other_worker.claim("log.log.rotate")
+
+    sink = sink_to(path)
+    logger.info("new day")
+    sink.stop()
+
+    assert not list(tmp_path.glob("*.zip"))
+    assert path.read_text().startswith("old line\n")
+    other_worker.release("log.log.rotate")
@@ -0,0 +1,90 @@
+import os
+import zipfile
+
+import pytest
+
+import merged_index
+from merged_index import MergedArchiveIndex, extract_matching
+
+
+def _make_archive(path, members, compression=zipfile.ZIP_DEFLATED):
+    with zipfile.ZipFile(path, "w", compression) as zf:
+        for name, data in members.items():
+            zf.writestr(name, data)
+
+
+@pytest.fixture
+def index(tmp_path, monkeypatch):
+    index = MergedArchiveIndex(str(tmp_path / "merged_archives.sqlite3"))
+    monkeypatch.setattr(merged_index, "_index", index)
+    return index
+
+
+@pytest.mark.parametrize("compression", [zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED])
+def test_only_matching_members_are_extracted(tmp_path, index, compression):
+    archive = tmp_path / "Labappeals_01_15_2025.zip"
+    _make_archive(archive, {"a/1_Merged.pdf": b"merged one" * 1000, "a/1.pdf": b"single",
+                            "b/2_Merged.pdf": b"merged two"}, compression)
+    dest = tmp_path / "dest"
+
+    written = extract_matching(str(archive), "*_Merged*", str(dest))
+
+    assert (dest / "a" / "1_Merged.pdf").read_bytes() == b"merged one" * 1000
+    assert (dest / "b" / "2_Merged.pdf").read_text() == "merged two"
+    assert not (dest / "a" / "1.pdf").exists()
+    assert len(written) == 2
+
+
+def test_the_central_directory_is_read_once_per_version(tmp_path, index, monkeypatch):
+    archive = tmp_path / "Labappeals_01_15_2025.zip"
+    _make_archive(archive, {"1_Merged.pdf": "one"})
+    extract_matching(str(archive), "*_Merged*", str(tmp_path / "first"))
+
+    reads = []
+    real_read = merged_index.read_central_directory
+    monkeypatch.setattr(merged_index, "read_central_directory", lambda path: reads.append(path) or real_read(path))
+    # a new index from the saved state: the next run
+    monkeypatch.setattr(merged_index, "_index", MergedArchiveIndex(index.state_path))
+    extract_matching(str(archive), "*_Merged*", str(tmp_path / "second"))
+    assert reads == []
+    assert (tmp_path / "second" / "1_Merged.pdf").read_text() == "one"
+
+    _make_archive(archive, {"1_Merged.pdf": "one", "2_Merged.pdf": "two, added later"})
+    os.utime(archive, (1, 1))
+    extract_matching(str(archive), "*_Merged*", str(tmp_path / "third"))
+    assert reads == [str(archive)]
+    assert (tmp_path / "third" / "2_Merged.pdf").read_text() == "two, added later"
+
+
+def test_a_missing_archive_is_not_looked_for_again_until_the_retry(tmp_path, index):
+    archive = tmp_path / "Labappeals_01_15_2025.zip"
+    assert extract_matching(str(archive), "*_Merged*", str(tmp_path / "dest")) is None
+    _make_archive(archive, {"1_Merged.pdf": "one"})
+
+    assert MergedArchiveIndex(index.state_path).known_missing(str(archive))
+    assert extract_matching(str(archive), "*_Merged*", str(tmp_path / "dest")) is None
+
+    index.missing_retry_after = 0
+    assert extract_matching(str(archive), "*_Merged*", str(tmp_path / "dest"))
+
+
+def test_archives_unused_past_the_retention_are_dropped(tmp_path, index):
+    old, recent = tmp_path / "Labappeals_01_15_2025.zip", tmp_path / "Labappeals_03_15_2025.zip"
+    for archive in (old, recent):
+        _make_archive(archive, {"1_Merged.pdf": "one"})
+        extract_matching(str(archive), "*_Merged*", str(tmp_path / archive.stem))
+    index._db.execute("UPDATE archives SET used_at=used_at-? WHERE path=?", (60 * 86400, str(old)))
+
+    reopened = MergedArchiveIndex(index.state_path, retention_days=45)
+
+    assert [row[0] for row in reopened._db.execute("SELECT path FROM archives")] == [str(recent)]
+
+
+def test_a_corrupt_member_fails_instead_of_writing_bad_data(tmp_path, index):
+    archive = tmp_path / "Labappeals_01_15_2025.zip"
+    _make_archive(archive, {"1_Merged.pdf": "one"}, zipfile.ZIP_STORED)
+    data = archive.read_bytes()
+    archive.write_bytes(data.replace(b"one", b"two", 1))
+
+    with pytest.raises(ValueError, match="CRC"):
+        extract_matching(str(archive), "*_Merged*", str(tmp_path / "dest"))
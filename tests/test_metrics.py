@@ -0,0 +1,66 @@
+
+import json
+
+import pytest
+
+import metrics
+from file_index import INPUTS
+from functions import move_inputs
+from metrics import RunMetrics
+
+
+def test_counts_and_timers_are_grouped_by_stage_and_use_case():
+    run = RunMetrics()
+    run.count("inputs", "echo", files=2, bytes=100)
+    run.count("inputs", "echo", errors=1)
+    with run.timer("inputs"):
+        pass
+
+    stages = run.summary()["stages"]
+    assert stages["inputs"]["echo"]["files"] == 2
+    assert stages["inputs"]["echo"]["bytes"] == 100
+    assert stages["inputs"]["echo"]["errors"] == 1
+    assert stages["inputs"]["all"]["calls"] == 1
+
+
+def test_prometheus_textfile_has_a_sample_per_stage_and_use_case():
+    run = RunMetrics()
+    run.count("outputs", "lab_appeals", files=3)
+
+    text = run.prometheus()
+    assert "# TYPE goa_stage_files gauge" in text
+    assert 'goa_stage_files{stage="outputs",use_case="lab_appeals"} 3' in text
+    assert text.endswith("\n")
+
+
+def test_write_exports_summary_history_and_textfile(tmp_path):
+    metrics.configure(json_path=str(tmp_path / "metrics.json"), history_path=str(tmp_path / "history.jsonl"),
+                      prometheus_path=str(tmp_path / "goa.prom"))
+    try:
+        metrics.reset()
+        metrics.count("inputs", "echo", files=1)
+        metrics.write()
+        metrics.write()
+    finally:
+        metrics.configure()
+
+    assert json.loads((tmp_path / "metrics.json").read_text())["stages"]["inputs"]["echo"]["files"] == 1
+    assert len((tmp_path / "history.jsonl").read_text().splitlines()) == 2
+    assert "goa_run_duration_seconds" in (tmp_path / "goa.prom").read_text()
+
+
+def test_move_inputs_counts_files_and_bytes_per_use_case(tmp_path):
+    src_dir = tmp_path / "inputs"
+    src_dir.mkdir()
+    (src_dir / "GECB_ECHO_Inbound_01152025.xls").write_text("echo")
+    data = {"echo": {"inputs": {"name": "GECB_ECHO_Inbound_*.xls", "destination": str(tmp_path / "echo")}}}
+
+    metrics.reset()
+    move_inputs(data, str(src_dir))
+
+    echo = metrics.summary()["stages"][INPUTS]["echo"]
+    assert (echo["files"], echo["bytes"], echo["errors"], echo["calls"]) == (1, 4, 0, 1)
+
+
+if __name__ == "__main__":
+    pytest.main(["-q"])
@@ -0,0 +1,126 @@
+import datetime
+import os
+import zipfile
+
+import pytest
+
+import functions
+import moved_archive
+
+
+@pytest.fixture
+def archive(tmp_path):
+    moved_archive.configure(str(tmp_path / "ledger" / "moved_archive.sqlite3"), loose_months=2)
+    yield moved_archive._archive
+    moved_archive.configure(None)
+
+
+def _archived(root, month, name, content):
+    folder = root / month
+    folder.mkdir(parents=True, exist_ok=True)
+    path = folder / name
+    path.write_bytes(content)
+    return str(path)
+
+
+def test_only_a_name_and_size_match_is_hashed(tmp_path, archive, monkeypatch):
+    root = tmp_path / "moved"
+    archive.record("A_01_15_25.zip", 5, "2025 01", str(root), _archived(root, "2025 01", "A_01_15_25.zip", b"hello"))
+    hashed = []
+    real_digest = moved_archive.file_digest
+    monkeypatch.setattr(moved_archive, "file_digest", lambda path: hashed.append(path) or real_digest(path))
+
+    other = tmp_path / "inputs" / "B_01_15_25.zip"
+    other.parent.mkdir()
+    other.write_bytes(b"hello")
+    assert moved_archive.duplicate_of(str(other)) is None
+    assert hashed == []
+
+    changed = tmp_path / "inputs" / "A_01_15_25.zip"
+    changed.write_bytes(b"jello")
+    assert moved_archive.duplicate_of(str(changed)) is None
+    changed.write_bytes(b"hello")
+    assert moved_archive.duplicate_of(str(changed))["month"] == "2025 01"
+
+
+def test_old_months_are_packed_into_one_container(tmp_path, archive):
+    root = tmp_path / "moved"
+    for name in ("A_01_15_25.zip", "B_01_16_25.zip"):
+        archive.record(name, 3, "2025 01", str(root), _archived(root, "2025 01", name, name[:1].encode() * 3))
+    current = moved_archive.month_of(None)
+    archive.record("C.zip", 1, current, str(root), _archived(root, current, "C.zip", b"c"))
+
+    assert archive.due(datetime.datetime(2026, 10, 17)) == [(str(root), "2025 01")]
+    assert archive.due(datetime.datetime(2025, 2, 1)) == []
+    assert archive.due(datetime.datetime(2025, 3, 1)) == [(str(root), "2025 01")]
+    assert moved_archive.compact_due() == 2
+
+    container = root / "2025 01.zip"
+    with zipfile.ZipFile(container) as zf:
+        assert sorted(zf.namelist()) == ["A_01_15_25.zip", "B_01_16_25.zip"]
+        assert zf.read("B_01_16_25.zip") == b"BBB"
+    assert not (root / "2025 01").exists()
+    assert (root / current / "C.zip").exists()
+    assert moved_archive.location(moved_archive.find("A_01_15_25.zip")[0]) == f"{container}!A_01_15_25.zip"
+
+    # a late file of a packed month is appended, what is already there is not written again
+    with zipfile.ZipFile(container) as zf:
+        offsets = {info.filename: info.header_offset for info in zf.infolist()}
+    archive.record("A_01_15_25.zip", 3, "2025 01", str(root), _archived(root, "2025 01", "A_01_15_25.zip", b"new"))
+    assert archive.compact(str(root), "2025 01") == 1
+    with zipfile.ZipFile(container) as zf:
+        assert len(zf.namelist()) == 3
+        assert {name: offsets.get(name) for name in offsets} == \
+            {info.filename: info.header_offset for info in zf.infolist() if info.filename in offsets}
+        assert zf.testzip() is None
+    assert not os.path.exists(f"{container}.dir")
+    redrop = tmp_path / "A_01_15_25.zip"
+    redrop.write_bytes(b"AAA")
+    assert moved_archive.duplicate_of(str(redrop))["container"] == str(container)
+
+
+def test_a_redropped_output_zip_is_not_extracted_again(tmp_path, archive):
+    src_dir = tmp_path / "inputs"
+    src_dir.mkdir()
+    zip_path = src_dir / "Allscripts_01_15_25.zip"
+    with zipfile.ZipFile(zip_path, "w") as zf:
+        zf.writestr("batch/one.pdf", "1")
+    content = zip_path.read_bytes()
+    data = {"zip_name": "Allscripts_*.zip", "date_formatting": "MM_DD_YY", "date_formatting_dt": "%m_%d_%y",
+            "destination": str(tmp_path / "dest") + "/"}
+
+    functions._move_output_file(str(zip_path), "aehr", data, str(src_dir))
+    assert [entry["month"] for entry in moved_archive.find("Allscripts_01_15_25.zip")] == ["2025 01"]
+
+    os.remove(tmp_path / "dest" / "01_15_25" / "batch" / "one.pdf")
+    zip_path.write_bytes(content)
+    functions._move_output_file(str(zip_path), "aehr", data, str(src_dir))
+
+    assert not zip_path.exists()
+    assert not (tmp_path / "dest" / "01_15_25" / "batch" / "one.pdf").exists()
+    assert len(moved_archive.find("Allscripts_01_15_25.zip")) == 1
+
+
+def test_a_failed_append_leaves_the_container_as_it_was(tmp_path, archive, monkeypatch):
+    root = tmp_path / "moved"
+    archive.record("A.zip", 1, "2025 01", str(root), _archived(root, "2025 01", "A.zip", b"a"))
+    archive.compact(str(root), "2025 01")
+    container = root / "2025 01.zip"
+    before = container.read_bytes()
+
+    for name in ("B.zip", "C.zip"):
+        archive.record(name, 1, "2025 01", str(root), _archived(root, "2025 01", name, b"b"))
+    real_pack = moved_archive.MovedArchive._pack
+
+    def pack_then_fail(out, path, member):
+        if member == "C.zip":
+            raise OSError("the share went away")
+        return real_pack(out, path, member)
+
+    monkeypatch.setattr(moved_archive.MovedArchive, "_pack", staticmethod(pack_then_fail))
+    with pytest.raises(OSError):
+        archive.compact(str(root), "2025 01")
+
+    assert container.read_bytes() == before
+    assert (root / "2025 01" / "B.zip").exists()
+    assert [entry["container"] for entry in moved_archive.find("B.zip")] == [None]
@@ -0,0 +1,94 @@
+import threading
+import time
+import zipfile
+
+import metrics
+from file_index import FileIndex, PatternMatcher, build_rules
+from config import compile_rules
+from functions import distribute
+from pipeline import Pipeline, Stage
+
+
+def test_items_flow_through_every_stage_they_are_emitted_to():
+    seen = []
+    lock = threading.Lock()
+
+    def double(item, emit):
+        emit("record", item * 2)
+
+    def record(item, emit):
+        with lock:
+            seen.append(item)
+
+    Pipeline([Stage("double", double, workers=3), Stage("record", record)]).run(range(50), "double")
+
+    assert sorted(seen) == [n * 2 for n in range(50)]
+
+
+def test_a_full_queue_holds_back_the_stage_feeding_it():
+    def produce(item, emit):
+        emit("slow", item)
+
+    def slow(item, emit):
+        time.sleep(0.02)
+
+    producer = Stage("produce", produce)
+    consumer = Stage("slow", slow, workers=1, queue_size=1)
+    Pipeline([producer, consumer]).run(range(10), "produce")
+
+    assert consumer.items == 10
+    assert consumer.peak_queue == 1
+    assert producer.blocked_seconds > 0.05
+
+
+def test_a_failing_item_is_counted_and_the_rest_keep_flowing():
+    done = []
+
+    def work(item, emit):
+        if item == 3:
+            raise OSError("share went away")
+        done.append(item)
+
+    stage = Stage("work", work, workers=2)
+    metrics.reset()
+    Pipeline([stage]).run(range(6), "work")
+
+    assert sorted(done) == [0, 1, 2, 4, 5]
+    assert stage.errors == 1
+    assert metrics.summary()["stages"]["pipeline_work"]["all"]["errors"] == 1
+
+
+def test_distribute_moves_inputs_and_extracts_zips_side_by_side(tmp_path):
+    src_dir = tmp_path / "inputs"
+    src_dir.mkdir()
+    (src_dir / "GECB_ECHO_Inbound_01152025.xls").write_text("echo")
+    with zipfile.ZipFile(src_dir / "Allscripts_01_15_25.zip", "w") as zf:
+        zf.writestr("batch/one.pdf", "1")
+    configs = {
+        "inputs": {"echo": {"inputs": {"name": "GECB_ECHO_Inbound_*.xls", "destination": str(tmp_path / "echo")}}},
+        "outputs": {"aehr": {"zip_name": "Allscripts_*.zip", "date_formatting": "MM_DD_YY",
+                             "date_formatting_dt": "%m_%d_%y", "destination": str(tmp_path / "aehr") + "/"}},
+        "shs": {},
+        "epic_shs": {},
+    }
+    rules = compile_rules(configs)
+    index = FileIndex.scan(str(src_dir), PatternMatcher(build_rules(rules.inputs, rules.outputs, {}, {})))
+
+    distribute(index, rules, str(src_dir))
+
+    assert (tmp_path / "echo" / "GECB_ECHO_Inbound_01152025.xls").read_text() == "echo"
+    assert (tmp_path / "aehr" / "01_15_25" / "batch" / "one.pdf").read_text() == "1"
+
+
+def test_distribute_skips_deferred_use_cases(tmp_path):
+    src_dir = tmp_path / "inputs"
+    src_dir.mkdir()
+    (src_dir / "GECB_ECHO_Inbound_01152025.xls").write_text("echo")
+    configs = {"inputs": {"echo": {"inputs": {"name": "GECB_ECHO_Inbound_*.xls",
+                                              "destination": str(tmp_path / "echo")}}}}
+    rules = compile_rules(configs)
+    index = FileIndex.scan(str(src_dir), PatternMatcher(build_rules(rules.inputs)))
+
+    distribute(index, rules, str(src_dir), {"inputs": {"echo": {"\\\\NAS\\S"}}})
+
+    assert (src_dir / "GECB_ECHO_Inbound_01152025.xls").exists()
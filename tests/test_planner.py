@@ -0,0 +1,120 @@
+import json
+import os
+
+import planner
+from config import compile_rules
+from file_index import FileIndex, PatternMatcher, build_rules, INPUTS, OUTPUTS, OUTBOUND
+
+SOURCE_DIR = "\\\\NT2KWB972SRV03\\SHAREDATA\\GOA\\Inputs"
+
+
+def _plan(configs, file_names, deferred=None):
+    rules = compile_rules(configs)
+    index = FileIndex(SOURCE_DIR, file_names,
+                      PatternMatcher(build_rules(rules.inputs, rules.outputs, rules.shs, rules.epic_shs)),
+                      {name: 10 * (i + 1) for i, name in enumerate(file_names)})
+    return planner.plan(index, rules, SOURCE_DIR, deferred)
+
+
+CONFIGS = {
+    "inputs": {
+        "echo": {"inputs": {"name": "ECHO_*.xls", "destination": ["\\\\NASDATA201\\S\\echo\\YYYYMMDD",
+                                                                   "\\\\NASHCN01\\S\\archive"],
+                            "date_formatting": "MMDDYYYY", "date_formatting_dt": "%m%d%Y",
+                            "destination_transforms": [None, {"date_offset_days": 1, "date_format": "MMDDYYYY",
+                                                              "date_format_dt": "%m%d%Y"}]}},
+        "bundle": {"inputs": {"name": "Bundle_*.txt", "destination": "\\\\NASHCN01\\S\\bundle"}},
+    },
+    "outputs": {"aehr": {"zip_name": "Allscripts_*.zip", "date_formatting": "MM_DD_YY",
+                         "date_formatting_dt": "%m_%d_%y", "destination": "\\\\NASDATA204\\S\\aehr\\"}},
+    "shs": {"cs": {"BotName": "CS", "destination": "\\\\NASDATA201\\S\\cs\\YYYY", "file_name": "CS_MMDDYYYY.xlsx",
+                   "date_format": "MMDDYYYY"}},
+    "epic_shs": {},
+}
+
+
+def test_every_file_is_resolved_without_touching_the_disk():
+    plan = _plan(CONFIGS, ["ECHO_01152025.xls", "Allscripts_01_15_25.zip", "Outbound_01152025.xlsx", "notes.txt"])
+    by_stage = {planned.stage: planned for planned in plan.files}
+
+    echo = by_stage[INPUTS]
+    assert [(a.kind, a.target) for a in echo.actions] == [
+        ("move", "\\\\NASDATA201\\S\\echo\\20250115/ECHO_01152025.xls".replace("/", os.sep)),
+        ("copy", "\\\\NASHCN01\\S\\archive/ECHO_01162025.xls".replace("/", os.sep)),
+    ]
+    assert echo.group[0] == "NASDATA201"
+
+    aehr = by_stage[OUTPUTS]
+    assert [a.kind for a in aehr.actions] == ["extract", "archive"]
+    assert aehr.actions[0].target == "\\\\NASDATA204\\S\\aehr\\01_15_25"
+
+    outbound = by_stage[OUTBOUND]
+    assert [(a.kind, a.use_case) for a in outbound.actions] == [("split", "cs"), ("archive", None)]
+    assert outbound.actions[0].target.endswith("CS_01152025.xlsx")
+    assert plan.unmatched == ["notes.txt"]
+
+
+def test_transfers_are_batched_by_folder_and_take_turns_between_hosts():
+    names = [f"ECHO_0115202{i}.xls" for i in range(3)] + [f"Bundle_{i}.txt" for i in range(3)]
+    plan = _plan(CONFIGS, names)
+
+    batches = plan.batches(batch_size=2)
+
+    assert [(batch.host, len(batch.files)) for batch in batches] == [
+        ("NASDATA201", 1), ("NASHCN01", 2), ("NASDATA201", 1), ("NASHCN01", 1), ("NASDATA201", 1)]
+    # a batch never mixes folders
+    for batch in batches:
+        assert {planned.group for planned in batch.files} == {(batch.host, batch.folder)}
+
+
+def test_deferred_use_cases_are_left_out_and_reported():
+    plan = _plan(CONFIGS, ["Bundle_1.txt", "Outbound_01152025.xlsx"],
+                 {"inputs": {"bundle": {"\\\\NASHCN01\\S"}}, "shs": {"cs": {"\\\\NASDATA201\\S"}}})
+
+    assert [planned.stage for planned in plan.files] == [OUTBOUND]
+    assert plan.files[0].actions == []
+    assert "stays in the inputs folder" in plan.files[0].note
+    assert plan.to_dict()["deferred"] == {"inputs": ["bundle"], "shs": ["cs"]}
+
+
+def test_a_file_matching_several_use_cases_is_planned_once():
+    with open(os.path.join(os.path.dirname(__file__), "..", "json_data", "inputs.json")) as file:
+        inputs = json.load(file)
+    configs = {"inputs": {use_case: inputs[use_case] for use_case in ("EPIC Lab Appeals Outbound", "EPIC Outbounds")},
+               "outputs": {}, "shs": {}, "epic_shs": {}}
+    names = ["EPIC_LabAppeals_Outbound_01152025.xlsx", "EPIC_Radiology_Outbound_01152025.xlsx"]
+
+    plan = _plan(configs, names)
+
+    assert [(os.path.basename(planned.source), planned.use_case) for planned in plan.files] == [
+        ("EPIC_LabAppeals_Outbound_01152025.xlsx", "EPIC Lab Appeals Outbound"),
+        ("EPIC_Radiology_Outbound_01152025.xlsx", "EPIC Outbounds"),
+    ]
+    sources = [planned.source for batch in plan.batches() for planned in batch.files]
+    assert sorted(sources) == sorted(set(sources))
+
+    # across stages too: an input pattern that also catches Outbound workbooks takes them, nothing splits them
+    configs = dict(CONFIGS, inputs={"outbound copy": {"inputs": {"name": "Outbound_*.xlsx",
+                                                                 "destination": "\\\\NASHCN01\\S\\copies"}}})
+    plan = _plan(configs, ["Outbound_01152025.xlsx"])
+
+    assert [(planned.stage, planned.use_case) for planned in plan.files] == [(INPUTS, "outbound copy")]
+
+
+def test_a_file_with_an_invalid_date_is_planned_to_stay():
+    plan = _plan(CONFIGS, ["ECHO_13452025.xls", "Bundle_1.txt"])
+
+    echo = plan.files[0]
+    assert echo.actions == [] and "stays in the inputs folder" in echo.note
+    assert [planned.use_case for planned in plan.files] == ["echo", "bundle"]
+
+
+def test_plan_serializes_grouped_by_host_and_folder():
+    plan = _plan(CONFIGS, ["Bundle_1.txt", "ECHO_01152025.xls", "Allscripts_01_15_25.zip"])
+
+    data = json.loads(plan.to_json())
+
+    assert data["files"] == 3
+    assert [group["host"] for group in data["groups"]] == sorted(group["host"] for group in data["groups"])
+    assert {file["source"] for group in data["groups"] for file in group["files"]} == {
+        "Bundle_1.txt", "ECHO_01152025.xls", "Allscripts_01_15_25.zip"}
@@ -0,0 +1,57 @@
+import json
+import os
+import pstats
+import threading
+
+import profiling
+from dir_cache import DirectoryCache
+
+
+def _busy(count):
+    return sum(i * i for i in range(count))
+
+
+def test_spans_cost_nothing_outside_a_profiled_run():
+    assert profiling.span(profiling.STAT, "x") is profiling._NULL
+
+
+def test_a_profiled_run_writes_profile_stacks_and_spans(tmp_path):
+    results = []
+    with profiling.profiled(str(tmp_path / "logs"), interval=0.001) as profiler:
+        worker = threading.Thread(target=lambda: results.append(_busy(200000)), name="transfer-0")
+        worker.start()
+        DirectoryCache().ensure(str(tmp_path / "out" / "a"))
+        with profiling.span(profiling.MOVE, "target"):
+            _busy(100000)
+        worker.join()
+    assert profiling._active is None
+    # the worker ran to the end: only the calling thread enables cProfile
+    assert results == [_busy(200000)]
+
+    written = sorted(os.listdir(tmp_path / "logs"))
+    assert [name.rsplit(".", 1)[-1] for name in written] == ["collapsed", "prof", "json"]
+
+    stacks = (tmp_path / "logs" / written[0]).read_text().splitlines()
+    assert stacks and all(line.rsplit(" ", 1)[1].isdigit() for line in stacks)
+
+    spans = json.loads((tmp_path / "logs" / written[2]).read_text())
+    assert spans["summary"]["move"]["calls"] == 1
+    assert spans["summary"]["makedirs"]["calls"] >= 1
+    assert profiler.span_summary() == spans["summary"]
+
+    functions = {name for _, _, name in pstats.Stats(str(tmp_path / "logs" / written[1])).stats}
+    assert "_busy" in functions
+
+
+def test_a_run_under_another_profiler_keeps_stacks_and_spans(tmp_path, monkeypatch):
+    def already_active(self):
+        raise ValueError("Another profiling tool is already active")
+
+    monkeypatch.setattr(profiling.cProfile.Profile, "enable", already_active)
+    with profiling.profiled(str(tmp_path / "logs"), interval=0.001):
+        with profiling.span(profiling.MOVE, "target"):
+            _busy(100000)
+
+    written = sorted(os.listdir(tmp_path / "logs"))
+    assert [name.rsplit(".", 1)[-1] for name in written] == ["collapsed", "json"]
+    assert json.loads((tmp_path / "logs" / written[1]).read_text())["summary"]["move"]["calls"] == 1
@@ -0,0 +1,88 @@
+import threading
+import time
+
+import share_health
+from share_health import ShareHealth, share_of, use_case_shares
+
+
+def test_share_of_unc_and_local_paths():
+    assert share_of("\\\\nasdata201\\SHAREDATA\\MV-RCR01\\SHARED\\x") == "\\\\NASDATA201\\SHAREDATA"
+    assert share_of("//NASHCN01/SHAREDATA/a") == "\\\\NASHCN01\\SHAREDATA"
+    assert share_of("/tmp/outputs") is None
+
+
+def test_use_case_shares_covers_every_destination():
+    configs = {
+        "inputs": {"a": {"inputs": {"destination": "\\\\HOST1\\S\\in"}}},
+        "outputs": {"b": {"destination": ["\\\\HOST2\\S\\out\\", "\\\\HOST3\\S\\archive"]}},
+        "shs": {"c": {"destination": "\\\\HOST1\\S\\shs"}},
+    }
+    shares = use_case_shares(configs)
+    assert shares["inputs"] == {"a": {"\\\\HOST1\\S"}}
+    assert shares["outputs"] == {"b": {"\\\\HOST2\\S", "\\\\HOST3\\S"}}
+    assert shares["epic_shs"] == {}
+
+
+def test_probes_run_concurrently_and_time_out():
+    hang = threading.Event()
+
+    def probe(share):
+        if share == "\\\\DEAD\\S":
+            hang.wait()
+
+    health = ShareHealth(timeout=0.2, probe=probe)
+    start = time.monotonic()
+    result = health.check(["\\\\DEAD\\S", "\\\\UP1\\S", "\\\\UP2\\S"])
+    hang.set()
+
+    assert time.monotonic() - start < 1
+    assert result == {"\\\\DEAD\\S": False, "\\\\UP1\\S": True, "\\\\UP2\\S": True}
+
+
+def test_breaker_opens_after_threshold_and_persists(tmp_path):
+    calls = []
+
+    def probe(share):
+        calls.append(share)
+        raise OSError("network name no longer available")
+
+    state_path = str(tmp_path / "health.json")
+    health = ShareHealth(state_path, failure_threshold=2, cooldown=300, probe=probe)
+    health.check(["\\\\DEAD\\S"])
+    health.check(["\\\\DEAD\\S"])
+    assert len(calls) == 2
+
+    # a new run (new process) reads the open breaker and does not probe again
+    reloaded = ShareHealth(state_path, failure_threshold=2, cooldown=300, probe=probe)
+    assert reloaded.check(["\\\\DEAD\\S"]) == {"\\\\DEAD\\S": False}
+    assert len(calls) == 2
+    assert not reloaded.is_healthy("\\\\dead\\S\\folder\\file.zip")
+
+
+def test_half_open_probe_closes_the_breaker(tmp_path):
+    up = []
+
+    def probe(share):
+        if not up:
+            raise OSError("down")
+
+    health = ShareHealth(failure_threshold=1, cooldown=0, probe=probe)
+    assert health.check(["\\\\NAS\\S"]) == {"\\\\NAS\\S": False}
+    up.append(True)
+    assert health.check(["\\\\NAS\\S"]) == {"\\\\NAS\\S": True}
+    assert health.state["\\\\NAS\\S"]["failures"] == 0
+
+
+def test_deferred_use_cases_only_lists_use_cases_on_down_shares(monkeypatch):
+    def probe(share):
+        if "DEAD" in share:
+            raise OSError("down")
+
+    monkeypatch.setattr(share_health, "_health", ShareHealth(timeout=1, probe=probe))
+    configs = {
+        "inputs": {"a": {"inputs": {"destination": "\\\\UP\\S\\in"}}},
+        "outputs": {"b": {"destination": ["\\\\UP\\S\\out\\", "\\\\DEAD\\S\\archive"]}},
+    }
+    deferred = share_health.deferred_use_cases(configs)
+    assert deferred["inputs"] == {}
+    assert deferred["outputs"] == {"b": {"\\\\DEAD\\S"}}
@@ -0,0 +1,40 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# seconds a fresh interpreter may take to import main and run on an empty inputs folder
+NO_OP_BUDGET = 1.0
+
+
+def test_no_op_run_stays_within_budget_without_pandas(tmp_path):
+    code = (
+        "import json, sys, time\n"
+        "start = time.perf_counter()\n"
+        "import main\n"
+        "from file_index import PatternMatcher, build_rules\n"
+        "configs = main.load_configs()\n"
+        "matcher = PatternMatcher(build_rules(configs['inputs'], configs['outputs'], configs['shs'], "
+        "configs['epic_shs']))\n"
+        "did_work = main.run(sys.argv[1], configs, matcher)\n"
+        "print(json.dumps({'seconds': time.perf_counter() - start, 'did_work': did_work,\n"
+        "                  'pandas': 'pandas' in sys.modules, 'numpy': 'numpy' in sys.modules}))\n"
+    )
+    # run from a copy of json_data, so the config cache and ledger folder land in tmp_path, not the checkout
+    workdir = tmp_path / "work"
+    shutil.copytree(os.path.join(REPO, "json_data"), workdir / "json_data")
+    inputs_dir = tmp_path / "inputs"
+    inputs_dir.mkdir()
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [REPO, os.environ.get("PYTHONPATH")]))}
+    # the first run compiles and caches the configs, the second is what the scheduler sees every time
+    for _ in range(2):
+        result = subprocess.run([sys.executable, "-c", code, str(inputs_dir)], cwd=workdir, env=env,
+                                capture_output=True, text=True, check=True)
+    measured = json.loads(result.stdout.strip().splitlines()[-1])
+
+    assert measured["did_work"] is False
+    assert not measured["pandas"] and not measured["numpy"]
+    assert measured["seconds"] < NO_OP_BUDGET
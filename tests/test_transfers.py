@@ -0,0 +1,84 @@
+
+import threading
+import time
+
+import pytest
+
+import transfers
+from transfers import HostLimiter, TransferExecutor, host_of, run_concurrently, tee_copy
+
+
+def test_host_of_unc_and_local_paths():
+    assert host_of("\\\\NASDATA201\\SHAREDATA\\NSHS-CENTRAL-LAB") == "NASDATA201"
+    assert host_of("//nashcn01/SHAREDATA/NewRefCenter") == "NASHCN01"
+    assert host_of("/tmp/primary") == "local"
+    assert host_of("C:\\Users\\me") == "local"
+
+
+def test_host_limiter_caps_concurrency_per_host():
+    limiter = HostLimiter(per_host=2)
+    lock = threading.Lock()
+    active = {"NASDATA201": 0, "NASHCN01": 0}
+    peak = {"NASDATA201": 0, "NASHCN01": 0}
+
+    def transfer(path):
+        host = host_of(path)
+        with limiter.slot(path):
+            with lock:
+                active[host] += 1
+                peak[host] = max(peak[host], active[host])
+            time.sleep(0.02)
+            with lock:
+                active[host] -= 1
+
+    with TransferExecutor(max_workers=8) as executor:
+        for i in range(6):
+            executor.submit(transfer, f"\\\\NASDATA201\\SHAREDATA\\{i}")
+            executor.submit(transfer, f"\\\\NASHCN01\\SHAREDATA\\{i}")
+
+    assert peak == {"NASDATA201": 2, "NASHCN01": 2}
+
+
+def test_run_concurrently_keeps_item_order():
+    assert run_concurrently(lambda x: x * 2, [3, 1, 2]) == [6, 2, 4]
+
+
+def test_executor_logs_escaped_errors_without_raising():
+    def boom():
+        raise ValueError("nope")
+
+    done = []
+    with TransferExecutor(max_workers=2) as executor:
+        executor.submit(boom)
+        executor.submit(done.append, 1)
+    assert done == [1]
+
+
+def test_tee_copy_reads_once_and_reports_failed_targets(tmp_path, monkeypatch):
+    src = tmp_path / "Allscripts_01_15_25.zip"
+    src.write_bytes(b"zip" * 100_000)
+    monkeypatch.setattr(transfers, "TEE_BUFFER_SIZE", 4096)
+    # force the streamed path even where copy_file_range is available
+    monkeypatch.setattr(transfers, "_copy_range", lambda *args: False)
+
+    targets = [str(tmp_path / "a.zip"), str(tmp_path / "b.zip"), str(tmp_path / "missing" / "c.zip")]
+    read, failures = tee_copy(str(src), targets)
+
+    assert read == src.stat().st_size
+    assert (tmp_path / "a.zip").read_bytes() == src.read_bytes()
+    assert (tmp_path / "b.zip").read_bytes() == src.read_bytes()
+    assert list(failures) == [targets[2]]
+
+
+def test_tee_copy_to_the_same_filesystem(tmp_path):
+    src = tmp_path / "src.bin"
+    src.write_bytes(b"x" * 10_000)
+
+    read, failures = tee_copy(str(src), [str(tmp_path / "copy.bin")])
+
+    assert failures == {}
+    assert (tmp_path / "copy.bin").read_bytes() == src.read_bytes()
+
+
+if __name__ == "__main__":
+    pytest.main(["-q"])
@@ -0,0 +1,104 @@
+
+import os
+
+import pytest
+
+import main
+from config import compile_rules
+from file_index import PatternMatcher, build_rules
+from watcher import DirectoryWatcher
+
+
+def test_watcher_reports_file_once_it_settles(tmp_path):
+    watcher = DirectoryWatcher(str(tmp_path), settle_seconds=10)
+    target = tmp_path / "Allscripts_01_02_25.zip"
+    target.write_bytes(b"partial")
+
+    assert watcher.poll(now=0) == []
+    # still being written: size changes, so the settle timer restarts
+    target.write_bytes(b"partial and more")
+    assert watcher.poll(now=5) == []
+    assert watcher.poll(now=12) == []
+    assert watcher.poll(now=16) == ["Allscripts_01_02_25.zip"]
+    # reported files are not handed out twice
+    assert watcher.poll(now=30) == []
+
+
+def test_watcher_reports_changed_file_again(tmp_path):
+    watcher = DirectoryWatcher(str(tmp_path), settle_seconds=0)
+    target = tmp_path / "GECB_ECHO_Inbound_01022025.xls"
+    target.write_bytes(b"a")
+
+    watcher.poll(now=0)
+    assert watcher.poll(now=1) == [target.name]
+
+    target.write_bytes(b"re-dropped")
+    os.utime(target, (1, 1))
+    watcher.poll(now=2)
+    assert watcher.poll(now=3) == [target.name]
+
+
+def test_watcher_ignores_lock_files_and_directories(tmp_path):
+    watcher = DirectoryWatcher(str(tmp_path), settle_seconds=0)
+    (tmp_path / "~$Outbound_01022025.xlsx").write_bytes(b"lock")
+    (tmp_path / "moved").mkdir()
+
+    watcher.poll(now=0)
+    assert watcher.poll(now=1) == []
+
+
+def test_watcher_offers_a_file_left_behind_again_after_the_retry_time(tmp_path):
+    watcher = DirectoryWatcher(str(tmp_path), settle_seconds=0, retry_seconds=30)
+    target = tmp_path / "GECB_ECHO_Inbound_01022025.xls"
+    target.write_bytes(b"a")
+
+    watcher.poll(now=0)
+    assert watcher.poll(now=1) == [target.name]
+    assert watcher.poll(now=20) == []
+    assert watcher.poll(now=31) == [target.name]
+    assert watcher.size(target.name) == 1
+
+
+class _Stop(BaseException):
+    pass
+
+
+def test_watch_moves_a_deferred_file_once_its_share_is_back(tmp_path, monkeypatch):
+    inputs_dir = tmp_path / "inputs"
+    inputs_dir.mkdir()
+    (inputs_dir / "ECHO_1.xls").write_text("1")
+    destination = tmp_path / "echo"
+    configs = {"inputs": {"echo": {"inputs": {"name": "ECHO_*.xls", "destination": str(destination)}}},
+               "outputs": {}, "shs": {}, "epic_shs": {}}
+    configs["rules"] = compile_rules(configs)
+    matcher = PatternMatcher(build_rules(configs["rules"].inputs))
+
+    # the share is down for the first run, back for the next ones
+    share_down = [True]
+    runs = []
+
+    def defer_unhealthy(configs):
+        runs.append(share_down[0])
+        return {"inputs": {"echo": {"\\\\HOST\\SHARE"}}} if share_down[0] else {}
+
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        if runs:
+            share_down[0] = False
+        if not (inputs_dir / "ECHO_1.xls").exists() or len(sleeps) > 10:
+            raise _Stop()
+
+    monkeypatch.setattr(main, "_defer_unhealthy", defer_unhealthy)
+    monkeypatch.setattr(main, "check_drives", lambda: None)
+    monkeypatch.setattr(main.time, "sleep", sleep)
+    with pytest.raises(_Stop):
+        main.watch(str(inputs_dir), configs, matcher, poll_interval=0, settle_seconds=0, retry_seconds=0)
+
+    assert runs == [True, False]
+    assert (destination / "ECHO_1.xls").read_text() == "1"
+
+
+if __name__ == "__main__":
+    pytest.main(["-q"])
@@ -0,0 +1,220 @@
+import os
+import shutil
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from loguru import logger
+
+import profiling
+
+
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_PER_HOST = 4
+
+# bytes per read when one source is streamed to several destinations
+TEE_BUFFER_SIZE = 1024 * 1024
+
+LOCAL_HOST = "local"
+
+
+def host_of(path: str) -> str:
+    """Return the server a path lives on (NASDATA201 for \\\\NASDATA201\\SHAREDATA\\...).
+
+    Anything that is not a UNC path is grouped under a single "local" host.
+    """
+    path = str(path)
+    if path[:2] in ("\\\\", "//"):
+        host = path[2:].replace("/", "\\").split("\\", 1)[0]
+        if host:
+            return host.upper()
+    return LOCAL_HOST
+
+
+class HostLimiter:
+    """Caps the number of concurrent transfers against each host."""
+
+    def __init__(self, per_host: int = DEFAULT_PER_HOST):
+        self.per_host = per_host
+        self._lock = threading.Lock()
+        self._semaphores: Dict[str, threading.BoundedSemaphore] = {}
+
+    def _semaphore(self, host: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            semaphore = self._semaphores.get(host)
+            if semaphore is None:
+                semaphore = threading.BoundedSemaphore(self.per_host)
+                self._semaphores[host] = semaphore
+            return semaphore
+
+    @contextmanager
+    def slot(self, path: str):
+        semaphore = self._semaphore(host_of(path))
+        with semaphore:
+            yield
+
+    @contextmanager
+    def slots(self, paths: Iterable[str]):
+        """One slot on every host the paths live on, taken in host order so two
+        multi-host transfers can never wait on each other."""
+        with ExitStack() as stack:
+            for host in sorted({host_of(path) for path in paths}):
+                stack.enter_context(self._semaphore(host))
+            yield
+
+
+_settings = {"max_workers": DEFAULT_MAX_WORKERS}
+_limiter = HostLimiter(DEFAULT_PER_HOST)
+
+
+def configure(max_workers: int = None, per_host: int = None):
+    """Change the pool size and per-host limit used by later transfers."""
+    global _limiter
+    if max_workers is not None:
+        _settings["max_workers"] = max(1, max_workers)
+    if per_host is not None:
+        _limiter = HostLimiter(max(1, per_host))
+
+
+def max_workers() -> int:
+    """The configured transfer pool size."""
+    return _settings["max_workers"]
+
+
+def host_slot(path: str):
+    """Hold one of the destination host's transfer slots for the duration of the block.
+
+    Only wrap the single filesystem call in it; holding a slot while waiting on
+    other transfers could starve the pool.
+    """
+    return _limiter.slot(path)
+
+
+def host_slots(paths: Iterable[str]):
+    """host_slot for a transfer that touches several hosts at once (see tee_copy)."""
+    return _limiter.slots(paths)
+
+
+def _copy_range(src_fd: int, dst_fd: int, size: int) -> bool:
+    """Copy src to dst inside the kernel (or on the file server); False if not possible."""
+    if not hasattr(os, "copy_file_range"):
+        return False
+    offset = 0
+    try:
+        while offset < size:
+            copied = os.copy_file_range(src_fd, dst_fd, size - offset, offset, offset)
+            if copied == 0:
+                break
+            offset += copied
+    except OSError:
+        if offset:
+            raise
+        # EXDEV, ENOSYS, EINVAL...: nothing was written, stream this target instead
+        return False
+    return True
+
+
+def tee_copy(src: str, targets: List[str], hasher=None) -> Tuple[int, Dict[str, Exception]]:
+    """Copy src to every target while reading it only once.
+
+    Targets on the same filesystem as src are copied with copy_file_range, so
+    the bytes never pass through this process. Every other target is fed from
+    one shared read loop. A target that fails to open or write is dropped and
+    reported, without stopping the others; a read error on src is raised.
+    Metadata is copied like shutil.copy2 does.
+
+    A hasher (hashlib object) is fed every chunk of src; when it is given, src
+    is read to the end even if no target needed the bytes.
+
+    Returns the bytes read from src and the failures by target.
+    """
+    failures: Dict[str, Exception] = {}
+    read = 0
+    with profiling.span(profiling.COPY, src), ExitStack() as stack:
+        fsrc = stack.enter_context(open(src, "rb"))
+        src_stat = os.fstat(fsrc.fileno())
+        streamed = []
+        for target in targets:
+            try:
+                fdst = stack.enter_context(open(target, "wb"))
+                if (os.fstat(fdst.fileno()).st_dev != src_stat.st_dev
+                        or not _copy_range(fsrc.fileno(), fdst.fileno(), src_stat.st_size)):
+                    streamed.append((target, fdst))
+            except OSError as e:
+                failures[target] = e
+
+        while streamed or hasher is not None:
+            chunk = fsrc.read(TEE_BUFFER_SIZE)
+            if not chunk:
+                break
+            read += len(chunk)
+            if hasher is not None:
+                hasher.update(chunk)
+            for target, fdst in list(streamed):
+                try:
+                    fdst.write(chunk)
+                except OSError as e:
+                    failures[target] = e
+                    streamed.remove((target, fdst))
+
+    for target in targets:
+        if target not in failures:
+            try:
+                shutil.copystat(src, target)
+            except OSError:
+                # timestamps are best-effort on network shares
+                pass
+    return read, failures
+
+
+class TransferExecutor:
+    """Thread pool for running independent transfers side by side.
+
+    Jobs are expected to do their own logging and error handling, the same way
+    move_single_file does; anything that still escapes is logged as critical
+    when the executor is closed so one failed job never hides the others.
+    """
+
+    def __init__(self, max_workers: int = None):
+        self.max_workers = max_workers or _settings["max_workers"]
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="transfer")
+        self._jobs: List[tuple] = []
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        future = self._pool.submit(fn, *args, **kwargs)
+        self._jobs.append((future, getattr(fn, "__name__", str(fn)), args))
+        return future
+
+    def wait(self):
+        for future, name, args in self._jobs:
+            try:
+                future.result()
+            except Exception as e:
+                logger.critical(f"Error: {e} in {name}{args}")
+        self._jobs = []
+
+    def close(self):
+        self.wait()
+        self._pool.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def run_concurrently(fn: Callable, items: Iterable) -> list:
+    """Call fn on every item, in parallel when there is more than one.
+
+    Results are returned in item order. Used for fan-out work such as copying
+    one file to several archive destinations.
+    """
+    items = list(items)
+    if len(items) <= 1:
+        return [fn(item) for item in items]
+    with ThreadPoolExecutor(max_workers=min(len(items), _settings["max_workers"]),
+                            thread_name_prefix="fanout") as pool:
+        return list(pool.map(fn, items))
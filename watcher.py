@@ -0,0 +1,88 @@
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+from loguru import logger
+
+
+Signature = Tuple[int, float]
+
+# a reported file that is still in the directory after this long is reported again
+DEFAULT_RETRY_SECONDS = 60.0
+
+
+class DirectoryWatcher:
+    """Polls a directory with os.scandir and reports files once they settle.
+
+    A file is considered settled when its size and mtime have not changed for
+    `settle_seconds`, which keeps half-written files (a zip still being copied
+    onto the share) out of the pipeline. Each settled file is reported once; it
+    is reported again if it changes while still sitting in the directory (a
+    re-dropped file), or if it is still there `retry_seconds` after it was
+    reported: its use case was deferred because its share was down, its
+    transfer failed, or another worker held its lease.
+    """
+
+    def __init__(self, directory: str, settle_seconds: float = 10.0, retry_seconds: float = DEFAULT_RETRY_SECONDS):
+        self.directory = directory
+        self.settle_seconds = settle_seconds
+        self.retry_seconds = retry_seconds
+        # name -> (signature, time the signature was first seen)
+        self._pending: Dict[str, Tuple[Signature, float]] = {}
+        # name -> (signature it had when it was reported, time it was reported)
+        self._reported: Dict[str, Tuple[Signature, float]] = {}
+
+    def snapshot(self) -> Dict[str, Signature]:
+        files = {}
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if "~" in entry.name or entry.name.startswith("."):
+                    continue
+                try:
+                    if not entry.is_file():
+                        continue
+                    stat = entry.stat()
+                except OSError:
+                    # removed between listing and stat
+                    continue
+                files[entry.name] = (stat.st_size, stat.st_mtime)
+        return files
+
+    def size(self, name: str) -> int:
+        """Size a settled file had when it was reported."""
+        return self._reported.get(name, ((0, 0.0), 0.0))[0][0]
+
+    def poll(self, now: Optional[float] = None) -> List[str]:
+        """Take a snapshot and return the names of newly settled files."""
+        now = time.monotonic() if now is None else now
+        current = self.snapshot()
+
+        for name in list(self._pending):
+            if name not in current:
+                del self._pending[name]
+        for name in list(self._reported):
+            if name not in current:
+                del self._reported[name]
+
+        settled = []
+        for name, signature in current.items():
+            reported = self._reported.get(name)
+            if reported is not None and reported[0] == signature:
+                if now - reported[1] < self.retry_seconds:
+                    continue
+                # still here: left behind by the last run, offer it again
+                self._reported[name] = (signature, now)
+                settled.append(name)
+                continue
+            pending = self._pending.get(name)
+            if pending is None or pending[0] != signature:
+                self._pending[name] = (signature, now)
+                continue
+            if now - pending[1] >= self.settle_seconds:
+                del self._pending[name]
+                self._reported[name] = (signature, now)
+                settled.append(name)
+
+        if settled:
+            logger.debug(f"{len(settled)} files settled in {self.directory}")
+        return settled